@@ -0,0 +1,120 @@
+"""Streaming parsers and encoders for bulk todo import and export.
+
+Request bodies are parsed chunk by chunk into rows (NDJSON objects or CSV
+records keyed by the header row) and grouped into batches, so an import
+holds at most one batch and one partial line in memory regardless of the
+body size. Exports are encoded one document at a time as NDJSON.
+"""
+import csv
+import json
+from datetime import datetime
+from typing import AsyncIterator, Dict, List, Tuple, Union
+
+# Longest line (or quoted multi-line CSV record) accepted in an import
+MAX_LINE_BYTES = 1024 * 1024
+
+NDJSON = "ndjson"
+CSV = "csv"
+
+
+class ImportFormatError(ValueError):
+    pass
+
+
+def import_format(content_type: str) -> str:
+    content_type = content_type.split(";")[0].strip().lower()
+    if content_type in ("text/csv", "application/csv"):
+        return CSV
+    if content_type in ("application/x-ndjson", "application/ndjson", "application/jsonl", "application/json", ""):
+        return NDJSON
+    raise ImportFormatError(f"Unsupported import content type: {content_type}")
+
+
+def _decode_line(line: bytes, line_number: int) -> Union[str, ImportFormatError]:
+    try:
+        return line.rstrip(b"\r").decode("utf-8-sig" if line_number == 1 else "utf-8")
+    except UnicodeDecodeError as e:
+        return ImportFormatError(f"Invalid UTF-8 at byte {e.start}")
+
+
+async def iter_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[Tuple[int, Union[str, ImportFormatError]]]:
+    """Split a byte stream into (line number, decoded line); undecodable lines come as an ImportFormatError"""
+    pending = b""
+    line_number = 0
+    async for chunk in chunks:
+        pending += chunk
+        *lines, pending = pending.split(b"\n")
+        for line in lines:
+            line_number += 1
+            yield line_number, _decode_line(line, line_number)
+        if len(pending) > MAX_LINE_BYTES:
+            raise ImportFormatError(f"Line {line_number + 1} is longer than {MAX_LINE_BYTES} bytes")
+    if pending:
+        yield line_number + 1, _decode_line(pending, line_number + 1)
+
+
+async def parse_ndjson(chunks: AsyncIterator[bytes]) -> AsyncIterator[Tuple[int, object]]:
+    async for line_number, line in iter_lines(chunks):
+        if isinstance(line, ImportFormatError):
+            yield line_number, line
+            continue
+        if not line.strip():
+            continue
+        try:
+            yield line_number, json.loads(line)
+        except ValueError as e:
+            yield line_number, ImportFormatError(f"Invalid JSON: {e}")
+
+
+async def parse_csv(chunks: AsyncIterator[bytes]) -> AsyncIterator[Tuple[int, object]]:
+    """CSV with a header row; quoted fields may span lines. Empty cells are omitted."""
+    header = None
+    record: List[str] = []
+    record_start = 0
+    async for line_number, line in iter_lines(chunks):
+        if isinstance(line, ImportFormatError):
+            # Record boundaries depend on quotes, so the rest can't be split reliably
+            raise ImportFormatError(f"Line {line_number}: {line}")
+        if not record:
+            record_start = line_number
+        record.append(line)
+        text = "\n".join(record)
+        if text.count('"') % 2:
+            # Inside a quoted field that continues on the next line
+            if len(text) > MAX_LINE_BYTES:
+                raise ImportFormatError(f"Record at line {record_start} is longer than {MAX_LINE_BYTES} bytes")
+            continue
+        record = []
+        if not text.strip():
+            continue
+        values = next(csv.reader([text]))
+        if header is None:
+            header = [name.strip() for name in values]
+            continue
+        if len(values) != len(header):
+            yield record_start, ImportFormatError(f"Expected {len(header)} columns, got {len(values)}")
+            continue
+        yield record_start, {name: value for name, value in zip(header, values) if value != ""}
+    if record:
+        yield record_start, ImportFormatError("Unterminated quoted field")
+
+
+async def batched(rows: AsyncIterator, size: int) -> AsyncIterator[list]:
+    batch = []
+    async for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _encode_value(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def ndjson_line(document: Dict) -> bytes:
+    return (json.dumps(document, default=_encode_value, separators=(",", ":")) + "\n").encode("utf-8")
@@ -0,0 +1,210 @@
+"""Response compression and binary content negotiation.
+
+``CompressionMiddleware`` compresses response bodies above a size threshold
+with brotli (when the optional ``brotli`` package is installed) or gzip,
+depending on the client's ``Accept-Encoding``. ``negotiate`` lets an
+endpoint answer with MessagePack instead of JSON when the client asks for it
+via ``Accept`` and the optional ``msgpack`` package is available.
+"""
+import gzip
+import zlib
+from typing import Any, Optional
+
+from fastapi import Request
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, Response
+from starlette.datastructures import Headers, MutableHeaders
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - optional dependency
+    brotli = None
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover - optional dependency
+    msgpack = None
+
+MSGPACK_MEDIA_TYPES = ("application/msgpack", "application/x-msgpack")
+
+# Media types that are already compressed or not worth compressing
+INCOMPRESSIBLE_PREFIXES = ("image/", "video/", "audio/", "application/zip", "application/gzip")
+
+
+def parse_qvalues(header: str) -> dict:
+    """Parse an Accept / Accept-Encoding header into {token: q}.
+
+    Tokens and parameter names are case-insensitive; tokens come back lowercased.
+    """
+    values = {}
+    for part in header.split(","):
+        token, _, params = part.strip().partition(";")
+        token = token.strip().lower()
+        if not token:
+            continue
+        q = 1.0
+        for param in params.split(";"):
+            name, _, value = param.strip().partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        values[token] = q
+    return values
+
+
+def choose_encoding(accept_encoding: str) -> Optional[str]:
+    """Pick the best supported content coding for an Accept-Encoding header"""
+    accepted = parse_qvalues(accept_encoding)
+    candidates = ["br", "gzip"] if brotli is not None else ["gzip"]
+    wildcard = accepted.get("*", 0.0)
+    best, best_q = None, 0.0
+    for encoding in candidates:
+        q = accepted.get(encoding, wildcard)
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+def wants_msgpack(request: Request) -> bool:
+    """Whether the client prefers MessagePack over JSON"""
+    if msgpack is None:
+        return False
+    accepted = parse_qvalues(request.headers.get("accept", ""))
+    msgpack_q = max(accepted.get(media_type, 0.0) for media_type in MSGPACK_MEDIA_TYPES)
+    return msgpack_q > 0 and msgpack_q >= accepted.get("application/json", 0.0)
+
+
+def negotiate(request: Request, content: Any, status_code: int = 200) -> Response:
+    """Render content as MessagePack or JSON depending on the Accept header"""
+    data = jsonable_encoder(content)
+    if wants_msgpack(request):
+        return Response(
+            content=msgpack.packb(data, use_bin_type=True),
+            status_code=status_code,
+            media_type=MSGPACK_MEDIA_TYPES[0],
+            headers={"Vary": "Accept"},
+        )
+    return JSONResponse(content=data, status_code=status_code, headers={"Vary": "Accept"})
+
+
+class _Compressor:
+    """Incremental compressor for a single response body"""
+
+    def __init__(self, encoding: str, level: int):
+        self.encoding = encoding
+        if encoding == "br":
+            self._compressor = brotli.Compressor(quality=level)
+        else:
+            # wbits=31 produces a gzip container
+            self._compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes) -> bytes:
+        if self.encoding == "br":
+            return self._compressor.process(data)
+        return self._compressor.compress(data)
+
+    def flush(self) -> bytes:
+        if self.encoding == "br":
+            return self._compressor.finish()
+        return self._compressor.flush()
+
+
+def compress_body(body: bytes, encoding: str, level: int) -> bytes:
+    """Compress a complete body in one call"""
+    if encoding == "br":
+        return brotli.compress(body, quality=level)
+    return gzip.compress(body, compresslevel=level, mtime=0)
+
+
+class CompressionMiddleware:
+    """ASGI middleware compressing responses larger than ``minimum_size`` bytes.
+
+    Small responses are passed through uncompressed since compression would
+    cost more CPU than it saves on the wire; like every other response they
+    still carry ``Vary: Accept-Encoding``. Streaming responses are compressed
+    incrementally without buffering the whole body.
+    """
+
+    def __init__(self, app, minimum_size: int = 1024, gzip_level: int = 6, brotli_quality: int = 4):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.levels = {"gzip": gzip_level, "br": brotli_quality}
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        encoding = choose_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        responder = _CompressionResponder(send, encoding, self.levels.get(encoding), self.minimum_size)
+        await self.app(scope, receive, responder)
+
+
+class _CompressionResponder:
+    def __init__(self, send, encoding: Optional[str], level: Optional[int], minimum_size: int):
+        self.send = send
+        self.encoding = encoding
+        self.level = level
+        self.minimum_size = minimum_size
+        self.start_message = None
+        self.compressor: Optional[_Compressor] = None
+        self.passthrough = False
+
+    async def __call__(self, message):
+        message_type = message["type"]
+        if message_type == "http.response.start":
+            # Every response varies by Accept-Encoding, compressed or not, so a
+            # cache never hands an identity body to a gzip client or the reverse
+            MutableHeaders(scope=message).add_vary_header("Accept-Encoding")
+            if self.encoding is None:
+                await self.send(message)
+                return
+            # Defer sending headers until we know the body size
+            self.start_message = message
+            return
+        if message_type != "http.response.body" or self.start_message is None:
+            await self.send(message)
+            return
+
+        if self.passthrough:
+            await self.send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+
+        if self.compressor is None:
+            headers = MutableHeaders(raw=self.start_message["headers"])
+            content_type = headers.get("content-type", "")
+            skip = (
+                "content-encoding" in headers
+                or content_type.startswith(INCOMPRESSIBLE_PREFIXES)
+                or (not more_body and len(body) < self.minimum_size)
+            )
+            if skip:
+                self.passthrough = True
+                await self.send(self.start_message)
+                await self.send(message)
+                return
+
+            headers["Content-Encoding"] = self.encoding
+            if not more_body:
+                compressed = compress_body(body, self.encoding, self.level)
+                headers["Content-Length"] = str(len(compressed))
+                await self.send(self.start_message)
+                await self.send({"type": "http.response.body", "body": compressed})
+                return
+
+            # Streaming response: length is unknown up front
+            if "content-length" in headers:
+                del headers["Content-Length"]
+            self.compressor = _Compressor(self.encoding, self.level)
+            await self.send(self.start_message)
+
+        chunk = self.compressor.compress(body)
+        if not more_body:
+            chunk += self.compressor.flush()
+        if chunk or not more_body:
+            await self.send({"type": "http.response.body", "body": chunk, "more_body": more_body})
@@ -0,0 +1,101 @@
+"""Append-only ledger of every change to ``game_stats``.
+
+Each write to a stats document also appends an event to the document's own
+``ledger_outbox`` array in the same update, so the event can't be lost or
+recorded for a write that didn't happen, without needing a transaction.
+Events are fully resolved: they carry the deltas and the values set, never
+the expressions that produced them::
+
+    {"id": ..., "type": "award", "at": datetime,
+     "inc": {"coins": 50, "total_todos_completed": 1, "current_streak": 1, "version": 1},
+     "set": {"level": 2, "best_streak": 4, "last_activity": datetime}}
+
+A flush moves outbox events, in order, into the ``reward_ledger``
+collection, numbering them per user with ``seq`` (``ledger_flushed`` counts
+the events already moved). Snapshots copy the stats together with the
+number of events they include, so a replay starts from the latest snapshot
+and applies only the ledger tail after it and whatever is still in the
+outbox.
+"""
+import uuid
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional
+
+OUTBOX = "ledger_outbox"
+FLUSHED = "ledger_flushed"
+
+
+def event(kind: str, at: datetime, inc: Optional[Dict[str, Any]] = None, assign: Optional[Dict[str, Any]] = None, **details) -> Dict[str, Any]:
+    """A ledger event; every event bumps the stats version and last activity"""
+    return {
+        "id": str(uuid.uuid4()),
+        "type": kind,
+        "at": at,
+        "inc": {**(inc or {}), "version": 1},
+        "set": {**(assign or {}), "last_activity": at},
+        **details,
+    }
+
+
+def pipeline_append(entry: Dict[str, Any]) -> Dict[str, Any]:
+    """Outbox value for an aggregation pipeline update; expressions in ``entry`` are evaluated"""
+    return {"$concatArrays": [{"$ifNull": [f"${OUTBOX}", []]}, [entry]]}
+
+
+def events_included(document: Dict[str, Any]) -> int:
+    """How many events a stats document reflects: flushed plus still in the outbox"""
+    return document.get(FLUSHED, 0) + len(document.get(OUTBOX, []))
+
+
+def ledger_entries(user_id: str, document: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """The outbox of a stats document as numbered ledger entries"""
+    flushed = document.get(FLUSHED, 0)
+    return [
+        {"user_id": user_id, "seq": flushed + position, **entry}
+        for position, entry in enumerate(document.get(OUTBOX, []), start=1)
+    ]
+
+
+class LedgerGapError(RuntimeError):
+    """Ledger entries a replay needs are missing"""
+
+
+def tail_range(document: Optional[Dict[str, Any]], snapshot: Optional[Dict[str, Any]]) -> tuple:
+    """Sequence numbers ``(after, until]`` to read from the ledger for a replay"""
+    after = snapshot["seq"] if snapshot else 0
+    return after, max(after, document.get(FLUSHED, 0) if document else 0)
+
+
+def rebuild(
+    user_id: str,
+    document: Optional[Dict[str, Any]],
+    snapshot: Optional[Dict[str, Any]],
+    tail: List[Dict[str, Any]],
+    defaults: Dict[str, Any]
+) -> Dict[str, Any]:
+    """Replay a snapshot (or ``defaults``), the ledger tail and the outbox.
+
+    ``document`` is the stats document read before the snapshot and tail,
+    ``snapshot`` the latest one with ``seq <= events_included(document)``.
+    """
+    after, until = tail_range(document, snapshot)
+    if [entry["seq"] for entry in tail] != list(range(after + 1, until + 1)):
+        raise LedgerGapError(f"Ledger for {user_id} is not contiguous over seq {after + 1}..{until}")
+    outbox = [entry for entry in ledger_entries(user_id, document or {}) if entry["seq"] > after]
+    return replay(snapshot["stats"] if snapshot else defaults, [*tail, *outbox])
+
+
+def apply_event(stats: Dict[str, Any], entry: Dict[str, Any]) -> Dict[str, Any]:
+    stats = dict(stats)
+    for field, delta in entry.get("inc", {}).items():
+        stats[field] = stats.get(field, 0) + delta
+    stats.update(entry.get("set", {}))
+    return stats
+
+
+def replay(snapshot: Dict[str, Any], entries: Iterable[Dict[str, Any]]) -> Dict[str, Any]:
+    """Stats after applying ``entries`` (ordered by seq) to a snapshot's stats"""
+    stats = dict(snapshot)
+    for entry in entries:
+        stats = apply_event(stats, entry)
+    return stats
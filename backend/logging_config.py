@@ -0,0 +1,164 @@
+"""Non-blocking structured JSON logging.
+
+Records are handed to a ``QueueHandler`` on the calling thread and written
+by a ``QueueListener`` on a background thread, so log I/O never blocks the
+event loop. ``RequestLogMiddleware`` keeps per-request context (request id,
+route, DB round trips) in a ContextVar that ``RequestContextFilter`` stamps
+onto every record, and emits one access log line per request, sampled per
+route via ``LOG_SAMPLE_RATES`` (e.g. ``/api/game/auto-mine=0.01``).
+"""
+import logging
+import queue
+import random
+import sys
+import time
+import uuid
+from contextvars import ContextVar
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, Optional
+
+from pymongo import monitoring
+from pythonjsonlogger import jsonlogger
+
+access_logger = logging.getLogger("access")
+
+
+class RequestContext:
+    def __init__(self, method: str, path: str):
+        self.request_id = uuid.uuid4().hex[:12]
+        self.method = method
+        self.path = path
+        self.route: Optional[str] = None
+        self.db_round_trips = 0
+
+
+request_context: ContextVar[Optional[RequestContext]] = ContextVar("request_context", default=None)
+
+
+class RequestContextFilter(logging.Filter):
+    """Adds the current request's id and route to every log record"""
+
+    def filter(self, record):
+        context = request_context.get()
+        if context is not None:
+            record.request_id = context.request_id
+            record.route = context.route or context.path
+        return True
+
+
+class RoundTripCounter(monitoring.CommandListener):
+    """Counts Mongo commands issued on behalf of the current request"""
+
+    def started(self, event):
+        context = request_context.get()
+        if context is not None:
+            context.db_round_trips += 1
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+
+def parse_sample_rates(spec: str) -> Dict[str, float]:
+    """Parse ``route=rate,route=rate`` into a dict"""
+    rates = {}
+    for item in spec.split(","):
+        route, _, rate = item.strip().partition("=")
+        if route and rate:
+            rates[route.strip()] = float(rate)
+    return rates
+
+
+_listener: Optional[QueueListener] = None
+_queue_handler: Optional[QueueHandler] = None
+
+
+def configure_logging(level: str = "INFO"):
+    """Route all logging through a queue to a JSON stdout handler thread"""
+    global _listener, _queue_handler
+    if _listener is not None:
+        return
+
+    stream_handler = logging.StreamHandler(sys.stdout)
+    stream_handler.setFormatter(
+        jsonlogger.JsonFormatter(
+            "%(asctime)s %(name)s %(levelname)s %(message)s",
+            rename_fields={"asctime": "timestamp", "levelname": "level"},
+        )
+    )
+
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    _queue_handler = QueueHandler(log_queue)
+    _queue_handler.addFilter(RequestContextFilter())
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(_queue_handler)
+    root.setLevel(level)
+
+    _listener = QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    _listener.start()
+
+
+def shutdown_logging():
+    """Flush queued records and stop the writer thread.
+
+    Later records are written synchronously by the same stdout handler
+    until ``configure_logging`` runs again.
+    """
+    global _listener, _queue_handler
+    if _listener is not None:
+        _listener.stop()
+        root = logging.getLogger()
+        root.removeHandler(_queue_handler)
+        for handler in _listener.handlers:
+            handler.addFilter(RequestContextFilter())
+            root.addHandler(handler)
+        _listener = _queue_handler = None
+
+
+class RequestLogMiddleware:
+    def __init__(self, app, sample_rates: Optional[Dict[str, float]] = None):
+        self.app = app
+        self.sample_rates = sample_rates or {}
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        context = RequestContext(scope["method"], scope["path"])
+        token = request_context.set(context)
+        status_code = 500
+
+        async def send_with_status(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            route = scope.get("route")
+            context.route = getattr(route, "path", None) or context.path
+            duration_ms = (time.perf_counter() - started) * 1000
+            if status_code >= 500 or random.random() < self.sample_rates.get(context.route, 1.0):
+                access_logger.info(
+                    "%s %s %d",
+                    context.method,
+                    context.route,
+                    status_code,
+                    extra={
+                        "method": context.method,
+                        "path": context.path,
+                        "status": status_code,
+                        "duration_ms": round(duration_ms, 2),
+                        "db_round_trips": context.db_round_trips,
+                    },
+                )
+            request_context.reset(token)
@@ -0,0 +1,107 @@
+"""Connection pool utilization metrics for sizing the Motor pool.
+
+``PoolMetrics`` is a pymongo connection pool listener. It keeps, per server,
+the number of open and checked-out connections, the peak checked-out count,
+checkout failures and a running checkout wait time, and is served from
+``/api/metrics/pool``. If ``in_use`` peaks at ``max_pool_size`` and checkout
+waits grow, the pool is too small; if ``peak_in_use`` stays far below
+``open`` the minimum pool size can come down.
+"""
+import threading
+import time
+from typing import Dict, Optional
+
+from pymongo import monitoring
+
+
+class ServerPoolStats:
+    def __init__(self):
+        self.open = 0
+        self.in_use = 0
+        self.peak_in_use = 0
+        self.checkouts = 0
+        self.checkout_failures = 0
+        self.checkout_wait_seconds = 0.0
+        self.max_checkout_wait_seconds = 0.0
+        self.cleared = 0
+
+    def as_dict(self) -> dict:
+        return {
+            "open": self.open,
+            "in_use": self.in_use,
+            "peak_in_use": self.peak_in_use,
+            "checkouts": self.checkouts,
+            "checkout_failures": self.checkout_failures,
+            "avg_checkout_wait_ms": round(self.checkout_wait_seconds / self.checkouts * 1000, 3) if self.checkouts else 0.0,
+            "max_checkout_wait_ms": round(self.max_checkout_wait_seconds * 1000, 3),
+            "cleared": self.cleared,
+        }
+
+
+class PoolMetrics(monitoring.ConnectionPoolListener):
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._servers: Dict[str, ServerPoolStats] = {}
+        # Checkout start times keyed by (server, thread), since one thread
+        # checks out at most one connection at a time per server
+        self._waiting: Dict[tuple, float] = {}
+
+    def _stats(self, address) -> ServerPoolStats:
+        key = f"{address[0]}:{address[1]}"
+        if key not in self._servers:
+            self._servers[key] = ServerPoolStats()
+        return self._servers[key]
+
+    def snapshot(self, max_pool_size: Optional[int] = None) -> dict:
+        with self._lock:
+            servers = {address: stats.as_dict() for address, stats in self._servers.items()}
+        return {"max_pool_size": max_pool_size, "servers": servers}
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        with self._lock:
+            self._stats(event.address).cleared += 1
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        with self._lock:
+            self._stats(event.address).open += 1
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        with self._lock:
+            self._stats(event.address).open -= 1
+
+    def connection_check_out_started(self, event):
+        with self._lock:
+            self._waiting[(event.address, threading.get_ident())] = time.perf_counter()
+
+    def connection_check_out_failed(self, event):
+        with self._lock:
+            self._waiting.pop((event.address, threading.get_ident()), None)
+            self._stats(event.address).checkout_failures += 1
+
+    def connection_checked_out(self, event):
+        with self._lock:
+            started = self._waiting.pop((event.address, threading.get_ident()), None)
+            stats = self._stats(event.address)
+            stats.checkouts += 1
+            stats.in_use += 1
+            stats.peak_in_use = max(stats.peak_in_use, stats.in_use)
+            if started is not None:
+                waited = time.perf_counter() - started
+                stats.checkout_wait_seconds += waited
+                stats.max_checkout_wait_seconds = max(stats.max_checkout_wait_seconds, waited)
+
+    def connection_checked_in(self, event):
+        with self._lock:
+            self._stats(event.address).in_use -= 1
@@ -0,0 +1,201 @@
+"""On-demand request profiling.
+
+``ProfilingMiddleware`` profiles a request when it carries the secret
+``X-Profile`` header or is picked by the sampling rate. While the request
+runs, a background thread samples the Python stack of the event loop thread
+and a pymongo command listener times every database command issued from the
+request's context. Both end up in ``PROFILE_DIR``:
+
+* ``<id>.folded`` - collapsed stacks, one ``frame;frame;frame count`` line per
+  unique stack, ready for ``flamegraph.pl`` or speedscope
+* ``<id>.json`` - wall time, sample count and the Mongo time breakdown
+
+The sampler sees the whole event loop thread, not just the profiled
+request's task: Python gives no cheap way to tell which task a frame belongs
+to, and the request's own work fans out into child tasks anyway. Whatever
+else the loop runs meanwhile - other requests, background jobs - shows up in
+the folded stacks. ``concurrent_requests`` in the JSON records the most
+requests that were in flight alongside the profiled one, so a noisy profile
+can be told apart from a slow request; profile on a quiet worker, or with
+the secret header against a single request, for a clean flame graph.
+
+The middleware is only installed when profiling is configured, and the
+command listener returns immediately outside a profiled request, so the
+disabled cost is a ContextVar lookup per Mongo command.
+"""
+import asyncio
+import hmac
+import json
+import logging
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Optional
+
+from pymongo import monitoring
+from starlette.datastructures import Headers, MutableHeaders
+
+logger = logging.getLogger(__name__)
+
+PROFILE_HEADER = "x-profile"
+
+
+class RequestProfile:
+    def __init__(self, method: str, path: str):
+        self.id = f"{int(time.time())}-{uuid.uuid4().hex[:8]}"
+        self.method = method
+        self.path = path
+        self.stacks: Counter = Counter()
+        self.mongo_commands: dict = {}
+        self.concurrent_requests = 0
+        self._lock = threading.Lock()
+
+    def command_finished(self, command_name: str, duration: float, failed: bool):
+        with self._lock:
+            entry = self.mongo_commands.setdefault(command_name, {"count": 0, "seconds": 0.0, "failures": 0})
+            entry["count"] += 1
+            entry["seconds"] += duration
+            if failed:
+                entry["failures"] += 1
+
+    @property
+    def mongo_seconds(self) -> float:
+        return sum(entry["seconds"] for entry in self.mongo_commands.values())
+
+
+current_profile: ContextVar[Optional[RequestProfile]] = ContextVar("current_profile", default=None)
+
+
+class MongoCommandTimer(monitoring.CommandListener):
+    """Attributes Mongo command durations to the active request profile.
+
+    Motor runs pymongo calls in executor threads with a copy of the calling
+    context, so the ContextVar set by the middleware is visible here.
+    """
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        profile = current_profile.get()
+        if profile is not None:
+            profile.command_finished(event.command_name, event.duration_micros / 1e6, False)
+
+    def failed(self, event):
+        profile = current_profile.get()
+        if profile is not None:
+            profile.command_finished(event.command_name, event.duration_micros / 1e6, True)
+
+
+def fold_stack(frame) -> str:
+    """Render a frame chain root-first in collapsed-stack notation"""
+    parts = []
+    while frame is not None:
+        code = frame.f_code
+        parts.append(f"{code.co_name} ({Path(code.co_filename).name}:{frame.f_lineno})")
+        frame = frame.f_back
+    return ";".join(reversed(parts))
+
+
+class StackSampler(threading.Thread):
+    """Samples one thread's Python stack at a fixed interval"""
+
+    def __init__(self, target_thread_id: int, profile: RequestProfile, interval: float):
+        super().__init__(name=f"profiler-{profile.id}", daemon=True)
+        self.target_thread_id = target_thread_id
+        self.profile = profile
+        self.interval = interval
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            frame = sys._current_frames().get(self.target_thread_id)
+            if frame is not None:
+                self.profile.stacks[fold_stack(frame)] += 1
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+
+class ProfilingMiddleware:
+    def __init__(self, app, output_dir: str, secret: str = "", sample_rate: float = 0.0, interval: float = 0.001):
+        self.app = app
+        self.output_dir = Path(output_dir)
+        self.secret = secret
+        self.sample_rate = sample_rate
+        self.interval = interval
+        self.in_flight = 0
+        self.active_profiles: set = set()
+
+    def should_profile(self, scope) -> bool:
+        if self.secret and hmac.compare_digest(
+            Headers(scope=scope).get(PROFILE_HEADER, "").encode(), self.secret.encode()
+        ):
+            return True
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        self.in_flight += 1
+        for profile in self.active_profiles:
+            profile.concurrent_requests = max(profile.concurrent_requests, self.in_flight - 1)
+        try:
+            if self.should_profile(scope):
+                await self.profile(scope, receive, send)
+            else:
+                await self.app(scope, receive, send)
+        finally:
+            self.in_flight -= 1
+
+    async def profile(self, scope, receive, send):
+
+        profile = RequestProfile(scope["method"], scope["path"])
+        profile.concurrent_requests = self.in_flight - 1
+        self.active_profiles.add(profile)
+        token = current_profile.set(profile)
+        sampler = StackSampler(threading.get_ident(), profile, self.interval)
+
+        async def send_with_id(message):
+            if message["type"] == "http.response.start":
+                MutableHeaders(scope=message)["X-Profile-Id"] = profile.id
+            await send(message)
+
+        started = time.perf_counter()
+        sampler.start()
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            sampler.stop()
+            self.active_profiles.discard(profile)
+            current_profile.reset(token)
+            wall = time.perf_counter() - started
+            await asyncio.get_running_loop().run_in_executor(None, self.write, profile, wall)
+
+    def write(self, profile: RequestProfile, wall_seconds: float):
+        try:
+            self.output_dir.mkdir(parents=True, exist_ok=True)
+            folded = "\n".join(f"{stack} {count}" for stack, count in profile.stacks.most_common())
+            (self.output_dir / f"{profile.id}.folded").write_text(folded + "\n")
+            summary = {
+                "id": profile.id,
+                "method": profile.method,
+                "path": profile.path,
+                "wall_seconds": wall_seconds,
+                "samples": sum(profile.stacks.values()),
+                "sample_interval": self.interval,
+                "mongo_seconds": profile.mongo_seconds,
+                "mongo_commands": profile.mongo_commands,
+                "concurrent_requests": profile.concurrent_requests,
+            }
+            (self.output_dir / f"{profile.id}.json").write_text(json.dumps(summary, indent=2))
+        except OSError:
+            logger.exception("Could not write profile %s", profile.id)
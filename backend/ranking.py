@@ -0,0 +1,129 @@
+"""Lexicographic fractional ranks for manual todo ordering.
+
+A rank is a string that sorts correctly with plain byte comparison, and
+there is always room for another rank between any two. A move therefore
+only rewrites the moved todo. Ranks are base-62 with a variable-length
+integer part ("a0", "a1", ... "az", "b00", ...) followed by an optional
+fraction. Appending or prepending steps the integer and keeps keys short;
+inserting between two neighbours extends the fraction. Keys only grow with
+repeated inserts into the same gap, which ``rebalance`` later compacts.
+
+Port of the fractional indexing scheme described by David Greenspan
+("Implementing Fractional Indexing", 2020).
+"""
+from typing import Optional
+
+DIGITS = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz"
+INTEGER_ZERO = "a0"
+SMALLEST_INTEGER = "A" + DIGITS[0] * 26
+
+
+def _midpoint(a: str, b: Optional[str]) -> str:
+    """Fraction strictly between fractions ``a`` and ``b`` (None = 1)"""
+    if b is not None:
+        n = 0
+        while (a[n] if n < len(a) else DIGITS[0]) == b[n]:
+            n += 1
+        if n > 0:
+            return b[:n] + _midpoint(a[n:], b[n:])
+    digit_a = DIGITS.index(a[0]) if a else 0
+    digit_b = DIGITS.index(b[0]) if b is not None else len(DIGITS)
+    if digit_b - digit_a > 1:
+        return DIGITS[(digit_a + digit_b + 1) // 2]
+    if b is not None and len(b) > 1:
+        return b[0]
+    return DIGITS[digit_a] + _midpoint(a[1:], None)
+
+
+def _integer_length(head: str) -> int:
+    if "a" <= head <= "z":
+        return ord(head) - ord("a") + 2
+    if "A" <= head <= "Z":
+        return ord("Z") - ord(head) + 2
+    raise ValueError(f"Invalid rank head: {head!r}")
+
+
+def _split(key: str) -> tuple:
+    if not key or key == SMALLEST_INTEGER:
+        raise ValueError(f"Invalid rank: {key!r}")
+    integer = key[:_integer_length(key[0])]
+    fraction = key[len(integer):]
+    if len(integer) != _integer_length(key[0]) or fraction.endswith(DIGITS[0]):
+        raise ValueError(f"Invalid rank: {key!r}")
+    return integer, fraction
+
+
+def _increment(integer: str) -> Optional[str]:
+    head, digits = integer[0], list(integer[1:])
+    for i in reversed(range(len(digits))):
+        value = DIGITS.index(digits[i]) + 1
+        if value < len(DIGITS):
+            digits[i] = DIGITS[value]
+            return head + "".join(digits)
+        digits[i] = DIGITS[0]
+    if head == "Z":
+        return "a" + DIGITS[0]
+    if head == "z":
+        return None
+    head = chr(ord(head) + 1)
+    if head > "a":
+        digits.append(DIGITS[0])
+    else:
+        digits.pop()
+    return head + "".join(digits)
+
+
+def _decrement(integer: str) -> Optional[str]:
+    head, digits = integer[0], list(integer[1:])
+    for i in reversed(range(len(digits))):
+        value = DIGITS.index(digits[i]) - 1
+        if value >= 0:
+            digits[i] = DIGITS[value]
+            return head + "".join(digits)
+        digits[i] = DIGITS[-1]
+    if head == "a":
+        return "Z" + DIGITS[-1]
+    if head == "A":
+        return None
+    head = chr(ord(head) - 1)
+    if head < "Z":
+        digits.append(DIGITS[-1])
+    else:
+        digits.pop()
+    return head + "".join(digits)
+
+
+def rank_between(before: Optional[str], after: Optional[str]) -> str:
+    """A rank sorting after ``before`` and before ``after`` (None = open end).
+
+    Raises ValueError unless ``before < after``.
+    """
+    if before is not None:
+        before_integer, before_fraction = _split(before)
+    if after is not None:
+        after_integer, after_fraction = _split(after)
+    if before is not None and after is not None and before >= after:
+        raise ValueError(f"Ranks out of order: {before!r} >= {after!r}")
+
+    if before is None:
+        if after is None:
+            return INTEGER_ZERO
+        if after_integer == SMALLEST_INTEGER:
+            return after_integer + _midpoint("", after_fraction)
+        if after_integer < after:
+            return after_integer
+        decremented = _decrement(after_integer)
+        if decremented is None:
+            raise ValueError("Rank space exhausted")
+        return decremented
+
+    if after is None:
+        incremented = _increment(before_integer)
+        return before_integer + _midpoint(before_fraction, None) if incremented is None else incremented
+
+    if before_integer == after_integer:
+        return before_integer + _midpoint(before_fraction, after_fraction)
+    incremented = _increment(before_integer)
+    if incremented is not None and incremented < after:
+        return incremented
+    return before_integer + _midpoint(before_fraction, None)
@@ -0,0 +1,65 @@
+"""RRULE schedules for recurring todo templates.
+
+Templates store only their rule (RFC 5545 RRULE syntax, e.g.
+``FREQ=WEEKLY;BYDAY=MO,WE``), its start and the next due occurrence.
+Occurrences are computed on demand: the most recent one is materialized
+as a todo when it falls due, and upcoming ones are listed without being
+stored. All datetimes are naive UTC, as MongoDB returns them.
+"""
+import re
+from datetime import datetime, timezone
+from typing import List, Optional
+
+from dateutil.rrule import rrule, rrulestr
+
+# Finer-grained schedules would flood the todo list
+ALLOWED_FREQUENCIES = {"DAILY", "WEEKLY", "MONTHLY", "YEARLY"}
+FREQ_PATTERN = re.compile(r"(?:^|;)FREQ=([A-Z]+)", re.IGNORECASE)
+# RFC 5545 writes UNTIL in UTC with a trailing Z; starts are naive UTC here
+UTC_UNTIL_PATTERN = re.compile(r"(UNTIL=\d{8}(?:T\d{6})?)Z", re.IGNORECASE)
+
+
+def utc_naive(moment: datetime) -> datetime:
+    if moment.tzinfo is not None:
+        moment = moment.astimezone(timezone.utc).replace(tzinfo=None)
+    return moment.replace(microsecond=0)
+
+
+def utc_now() -> datetime:
+    return utc_naive(datetime.now(timezone.utc))
+
+
+def parse_rule(rule: str, start: datetime) -> rrule:
+    """Parse an RRULE body; raises ValueError for invalid or too frequent rules"""
+    frequency = FREQ_PATTERN.search(rule)
+    if not frequency or frequency.group(1).upper() not in ALLOWED_FREQUENCIES:
+        raise ValueError(f"FREQ must be one of {', '.join(sorted(ALLOWED_FREQUENCIES))}")
+    if "DTSTART" in rule.upper():
+        raise ValueError("Give the start separately, not as DTSTART")
+    parsed = rrulestr(UTC_UNTIL_PATTERN.sub(r"\1", rule), dtstart=utc_naive(start))
+    if not isinstance(parsed, rrule):
+        raise ValueError("Only a single RRULE is supported")
+    return parsed
+
+
+def first_due(rule: rrule, start: datetime) -> Optional[datetime]:
+    return rule.after(utc_naive(start), inc=True)
+
+
+def latest_due(rule: rrule, now: datetime) -> Optional[datetime]:
+    """Most recent occurrence at or before ``now``"""
+    return rule.before(now, inc=True)
+
+
+def next_due(rule: rrule, now: datetime) -> Optional[datetime]:
+    """First occurrence after ``now`` (None once the rule has ended)"""
+    return rule.after(now)
+
+
+def occurrences_between(rule: rrule, start: datetime, end: datetime, limit: int) -> List[datetime]:
+    occurrences = []
+    for occurrence in rule.xafter(start, inc=True):
+        if occurrence > end or len(occurrences) >= limit:
+            break
+        occurrences.append(occurrence)
+    return occurrences
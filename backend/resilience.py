@@ -0,0 +1,116 @@
+"""Deadlines, a circuit breaker and last-known-good snapshots for MongoDB.
+
+Read endpoints run their database work through ``CircuitBreaker.call`` with
+a deadline. When MongoDB is slow or down the call fails fast with
+``DatabaseUnavailable`` and the endpoint can answer from ``LastKnownGood``,
+marked stale, instead of hanging. Write endpoints are not cancelled
+mid-flight (that could leave half-applied rewards); they only check the
+breaker before starting, are bounded by the driver's ``timeoutMS``
+(``MONGO_OPERATION_TIMEOUT_MS``), and report outages back to the breaker.
+"""
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from pymongo.errors import ConnectionFailure, ExecutionTimeout
+
+# Errors that mean "the database is unavailable", as opposed to a bad request
+OUTAGE_ERRORS = (ConnectionFailure, ExecutionTimeout, asyncio.TimeoutError)
+
+
+class DatabaseUnavailable(Exception):
+    pass
+
+
+class CircuitBreaker:
+    """Opens after ``failure_threshold`` consecutive outages.
+
+    While open every call fails immediately. After ``reset_timeout`` seconds a
+    single probe call is let through (half-open); its outcome closes the
+    breaker again or re-opens it for another ``reset_timeout``.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 10.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.consecutive_failures = 0
+        self.opened_at: Optional[float] = None
+        self._probe_in_flight = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return self.CLOSED
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return self.HALF_OPEN
+        return self.OPEN
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == self.CLOSED:
+            return True
+        if state == self.HALF_OPEN and not self._probe_in_flight:
+            self._probe_in_flight = True
+            return True
+        return False
+
+    def record_success(self):
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self._probe_in_flight = False
+
+    def record_failure(self):
+        self.consecutive_failures += 1
+        if self._probe_in_flight or self.consecutive_failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+        self._probe_in_flight = False
+
+    def release_probe(self):
+        """End a probe that proved nothing either way (bad request, cancellation, ...)"""
+        self._probe_in_flight = False
+
+    async def call(self, func: Callable[[], Awaitable[Any]], timeout: float) -> Any:
+        """Run ``func()`` within ``timeout`` seconds, or raise DatabaseUnavailable"""
+        if not self.allow():
+            raise DatabaseUnavailable("circuit open")
+        try:
+            result = await asyncio.wait_for(func(), timeout)
+        except OUTAGE_ERRORS as e:
+            self.record_failure()
+            raise DatabaseUnavailable(str(e) or type(e).__name__) from e
+        except BaseException:
+            # Not an outage (validation error, cancellation, ...): release a probe slot
+            self.release_probe()
+            raise
+        self.record_success()
+        return result
+
+    def status(self) -> dict:
+        return {"state": self.state, "consecutive_failures": self.consecutive_failures}
+
+
+class Snapshot:
+    def __init__(self, value: Any):
+        self.value = value
+        self.stored_at = time.time()
+
+    @property
+    def age(self) -> float:
+        return time.time() - self.stored_at
+
+
+class LastKnownGood:
+    """Last successful result per key, served only while the database is unavailable"""
+
+    def __init__(self):
+        self._snapshots: Dict[str, Snapshot] = {}
+
+    def put(self, key: str, value: Any):
+        self._snapshots[key] = Snapshot(value)
+
+    def get(self, key: str) -> Optional[Snapshot]:
+        return self._snapshots.get(key)
@@ -0,0 +1,71 @@
+"""Per-user daily rollups of completion activity.
+
+Every completion adds to one document per user and UTC day::
+
+    {"user_id": ..., "day": datetime(2024, 1, 1), "completions": 3, "coins": 85,
+     "level": 2, "priorities": {"high": 1, "low": 2}, "categories": {"work": 3}}
+
+so history charts read one document per day however many todos exist.
+Long ranges are downsampled into fixed-size buckets of whole days; days
+without a document count as zero activity at the level reached before.
+"""
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, List, Optional
+
+
+def day_of(moment: datetime) -> datetime:
+    """Start of the UTC day, naive like the dates MongoDB returns"""
+    if moment.tzinfo is not None:
+        moment = moment.astimezone(timezone.utc).replace(tzinfo=None)
+    return datetime(moment.year, moment.month, moment.day)
+
+
+def completion_update(coins: int, level: int, priority: str, category: str) -> Dict[str, Any]:
+    """Upsert body adding one completion to a day's rollup"""
+    return {
+        "$inc": {"completions": 1, "coins": coins, f"priorities.{priority}": 1, f"categories.{category}": 1},
+        "$max": {"level": level},
+    }
+
+
+def bucket_days_for(days: int, max_points: int) -> int:
+    return max(1, -(-days // max_points))
+
+
+def downsample(
+    rollups: Iterable[Dict[str, Any]],
+    start: datetime,
+    end: datetime,
+    max_points: int,
+    initial_level: int = 1
+) -> Dict[str, Any]:
+    """Bucket the daily rollups of ``[start, end)`` (sorted by day) into at most ``max_points``"""
+    days = (end - start).days
+    bucket_days = bucket_days_for(days, max_points)
+    buckets: List[Dict[str, Any]] = []
+    level = initial_level
+    rollups = iter(rollups)
+    rollup: Optional[Dict[str, Any]] = next(rollups, None)
+    for offset in range(0, days, bucket_days):
+        bucket_start = start + timedelta(days=offset)
+        bucket_end = min(bucket_start + timedelta(days=bucket_days), end)
+        completions = coins = 0
+        priorities: Counter = Counter()
+        categories: Counter = Counter()
+        while rollup is not None and rollup["day"] < bucket_end:
+            completions += rollup.get("completions", 0)
+            coins += rollup.get("coins", 0)
+            priorities.update(rollup.get("priorities", {}))
+            categories.update(rollup.get("categories", {}))
+            level = max(level, rollup.get("level", level))
+            rollup = next(rollups, None)
+        buckets.append({
+            "date": bucket_start.date().isoformat(),
+            "completions": completions,
+            "coins": coins,
+            "level": level,
+            "priorities": dict(priorities),
+            "categories": dict(categories),
+        })
+    return {"bucket_days": bucket_days, "points": buckets}
@@ -0,0 +1,149 @@
+"""Asyncio background job scheduler with a Mongo-backed leader lock.
+
+Every uvicorn worker runs a ``JobScheduler``, but each job is guarded by a
+lease document in the ``job_leases`` collection so that only the current
+lease holder executes it. A lease outlives one interval plus the job timeout,
+so if the holder dies another worker takes the job over once it expires.
+"""
+import asyncio
+import logging
+import os
+import random
+import socket
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable, Dict, Optional
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError, PyMongoError
+
+logger = logging.getLogger(__name__)
+
+JobFunc = Callable[[], Awaitable[object]]
+
+
+def default_worker_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+class LeaseLock:
+    """Named leases stored as ``{_id: name, owner, expires_at}`` documents"""
+
+    def __init__(self, collection, owner: str):
+        self.collection = collection
+        self.owner = owner
+
+    async def acquire(self, name: str, ttl: float) -> bool:
+        """Take or renew the lease; returns False if another owner holds it"""
+        now = datetime.now(timezone.utc)
+        try:
+            lease = await self.collection.find_one_and_update(
+                {"_id": name, "$or": [{"owner": self.owner}, {"expires_at": {"$lte": now}}]},
+                {"$set": {"owner": self.owner, "expires_at": now + timedelta(seconds=ttl)}},
+                upsert=True,
+                return_document=ReturnDocument.AFTER,
+            )
+        except DuplicateKeyError:
+            # The lease exists, is unexpired and belongs to someone else
+            return False
+        return lease is not None and lease["owner"] == self.owner
+
+    async def release(self, name: str):
+        await self.collection.delete_one({"_id": name, "owner": self.owner})
+
+
+class Job:
+    def __init__(self, name: str, func: JobFunc, interval: float, jitter: float, timeout: float):
+        self.name = name
+        self.func = func
+        self.interval = interval
+        self.jitter = jitter
+        self.timeout = timeout
+        self.runs = 0
+        self.failures = 0
+        self.last_run: Optional[datetime] = None
+        self.last_duration: Optional[float] = None
+
+    def next_delay(self) -> float:
+        """Interval with +/- jitter so workers don't wake in lockstep"""
+        return self.interval * (1 + random.uniform(-self.jitter, self.jitter))
+
+    @property
+    def lease_ttl(self) -> float:
+        return self.interval + self.timeout
+
+
+class JobScheduler:
+    """Runs registered coroutines periodically while holding their lease"""
+
+    def __init__(self, lease_collection, worker_id: Optional[str] = None):
+        self.worker_id = worker_id or default_worker_id()
+        self.lock = LeaseLock(lease_collection, self.worker_id)
+        self.jobs: Dict[str, Job] = {}
+        self._tasks: Dict[str, asyncio.Task] = {}
+
+    def add_job(self, name: str, func: JobFunc, interval: float, jitter: float = 0.1, timeout: Optional[float] = None):
+        """Register a job running every ``interval`` seconds, bounded by ``timeout``"""
+        if name in self.jobs:
+            raise ValueError(f"Job {name} already registered")
+        self.jobs[name] = Job(name, func, interval, jitter, timeout if timeout is not None else interval / 2)
+
+    def start(self):
+        for name, job in self.jobs.items():
+            if name not in self._tasks:
+                self._tasks[name] = asyncio.create_task(self._run_forever(job), name=f"job:{name}")
+        logger.info("Scheduler %s started %d job(s)", self.worker_id, len(self._tasks))
+
+    async def stop(self):
+        tasks = list(self._tasks.values())
+        self._tasks.clear()
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        for name in self.jobs:
+            try:
+                await self.lock.release(name)
+            except PyMongoError:
+                logger.warning("Could not release lease for job %s", name)
+
+    async def run_once(self, job: Job) -> bool:
+        """Run the job if we hold its lease; returns whether it ran"""
+        try:
+            if not await self.lock.acquire(job.name, job.lease_ttl):
+                return False
+        except PyMongoError:
+            logger.exception("Lease acquisition failed for job %s", job.name)
+            return False
+
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        try:
+            await asyncio.wait_for(job.func(), timeout=job.timeout)
+        except asyncio.TimeoutError:
+            job.failures += 1
+            logger.warning("Job %s exceeded its %.1fs timeout", job.name, job.timeout)
+        except Exception:
+            job.failures += 1
+            logger.exception("Job %s failed", job.name)
+        job.runs += 1
+        job.last_run = datetime.now(timezone.utc)
+        job.last_duration = loop.time() - started
+        return True
+
+    async def _run_forever(self, job: Job):
+        while True:
+            await asyncio.sleep(job.next_delay())
+            await self.run_once(job)
+
+    def status(self) -> list:
+        return [
+            {
+                "name": job.name,
+                "interval": job.interval,
+                "runs": job.runs,
+                "failures": job.failures,
+                "last_run": job.last_run,
+                "last_duration": job.last_duration,
+            }
+            for job in self.jobs.values()
+        ]
@@ -0,0 +1,186 @@
+"""Compact on-disk layout of todo documents (schema version 2).
+
+Todos used to be stored exactly as the API model (``"priority": "medium"``,
+a 36 character string ``id`` next to ``_id``, long field names). They are
+now stored with short keys, small integer enum codes and the id as a
+16-byte binary UUID::
+
+    {"_id": ObjectId, "s": 2, "i": Binary(uuid), "t": title, "d": description,
+     "p": 1, "c": 4, "x": false, "ca": created_at, "cc": completed_at, "r": rank,
+     "a": [Binary(root id), ..., Binary(parent id)], "tp": Binary(template id),
+     "oc": occurrence, "v": version}
+
+Subtasks keep the ids of all their ancestors in ``a`` (omitted at the top
+level), so a whole subtree is one query on the multikey ``a`` index and
+``parent_id`` is simply the last ancestor. Todos materialized from a
+recurring template carry its id and their occurrence in ``tp``/``oc``.
+
+``todo_to_doc``/``todo_from_doc`` map between the layouts; the API models
+never see the stored keys. Until scripts/migrate_compact_schema.py has
+rewritten a collection, legacy documents may still exist: ``todo_from_doc``
+reads both, ``todo_query`` matches both while ``LegacyTodos`` says so, and
+writers upgrade a legacy document in place (``upgrade_pipeline``) before
+writing to it in the compact layout.
+"""
+import time
+import uuid
+from typing import Any, Dict, Optional
+
+from bson.binary import Binary
+
+SCHEMA_VERSION = 2
+
+# API field -> stored key
+TODO_KEYS = {
+    "id": "i",
+    "title": "t",
+    "description": "d",
+    "priority": "p",
+    "category": "c",
+    "completed": "x",
+    "created_at": "ca",
+    "completed_at": "cc",
+    "rank": "r",
+    "ancestors": "a",
+    "template_id": "tp",
+    "occurrence": "oc",
+    "version": "v",
+}
+# Left out of the document while empty
+OPTIONAL_KEYS = {"a", "tp", "oc"}
+STORED_FIELDS = {key: field for field, key in TODO_KEYS.items()}
+
+ENUM_CODES = {
+    "priority": {"low": 0, "medium": 1, "high": 2},
+    "category": {"work": 0, "personal": 1, "health": 2, "learning": 3, "other": 4},
+}
+ENUM_NAMES = {field: {code: name for name, code in codes.items()} for field, codes in ENUM_CODES.items()}
+
+# Matches documents still in the legacy layout
+LEGACY_FILTER = {"id": {"$exists": True}}
+
+# List order: open todos first, each group in manual (rank) order
+TODO_ORDER = [("x", 1), ("r", 1)]
+
+# (collection, keys, options) for the compact layout; the legacy id and
+# completed/completed_at indexes are dropped by the migration
+TODO_INDEXES = [
+    ("todos", [("i", 1)], {"unique": True, "sparse": True}),
+    ("todos", [("x", 1), ("cc", 1)], {}),
+    ("todos", [("x", 1), ("r", 1)], {}),
+    ("todos", [("a", 1)], {}),
+    # Each occurrence of a recurring template is materialized at most once
+    ("todos", [("tp", 1), ("oc", 1)], {"unique": True, "partialFilterExpression": {"tp": {"$exists": True}}}),
+    ("todos_archive", [("i", 1)], {}),
+]
+
+
+def encode_id(todo_id: str):
+    """Canonical UUID strings are stored as binary; anything else (imported ids) as is"""
+    try:
+        parsed = uuid.UUID(todo_id)
+    except (AttributeError, TypeError, ValueError):
+        return todo_id
+    return Binary.from_uuid(parsed) if str(parsed) == todo_id else todo_id
+
+
+def decode_id(stored) -> str:
+    return str(stored.as_uuid()) if isinstance(stored, Binary) else stored
+
+
+def encode_value(field: str, value: Any) -> Any:
+    if field in ("id", "template_id"):
+        return encode_id(value)
+    if field == "ancestors":
+        return [encode_id(ancestor) for ancestor in value]
+    if field in ENUM_CODES and value is not None:
+        return ENUM_CODES[field][getattr(value, "value", value)]
+    return value
+
+
+def decode_value(field: str, value: Any) -> Any:
+    if field in ("id", "template_id"):
+        return decode_id(value)
+    if field == "ancestors":
+        return [decode_id(ancestor) for ancestor in value]
+    if field in ENUM_NAMES and value is not None:
+        return ENUM_NAMES[field][value]
+    return value
+
+
+def todo_to_doc(todo: Dict[str, Any]) -> Dict[str, Any]:
+    """Stored document for a ``Todo.dict()``"""
+    document = {"s": SCHEMA_VERSION}
+    for field, key in TODO_KEYS.items():
+        document[key] = encode_value(field, todo[field])
+    for key in OPTIONAL_KEYS:
+        if document[key] in (None, []):
+            del document[key]
+    return document
+
+
+def todo_from_doc(document: Dict[str, Any]) -> Dict[str, Any]:
+    """API fields of a stored todo in either layout"""
+    if "i" not in document:
+        return {field: document[field] for field in TODO_KEYS if field in document}
+    todo = {STORED_FIELDS[key]: decode_value(STORED_FIELDS[key], value)
+            for key, value in document.items() if key in STORED_FIELDS}
+    if todo.get("ancestors"):
+        todo["parent_id"] = todo["ancestors"][-1]
+    return todo
+
+
+def todo_update(fields: Dict[str, Any]) -> Dict[str, Any]:
+    """``$set``/``$inc`` body with API field names mapped to stored keys"""
+    return {TODO_KEYS[field]: encode_value(field, value) for field, value in fields.items()}
+
+
+def todo_query(conditions: Dict[str, Any], include_legacy: bool) -> Dict[str, Any]:
+    """Filter on API fields; equality values are encoded, operator documents passed through"""
+    compact = {
+        TODO_KEYS[field]: condition if isinstance(condition, dict) else encode_value(field, condition)
+        for field, condition in conditions.items()
+    }
+    return {"$or": [compact, conditions]} if include_legacy else compact
+
+
+def subtree_query(todo_id: str, include_root: bool = True) -> Dict[str, Any]:
+    """A todo's descendants (and the todo itself), matched through the ``a`` index"""
+    encoded = encode_id(todo_id)
+    return {"$or": [{"i": encoded}, {"a": encoded}]} if include_root else {"a": encoded}
+
+
+def upgrade_pipeline(todo_id: str) -> list:
+    """Rewrite one legacy document (matched by its string id) into the compact layout"""
+    def code(field: str) -> dict:
+        branches = [{"case": {"$eq": [f"${field}", name]}, "then": value} for name, value in ENUM_CODES[field].items()]
+        return {"$switch": {"branches": branches, "default": None}}
+
+    compact = {key: f"${field}" for field, key in TODO_KEYS.items()}
+    compact.update({
+        "s": SCHEMA_VERSION,
+        "i": {"$literal": encode_id(todo_id)},
+        "p": code("priority"),
+        "c": code("category"),
+        "v": {"$ifNull": ["$version", 0]},
+    })
+    return [{"$set": compact}, {"$project": {field: 0 for field in TODO_KEYS}}]
+
+
+class LegacyTodos:
+    """Whether legacy-layout todos may still exist in a collection.
+
+    Assumed until a check finds none; rechecked at most every ``recheck``
+    seconds, and never again once the collection is fully migrated.
+    """
+
+    def __init__(self, recheck: float = 60.0):
+        self.recheck = recheck
+        self.present = True
+        self.checked_at: Optional[float] = None
+
+    async def may_exist(self, collection) -> bool:
+        if self.present and (self.checked_at is None or time.monotonic() - self.checked_at >= self.recheck):
+            self.checked_at = time.monotonic()
+            self.present = await collection.count_documents(LEGACY_FILTER, limit=1) > 0
+        return self.present
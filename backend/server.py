@@ -1,26 +1,189 @@
-from fastapi import FastAPI, APIRouter, HTTPException
+from fastapi import FastAPI, APIRouter, Depends, Header, HTTPException, Request, Response
 from dotenv import load_dotenv
+from fastapi.responses import JSONResponse, StreamingResponse
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, ConnectionFailure, DuplicateKeyError, ExecutionTimeout, OperationFailure, PyMongoError
+import asyncio
 import os
 import logging
+import time
 from pathlib import Path
-from pydantic import BaseModel, Field
-from typing import List, Optional
+from pydantic import BaseModel, Field, ValidationError
+from typing import List, Optional, Tuple
 import uuid
-from datetime import datetime, timezone
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta, timezone
 from enum import Enum
 
+from bulk import CSV, ImportFormatError, batched, import_format, ndjson_line, parse_csv, parse_ndjson
+from compression import CompressionMiddleware, negotiate
+from ledger import OUTBOX, FLUSHED, event, events_included, ledger_entries, pipeline_append, rebuild, tail_range
+from logging_config import (
+    RequestLogMiddleware,
+    RoundTripCounter,
+    configure_logging,
+    parse_sample_rates,
+    shutdown_logging,
+)
+from pool_metrics import PoolMetrics
+from ranking import rank_between
+from recurrence import first_due, latest_due, next_due, occurrences_between, parse_rule, utc_naive, utc_now
+from profiling import MongoCommandTimer, ProfilingMiddleware
+from rollups import completion_update, day_of, downsample
+from resilience import OUTAGE_ERRORS, CircuitBreaker, DatabaseUnavailable, LastKnownGood
+from scheduler import JobScheduler
+from schema import (
+    TODO_INDEXES,
+    TODO_ORDER,
+    LegacyTodos,
+    decode_id,
+    encode_id,
+    subtree_query,
+    todo_from_doc,
+    todo_query,
+    todo_to_doc,
+    todo_update,
+    upgrade_pipeline,
+)
+from settings import MongoSettings
+from singleflight import SingleFlight
+from traffic import CaptureWriter, TrafficCaptureMiddleware
+from workers import declare_cache, worker_info
+from write_behind import WriteBehindBuffer
+
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
-# MongoDB connection
-mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ['DB_NAME']]
+# Structured JSON logs written from a background thread
+configure_logging(os.environ.get("LOG_LEVEL", "INFO"))
+logger = logging.getLogger(__name__)
+
+# MongoDB connection (created in the lifespan, bound to the serving event loop)
+mongo_settings = MongoSettings.from_env()
+pool_metrics = PoolMetrics()
+client: Optional[AsyncIOMotorClient] = None
+db = None
+
+def create_mongo_client() -> AsyncIOMotorClient:
+    return AsyncIOMotorClient(
+        mongo_settings.url,
+        event_listeners=[MongoCommandTimer(), RoundTripCounter(), pool_metrics],
+        **mongo_settings.client_kwargs()
+    )
+
+# Deadlines and circuit breaking for database calls
+READ_DEADLINE_SECONDS = float(os.environ.get("READ_DEADLINE_MS", "1000")) / 1000
+mongo_breaker = CircuitBreaker(
+    failure_threshold=int(os.environ.get("BREAKER_FAILURE_THRESHOLD", "5")),
+    reset_timeout=float(os.environ.get("BREAKER_RESET_SECONDS", "10"))
+)
+last_known_good = LastKnownGood()
+declare_cache(
+    "last_known_good",
+    "per-process; refreshed by every successful read and only served, marked stale, while MongoDB is unavailable"
+)
+
+# Concurrent identical reads share one database call
+read_coalescer = SingleFlight()
+declare_cache(
+    "read_coalescer",
+    "in-flight only; nothing outlives a single database call and local writes drop in-flight entries"
+)
+
+# Todos are stored in the compact layout (schema.py); until the migration
+# has run, legacy documents are matched and upgraded on write as well
+legacy_todos = LegacyTodos()
+declare_cache(
+    "legacy_todos",
+    "per-process flag; assumed true and rechecked every minute until no legacy-layout todos remain"
+)
+
+# Optional write-behind for completion rewards: coin and counter deltas are
+# buffered per user and flushed as one update per interval
+WRITE_BEHIND_ENABLED = os.environ.get("WRITE_BEHIND_ENABLED", "false").lower() == "true"
+write_behind = WriteBehindBuffer(
+    lambda user_id, deltas: apply_stats_deltas(user_id, **deltas),
+    spill_path=os.environ.get("WRITE_BEHIND_SPILL_FILE", str(ROOT_DIR / "write_behind_spill.ndjson")),
+    interval=float(os.environ.get("WRITE_BEHIND_INTERVAL_MS", "1000")) / 1000,
+    max_pending=int(os.environ.get("WRITE_BEHIND_MAX_PENDING", "50"))
+)
+declare_cache(
+    "write_behind",
+    "per-process pending reward deltas; merged into this worker's reads, visible to other workers after the next flush"
+)
+
+# Optional NDJSON capture of API traffic for replay ("{pid}" in the path
+# gives each worker process its own file)
+capture_file = os.environ.get("TRAFFIC_CAPTURE_FILE")
+capture_writer = CaptureWriter(capture_file.format(pid=os.getpid())) if capture_file else None
+
+# Background jobs (auto-mining settlement, archival, ...)
+scheduler: Optional[JobScheduler] = None
+
+# Reported by /api/ready; flipped once startup() has finished
+readiness = {"ready": False, "ready_after_ms": None, "error": None}
+
+async def startup():
+    """Ping MongoDB until it answers, ensure indexes, warm caches, start jobs"""
+    started = time.perf_counter()
+    delay = 0.1
+    while True:
+        try:
+            await client.admin.command("ping")
+            await ensure_indexes()
+            await warm_caches()
+            if WRITE_BEHIND_ENABLED:
+                await write_behind.replay_spill()
+            break
+        except PyMongoError as e:
+            readiness["error"] = str(e)
+            logger.warning("Startup waiting for MongoDB, retrying in %.1fs: %s", delay, e)
+        except Exception as e:
+            # Not an outage, but failing here would only end this background
+            # task; keep retrying and report the error on /api/ready instead
+            readiness["error"] = f"{type(e).__name__}: {e}"
+            logger.exception("Startup failed, retrying in %.1fs", delay)
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, 5.0)
+    
+    if os.environ.get("SCHEDULER_ENABLED", "true").lower() == "true":
+        register_jobs()
+        scheduler.start()
+    if WRITE_BEHIND_ENABLED:
+        write_behind.start()
+    
+    readiness.update(ready=True, error=None, ready_after_ms=round((time.perf_counter() - started) * 1000, 1))
+    logger.info("Backend ready", extra={"startup_ms": readiness["ready_after_ms"]})
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global client, db, scheduler
+    # No-op on the first start; restarts the writer thread a previous shutdown stopped
+    configure_logging(os.environ.get("LOG_LEVEL", "INFO"))
+    client = create_mongo_client()
+    db = client[mongo_settings.db_name]
+    scheduler = JobScheduler(db.job_leases)
+    if capture_writer is not None and not capture_writer.is_alive():
+        capture_writer.start()
+    
+    # Serve /api/health and /api/ready while startup runs in the background
+    startup_task = asyncio.create_task(startup())
+    yield
+    startup_task.cancel()
+    await asyncio.gather(startup_task, return_exceptions=True)
+    # A restarted app in this process must not report ready before its own startup
+    readiness.update(ready=False, ready_after_ms=None, error=None)
+    await scheduler.stop()
+    await write_behind.stop()
+    client.close()
+    if capture_writer is not None:
+        capture_writer.stop()
+    shutdown_logging()
 
 # Create the main app without a prefix
-app = FastAPI(title="Todo Mining Game API")
+app = FastAPI(title="Todo Mining Game API", lifespan=lifespan)
 
 # Create a router with the /api prefix
 api_router = APIRouter(prefix="/api")
@@ -44,6 +207,7 @@ class TodoCreate(BaseModel):
     description: Optional[str] = ""
     priority: Priority = Priority.MEDIUM
     category: TodoCategory = TodoCategory.OTHER
+    parent_id: Optional[str] = None  # makes it a subtask of that todo
 
 class Todo(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
@@ -54,6 +218,12 @@ class Todo(BaseModel):
     completed: bool = False
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
     completed_at: Optional[datetime] = None
+    rank: Optional[str] = None  # manual order (ranking.py); todos sort by completed, then rank
+    parent_id: Optional[str] = None
+    ancestors: List[str] = Field(default_factory=list)  # root first, parent last
+    template_id: Optional[str] = None  # recurring template this todo was materialized from
+    occurrence: Optional[datetime] = None  # its scheduled time, naive UTC
+    version: int = 0
 
 class TodoUpdate(BaseModel):
     title: Optional[str] = None
@@ -62,6 +232,40 @@ class TodoUpdate(BaseModel):
     category: Optional[TodoCategory] = None
     completed: Optional[bool] = None
 
+class TodoMove(BaseModel):
+    previous_id: Optional[str] = None  # todo that should come right before it (None = top)
+    next_id: Optional[str] = None  # todo that should come right after it (None = bottom)
+
+# Recurring todo models
+class RecurringTemplateCreate(BaseModel):
+    title: str
+    description: Optional[str] = ""
+    priority: Priority = Priority.MEDIUM
+    category: TodoCategory = TodoCategory.OTHER
+    rule: str  # RRULE body, e.g. "FREQ=WEEKLY;BYDAY=MO,TH"; evaluated in UTC
+    start: Optional[datetime] = None  # first possible occurrence (default: now)
+
+class RecurringTemplate(BaseModel):
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    title: str
+    description: Optional[str] = ""
+    priority: Priority
+    category: TodoCategory
+    rule: str
+    start: datetime
+    next_due: Optional[datetime] = None  # None once the rule has no further occurrences
+    last_occurrence: Optional[datetime] = None  # latest materialized occurrence
+    last_completed_occurrence: Optional[datetime] = None
+    streak: int = 0  # consecutive occurrences completed
+    best_streak: int = 0
+    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    version: int = 0
+
+class RecurringOccurrence(BaseModel):
+    template_id: str
+    title: str
+    occurrence: datetime
+
 # Game Models
 class GameStats(BaseModel):
     user_id: str = Field(default="default_user")  # For now, single user
@@ -74,6 +278,7 @@ class GameStats(BaseModel):
     current_streak: int = 0
     best_streak: int = 0
     last_activity: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    version: int = 0
 
 class Upgrade(BaseModel):
     id: str
@@ -112,6 +317,28 @@ def calculate_level_from_exp(total_exp: int) -> int:
     """Calculate level based on total experience (simple formula)"""
     return max(1, int((total_exp / 100) + 1))
 
+# Optimistic concurrency helpers
+def parse_if_match(if_match: Optional[str]) -> Optional[int]:
+    """Parse an If-Match header carrying a document version (None = any)"""
+    if if_match is None or if_match.strip() == "*":
+        return None
+    tag = if_match.strip()
+    if tag.startswith("W/"):
+        tag = tag[2:]
+    try:
+        return int(tag.strip('"'))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid If-Match header")
+
+def version_filter(expected_version: int, field: str = "version") -> dict:
+    """Match a document version; documents written before versioning count as 0"""
+    if expected_version == 0:
+        return {field: {"$in": [0, None]}}
+    return {field: expected_version}
+
+def etag(version: int) -> str:
+    return f'"{version}"'
+
 # Available Upgrades Configuration
 AVAILABLE_UPGRADES = [
     {
@@ -140,109 +367,717 @@ AVAILABLE_UPGRADES = [
     }
 ]
 
+def upgrade_level(upgrade_config: dict, stats: GameStats) -> int:
+    """Current level of an upgrade, derived from the stats it affects"""
+    if upgrade_config["effect"] == "mining_power":
+        return max(0, stats.mining_power - 1)  # Base mining power is 1
+    if upgrade_config["effect"] == "auto_mining":
+        return stats.auto_miners
+    return 0  # For now, efficiency is not tracked separately
+
+def upgrade_cost(upgrade_config: dict, level: int) -> int:
+    """Upgrade cost with exponential scaling"""
+    return upgrade_config["base_cost"] * (2 ** level)
+
+# Attempts before a purchase racing with other stat updates gives up
+PURCHASE_ATTEMPTS = 5
+
 # API Endpoints
 
 # Todo Endpoints
+async def serve_read(request: Request, key: str, loader):
+    """Run a read under the deadline and breaker, falling back to the last good result"""
+    try:
+        content = await mongo_breaker.call(loader, READ_DEADLINE_SECONDS)
+    except DatabaseUnavailable:
+        snapshot = last_known_good.get(key)
+        if snapshot is None:
+            raise
+        logger.warning("Serving stale %s snapshot", key, extra={"age_seconds": round(snapshot.age, 1)})
+        response = negotiate(request, snapshot.value)
+        response.headers["X-Stale"] = "true"
+        response.headers["Age"] = str(int(snapshot.age))
+        return response
+    last_known_good.put(key, content)
+    return negotiate(request, content)
+
+async def database_guard():
+    """Fail fast while the breaker is open and report outages from write routes"""
+    if not mongo_breaker.allow():
+        raise DatabaseUnavailable("circuit open")
+    try:
+        yield
+    except OUTAGE_ERRORS:
+        mongo_breaker.record_failure()
+        raise
+    except BaseException:
+        # HTTP errors and the like say nothing about the database; free a probe slot
+        mongo_breaker.release_probe()
+        raise
+    else:
+        mongo_breaker.record_success()
+
 @api_router.get("/todos", response_model=List[Todo])
-async def get_todos():
+async def get_todos(request: Request):
     """Get all todos"""
-    todos = await db.todos.find().to_list(1000)
-    return [Todo(**todo) for todo in todos]
-
-@api_router.post("/todos", response_model=Todo)
-async def create_todo(todo_data: TodoCreate):
-    """Create a new todo"""
-    todo = Todo(**todo_data.dict())
-    await db.todos.insert_one(todo.dict())
+    return await serve_read(request, "todos", load_todos)
+
+async def load_todos() -> List[Todo]:
+    return await read_coalescer.do("todos", _load_todos)
+
+async def _load_todos() -> List[Todo]:
+    todos = await db.todos.find().sort(TODO_ORDER).to_list(1000)
+    return [Todo(**todo_from_doc(todo)) for todo in todos]
+
+@api_router.post("/todos", response_model=Todo, dependencies=[Depends(database_guard)])
+async def create_todo(todo_data: TodoCreate, response: Response):
+    """Create a new todo, or a subtask when ``parent_id`` is given"""
+    ancestors = [] if todo_data.parent_id is None else await ancestors_for(todo_data.parent_id)
+    [rank], epoch = await bottom_ranks(1)
+    todo = Todo(**todo_data.dict(), ancestors=ancestors, rank=rank)
+    await db.todos.insert_one(todo_to_doc(todo.dict()))
+    [todo.rank] = await settle_bottom_ranks([todo.id], [rank], epoch)
+    read_coalescer.forget("todos")
+    response.headers["ETag"] = etag(todo.version)
     return todo
 
-@api_router.put("/todos/{todo_id}", response_model=Todo)
-async def update_todo(todo_id: str, update_data: TodoUpdate):
-    """Update a todo"""
-    # Get existing todo
-    existing_todo = await db.todos.find_one({"id": todo_id})
-    if not existing_todo:
-        raise HTTPException(status_code=404, detail="Todo not found")
+# Bulk import and export
+IMPORT_BATCH_SIZE = int(os.environ.get("IMPORT_BATCH_SIZE", "1000"))
+EXPORT_BATCH_SIZE = int(os.environ.get("EXPORT_BATCH_SIZE", "1000"))
+# Row errors reported back by an import; further failures are only counted
+MAX_IMPORT_ERRORS = 100
+
+def todo_from_import(row, rank: str) -> Todo:
+    if isinstance(row, Exception):
+        raise row
+    if not isinstance(row, dict):
+        raise ImportFormatError("Expected an object")
+    todo = Todo(**{"priority": Priority.MEDIUM, "category": TodoCategory.OTHER, **row, "rank": rank})
+    if todo.parent_id != (todo.ancestors[-1] if todo.ancestors else None):
+        raise ImportFormatError("parent_id must be the last of ancestors")
+    return todo
+
+def describe_import_error(error: Exception) -> str:
+    if isinstance(error, ValidationError):
+        return "; ".join(f"{'.'.join(map(str, e['loc']))}: {e['msg']}" for e in error.errors())
+    return str(error)
+
+@api_router.post("/todos/import", dependencies=[Depends(database_guard)])
+async def import_todos(request: Request):
+    """Import todos from an NDJSON or CSV (``Content-Type: text/csv``) body.
+
+    Rows carry todo fields; only ``title`` is required. The body is parsed
+    as it arrives and inserted in batches of ``IMPORT_BATCH_SIZE``, so memory
+    stays bounded. Imported todos are appended to the bottom in body order,
+    imported completed todos don't award rewards, and rows whose id
+    already exists are rejected.
+    """
+    try:
+        body_format = import_format(request.headers.get("content-type", ""))
+    except ImportFormatError as e:
+        raise HTTPException(status_code=415, detail=str(e))
+    rows = parse_csv(request.stream()) if body_format == CSV else parse_ndjson(request.stream())
+    
+    summary = {"imported": 0, "failed": 0, "errors": []}
+    
+    def reject(line_number: int, message: str):
+        summary["failed"] += 1
+        if len(summary["errors"]) < MAX_IMPORT_ERRORS:
+            summary["errors"].append({"line": line_number, "error": message})
+    
+    try:
+        async for batch in batched(rows, IMPORT_BATCH_SIZE):
+            ranks, epoch = await bottom_ranks(len(batch))
+            todos, line_numbers = [], []
+            for (line_number, row), rank in zip(batch, ranks):
+                try:
+                    todos.append(todo_from_import(row, rank))
+                    line_numbers.append(line_number)
+                except ValueError as e:
+                    reject(line_number, describe_import_error(e))
+            if not todos:
+                continue
+            inserted = set(range(len(todos)))
+            try:
+                await db.todos.insert_many([todo_to_doc(todo.dict()) for todo in todos], ordered=False)
+            except BulkWriteError as e:
+                for write_error in e.details["writeErrors"]:
+                    inserted.discard(write_error["index"])
+                    duplicate = write_error["code"] == 11000
+                    reject(line_numbers[write_error["index"]], "Duplicate id" if duplicate else write_error["errmsg"])
+            finally:
+                read_coalescer.forget("todos")
+            summary["imported"] += len(inserted)
+            inserted_todos = [todo for index, todo in enumerate(todos) if index in inserted]
+            await settle_bottom_ranks(
+                [todo.id for todo in inserted_todos], [todo.rank for todo in inserted_todos], epoch
+            )
+    except ImportFormatError as e:
+        # The rest of the body can't be parsed; earlier batches stay imported
+        raise HTTPException(status_code=400, detail={"error": str(e), **summary})
+    return summary
+
+@api_router.get("/todos/export", dependencies=[Depends(database_guard)])
+async def export_todos(completed: Optional[bool] = None):
+    """Stream todos as NDJSON straight from a cursor"""
+    query = {} if completed is None else todo_query({"completed": completed}, await legacy_todos.may_exist(db.todos))
+    cursor = db.todos.find(query).sort(TODO_ORDER).batch_size(EXPORT_BATCH_SIZE)
+    
+    async def lines():
+        # Roughly one chunk per cursor batch rather than one per todo
+        chunk = []
+        async for document in cursor:
+            chunk.append(ndjson_line(todo_from_doc(document)))
+            if len(chunk) >= EXPORT_BATCH_SIZE:
+                yield b"".join(chunk)
+                chunk = []
+        if chunk:
+            yield b"".join(chunk)
     
-    # Check if todo is being completed
-    was_completed = existing_todo.get("completed", False)
+    return StreamingResponse(
+        lines(),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": 'attachment; filename="todos.ndjson"'}
+    )
+
+@api_router.put("/todos/{todo_id}", response_model=Todo, dependencies=[Depends(database_guard)])
+async def update_todo(
+    todo_id: str,
+    update_data: TodoUpdate,
+    response: Response,
+    if_match: Optional[str] = Header(None)
+):
+    """Update a todo (optionally conditional on If-Match: "<version>")"""
+    expected_version = parse_if_match(if_match)
     update_dict = {k: v for k, v in update_data.dict().items() if v is not None}
     
-    # If todo is being marked as completed and wasn't before
-    if update_dict.get("completed") and not was_completed:
-        update_dict["completed_at"] = datetime.now(timezone.utc)
-        
-        # Award game rewards
-        priority = Priority(existing_todo["priority"])
-        await award_completion_rewards(priority)
+    if await legacy_todos.may_exist(db.todos):
+        # Writes below use the compact layout only
+        await db.todos.update_one({"id": todo_id}, upgrade_pipeline(todo_id))
+    query = todo_query({"id": todo_id}, include_legacy=False)
+    if expected_version is not None:
+        query.update(version_filter(expected_version, "v"))
+    
+    # Completing is conditional on the todo still being open, so concurrent
+    # completions award the rewards exactly once
+    completing = update_dict.get("completed") is True
+    if completing:
+        updated_todo = await db.todos.find_one_and_update(
+            {**query, "x": {"$ne": True}},
+            {"$set": todo_update({**update_dict, "completed_at": datetime.now(timezone.utc)}), "$inc": {"v": 1}},
+            return_document=ReturnDocument.AFTER
+        )
+        if updated_todo:
+            # Completing a parent completes its open subtasks; only the parent earns rewards
+            await db.todos.update_many(
+                {**subtree_query(todo_id, include_root=False), "x": {"$ne": True}},
+                {"$set": {"x": True, "cc": updated_todo["cc"]}, "$inc": {"v": 1}}
+            )
+        read_coalescer.forget("todos")
+        if updated_todo:
+            completed = todo_from_doc(updated_todo)
+            await award_completion_rewards(Priority(completed["priority"]), TodoCategory(completed["category"]))
+            if completed.get("template_id"):
+                await record_recurring_completion(completed["template_id"], completed["occurrence"])
     
-    # Update the todo
-    await db.todos.update_one({"id": todo_id}, {"$set": update_dict})
+    if not completing or not updated_todo:
+        updated_todo = await db.todos.find_one_and_update(
+            query,
+            {"$set": todo_update(update_dict), "$inc": {"v": 1}},
+            return_document=ReturnDocument.AFTER
+        )
+        read_coalescer.forget("todos")
+    
+    if not updated_todo:
+        if expected_version is not None and await db.todos.count_documents(todo_query({"id": todo_id}, include_legacy=False), limit=1):
+            raise HTTPException(status_code=412, detail="Todo was modified by another request")
+        raise HTTPException(status_code=404, detail="Todo not found")
     
-    # Return updated todo
-    updated_todo = await db.todos.find_one({"id": todo_id})
-    return Todo(**updated_todo)
+    todo = Todo(**todo_from_doc(updated_todo))
+    response.headers["ETag"] = etag(todo.version)
+    return todo
 
-@api_router.delete("/todos/{todo_id}")
+@api_router.delete("/todos/{todo_id}", dependencies=[Depends(database_guard)])
 async def delete_todo(todo_id: str):
-    """Delete a todo"""
-    result = await db.todos.delete_one({"id": todo_id})
+    """Delete a todo together with all of its subtasks"""
+    query = subtree_query(todo_id)
+    if await legacy_todos.may_exist(db.todos):
+        query["$or"].append({"id": todo_id})
+    result = await db.todos.delete_many(query)
+    read_coalescer.forget("todos")
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Todo not found")
-    return {"message": "Todo deleted successfully"}
+    return {"message": "Todo deleted successfully", "deleted": result.deleted_count}
+
+# Subtasks
+MAX_TODO_DEPTH = int(os.environ.get("MAX_TODO_DEPTH", "8"))
+
+async def ancestors_for(parent_id: str) -> List[str]:
+    """Ancestor ids for a new child of ``parent_id``"""
+    if await legacy_todos.may_exist(db.todos):
+        await db.todos.update_one({"id": parent_id}, upgrade_pipeline(parent_id))
+    parent = await db.todos.find_one(todo_query({"id": parent_id}, include_legacy=False), {"i": 1, "a": 1})
+    if not parent:
+        raise HTTPException(status_code=404, detail="Parent todo not found")
+    ancestors = [*todo_from_doc(parent).get("ancestors", []), parent_id]
+    if len(ancestors) > MAX_TODO_DEPTH:
+        raise HTTPException(status_code=400, detail=f"Subtasks can be nested at most {MAX_TODO_DEPTH} levels deep")
+    return ancestors
+
+@api_router.get("/todos/progress")
+async def get_todo_progress(request: Request):
+    """Roll-up subtask counts for every todo that has subtasks"""
+    return await serve_read(request, "todo_progress", load_todo_progress)
+
+async def load_todo_progress() -> dict:
+    pipeline = [
+        {"$match": {"a": {"$exists": True}}},
+        {"$unwind": "$a"},
+        {"$group": {"_id": "$a", "total": {"$sum": 1}, "completed": {"$sum": {"$cond": ["$x", 1, 0]}}}},
+    ]
+    return {
+        decode_id(group["_id"]): {"total": group["total"], "completed": group["completed"]}
+        async for group in db.todos.aggregate(pipeline)
+    }
+
+@api_router.get("/todos/{todo_id}/subtree", response_model=List[Todo])
+async def get_todo_subtree(todo_id: str, request: Request):
+    """A todo followed by all of its subtasks, at any depth, in list order"""
+    return await serve_read(request, f"subtree:{todo_id}", lambda: load_todo_subtree(todo_id))
+
+async def load_todo_subtree(todo_id: str) -> List[Todo]:
+    todos = [Todo(**todo_from_doc(document)) async for document in db.todos.find(subtree_query(todo_id)).sort(TODO_ORDER)]
+    if not todos:
+        if await legacy_todos.may_exist(db.todos):
+            legacy = await db.todos.find_one({"id": todo_id})
+            if legacy:
+                return [Todo(**todo_from_doc(legacy))]
+        raise HTTPException(status_code=404, detail="Todo not found")
+    # The root may sort anywhere among its subtasks; put it first
+    todos.sort(key=lambda todo: todo.id != todo_id)
+    return todos
+
+# Manual ordering
+# A rebalance renumbers every rank, so a rank computed from neighbours read
+# before it lands in the wrong place. Rebalances bump the epoch in rank_state
+# when they start and when they finish; a move that sees a rebalance running,
+# or the epoch change around its write, recomputes from fresh neighbours.
+# New todos (create, import, recurring) are appended the same way: their
+# rank comes from the last rank under a known epoch and is redone if the
+# epoch moved by the time they are inserted.
+RANK_MAX_LENGTH = int(os.environ.get("RANK_MAX_LENGTH", "12"))
+RANK_STATE_ID = "todos"
+RANK_REBALANCE_TIMEOUT = 300
+# Minimum seconds between rebalances forced by moves
+RANK_FORCED_REBALANCE_INTERVAL = float(os.environ.get("RANK_FORCED_REBALANCE_INTERVAL", "60"))
+RANK_MOVE_ATTEMPTS = 5
+RANK_MOVE_BACKOFF = 0.1
+
+async def last_rank() -> Optional[str]:
+    """Highest rank among open todos, so new todos go to the bottom"""
+    last = await db.todos.find_one({"x": False, "r": {"$ne": None}}, {"r": 1}, sort=[("r", -1)])
+    return last["r"] if last else None
+
+async def rank_epoch() -> Optional[int]:
+    """Epoch of the current ranks, or None while a rebalance is rewriting them"""
+    state = await db.rank_state.find_one({"_id": RANK_STATE_ID}) or {}
+    running_until = state.get("running_until")
+    if running_until is not None and running_until > utc_now():
+        return None
+    return state.get("epoch", 0)
+
+async def bottom_ranks(count: int) -> Tuple[List[str], Optional[int]]:
+    """Ranks for ``count`` new todos at the bottom, and the epoch they belong to.
+
+    Waits out a running rebalance for up to ``RANK_MOVE_ATTEMPTS`` tries;
+    past that the epoch is None and ``settle_bottom_ranks`` redoes the ranks.
+    """
+    for attempt in range(RANK_MOVE_ATTEMPTS):
+        if attempt:
+            await asyncio.sleep(RANK_MOVE_BACKOFF * attempt)
+        epoch = await rank_epoch()
+        if epoch is not None:
+            break
+    rank, ranks = await last_rank(), []
+    for _ in range(count):
+        rank = rank_between(rank, None)
+        ranks.append(rank)
+    return ranks, epoch
+
+async def settle_bottom_ranks(todo_ids: List[str], ranks: List[str], epoch: Optional[int]) -> List[str]:
+    """Re-append just-inserted todos if a rebalance overlapped their insert.
+
+    A rebalance that started before the insert may not have seen the new
+    todos, and one that finished renumbered everything below their ranks.
+    Either way the epoch moved; the todos are given fresh ranks after the
+    last other open todo until the epoch holds still. Returns their ranks.
+    """
+    encoded = [encode_id(todo_id) for todo_id in todo_ids]
+    for attempt in range(RANK_MOVE_ATTEMPTS):
+        current = await rank_epoch()
+        if current is not None and current == epoch:
+            return ranks
+        if current is None:
+            await asyncio.sleep(RANK_MOVE_BACKOFF * (attempt + 1))
+            continue
+        epoch = current
+        last = await db.todos.find_one(
+            {"x": False, "r": {"$ne": None}, "i": {"$nin": encoded}}, {"r": 1}, sort=[("r", -1)]
+        )
+        rank, ranks = last["r"] if last else None, []
+        for todo_id in encoded:
+            rank = rank_between(rank, None)
+            ranks.append(rank)
+        if encoded:
+            await db.todos.bulk_write(
+                [UpdateOne({"i": todo_id}, {"$set": {"r": rank}}) for todo_id, rank in zip(encoded, ranks)],
+                ordered=False
+            )
+        read_coalescer.forget("todos")
+    logger.warning("Ranks of %d new todos may be out of place after overlapping rebalances", len(todo_ids))
+    return ranks
+
+@api_router.post("/todos/{todo_id}/move", response_model=Todo, dependencies=[Depends(database_guard)])
+async def move_todo(
+    todo_id: str,
+    move: TodoMove,
+    response: Response,
+    if_match: Optional[str] = Header(None)
+):
+    """Move a todo between two neighbours as the client sees them.
+
+    Only the moved todo is written: it gets a rank between its neighbours'.
+    Neighbours out of order answer 409. Unranked or tied neighbours force
+    one rebalance (rate-limited) before giving up with 409. A move that
+    overlaps a rebalance is redone against the new ranks.
+    """
+    expected_version = parse_if_match(if_match)
+    neighbour_ids = [i for i in (move.previous_id, move.next_id) if i is not None]
+    if todo_id in neighbour_ids:
+        raise HTTPException(status_code=400, detail="A todo can't be moved next to itself")
+    if await legacy_todos.may_exist(db.todos):
+        for upgrade_id in [todo_id, *neighbour_ids]:
+            await db.todos.update_one({"id": upgrade_id}, upgrade_pipeline(upgrade_id))
+    
+    rebalance_tried = False
+    for attempt in range(RANK_MOVE_ATTEMPTS):
+        if attempt:
+            await asyncio.sleep(RANK_MOVE_BACKOFF * attempt)
+        epoch = await rank_epoch()
+        if epoch is None:
+            continue
+        neighbours = {
+            todo_from_doc(document)["id"]: document.get("r")
+            async for document in db.todos.find({"i": {"$in": [encode_id(i) for i in neighbour_ids]}}, {"i": 1, "r": 1})
+        }
+        missing = [i for i in neighbour_ids if i not in neighbours]
+        if missing:
+            raise HTTPException(status_code=404, detail=f"Todo {missing[0]} not found")
+        previous_rank, next_rank = neighbours.get(move.previous_id), neighbours.get(move.next_id)
+        if any(rank is None for rank in neighbours.values()) or (previous_rank is not None and previous_rank == next_rank):
+            # Only a rebalance makes room here
+            if rebalance_tried:
+                raise HTTPException(status_code=409, detail="Neighbours have no room between them, retry later")
+            await rebalance_ranks(force=True, min_interval=RANK_FORCED_REBALANCE_INTERVAL)
+            rebalance_tried = True
+            continue
+        try:
+            rank = rank_between(previous_rank, next_rank)
+        except ValueError:
+            raise HTTPException(status_code=409, detail="Neighbours are out of order, reload and retry")
+        
+        query = todo_query({"id": todo_id}, include_legacy=False)
+        if expected_version is not None:
+            query.update(version_filter(expected_version, "v"))
+        updated_todo = await db.todos.find_one_and_update(
+            query,
+            {"$set": {"r": rank}, "$inc": {"v": 1}},
+            return_document=ReturnDocument.AFTER
+        )
+        read_coalescer.forget("todos")
+        if not updated_todo:
+            if expected_version is not None and await db.todos.count_documents(todo_query({"id": todo_id}, False), limit=1):
+                raise HTTPException(status_code=412, detail="Todo was modified by another request")
+            raise HTTPException(status_code=404, detail="Todo not found")
+        if await rank_epoch() == epoch:
+            break
+        # A rebalance overlapped the write; redo it on top of our own version
+        if expected_version is not None:
+            expected_version = updated_todo["v"]
+    else:
+        raise HTTPException(status_code=409, detail="Todos are being reordered, retry")
+    
+    todo = Todo(**todo_from_doc(updated_todo))
+    response.headers["ETag"] = etag(todo.version)
+    return todo
+
+async def rebalance_ranks(force: bool = False, batch_size: int = 1000, min_interval: float = 0) -> int:
+    """Rewrite ranks as short evenly spaced keys, keeping the current order.
+
+    Skipped unless some todo is unranked, two share a rank or a rank grew
+    past ``RANK_MAX_LENGTH``, and while another rebalance runs or finished
+    less than ``min_interval`` seconds ago. Each write is conditional on the
+    rank it replaces, and moves overlapping the run are redone by
+    ``move_todo`` once it finishes.
+    """
+    compact = {"i": {"$exists": True}}
+    if not force:
+        previous, needed = None, False
+        async for document in db.todos.find(compact, {"r": 1}).sort(TODO_ORDER):
+            rank = document.get("r")
+            if rank is None or rank == previous or len(rank) > RANK_MAX_LENGTH:
+                needed = True
+                break
+            previous = rank
+        if not needed:
+            return 0
+    
+    now = utc_now()
+    try:
+        await db.rank_state.update_one(
+            {"_id": RANK_STATE_ID, "$and": [
+                {"$or": [{"running_until": None}, {"running_until": {"$lte": now}}]},
+                {"$or": [{"rebalanced_at": None}, {"rebalanced_at": {"$lte": now - timedelta(seconds=min_interval)}}]},
+            ]},
+            {"$set": {"running_until": now + timedelta(seconds=RANK_REBALANCE_TIMEOUT)}, "$inc": {"epoch": 1}},
+            upsert=True
+        )
+    except DuplicateKeyError:
+        # Another rebalance is running or one finished too recently
+        return 0
+    
+    rank, updates, rewritten = None, [], 0
+    try:
+        async for document in db.todos.find(compact, {"r": 1}).sort(TODO_ORDER):
+            rank = rank_between(rank, None)
+            if document.get("r") != rank:
+                updates.append(UpdateOne({"_id": document["_id"], "r": document.get("r")}, {"$set": {"r": rank}}))
+            if len(updates) >= batch_size:
+                rewritten += (await db.todos.bulk_write(updates, ordered=False)).modified_count
+                updates = []
+        if updates:
+            rewritten += (await db.todos.bulk_write(updates, ordered=False)).modified_count
+    finally:
+        await db.rank_state.update_one(
+            {"_id": RANK_STATE_ID},
+            {"$set": {"running_until": None, "rebalanced_at": utc_now()}, "$inc": {"epoch": 1}}
+        )
+        read_coalescer.forget("todos")
+    return rewritten
+
+# Recurring todos
+# Templates store their rule and the next due time only; the next_due index
+# is the heap the recurring_materialization job pops from. Reads never write:
+# a due todo appears within one job interval.
+RECURRING_BATCH_SIZE = 100
+MAX_UPCOMING_DAYS = 90
+MAX_UPCOMING_PER_TEMPLATE = 100
+
+@api_router.post("/recurring", response_model=RecurringTemplate, dependencies=[Depends(database_guard)])
+async def create_recurring_template(template_data: RecurringTemplateCreate):
+    """Create a recurring todo template; its first todo appears once it is due"""
+    start = utc_naive(template_data.start) if template_data.start else utc_now()
+    try:
+        rule = parse_rule(template_data.rule, start)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid rule: {e}")
+    first = first_due(rule, start)
+    if first is None:
+        raise HTTPException(status_code=400, detail="Invalid rule: it has no occurrences")
+    template = RecurringTemplate(**{**template_data.dict(), "start": start}, next_due=first)
+    await db.todo_templates.insert_one(template.dict())
+    if first <= utc_now():
+        if await materialize_template(template.dict(), utc_now()):
+            read_coalescer.forget("todos")
+        return RecurringTemplate(**await db.todo_templates.find_one({"id": template.id}))
+    return template
+
+@api_router.get("/recurring", response_model=List[RecurringTemplate])
+async def get_recurring_templates():
+    """All recurring todo templates, soonest due first"""
+    return [RecurringTemplate(**template) async for template in db.todo_templates.find().sort("next_due", 1)]
+
+@api_router.get("/recurring/upcoming", response_model=List[RecurringOccurrence])
+async def get_upcoming_occurrences(days: int = 7):
+    """Occurrences due within the next ``days``; computed from the rules, not stored"""
+    now = utc_now()
+    end = now + timedelta(days=max(1, min(days, MAX_UPCOMING_DAYS)))
+    upcoming = []
+    async for template in db.todo_templates.find({"next_due": {"$lte": end}}):
+        rule = parse_rule(template["rule"], template["start"])
+        upcoming.extend(
+            RecurringOccurrence(template_id=template["id"], title=template["title"], occurrence=occurrence)
+            for occurrence in occurrences_between(rule, template["next_due"], end, MAX_UPCOMING_PER_TEMPLATE)
+        )
+    return sorted(upcoming, key=lambda occurrence: occurrence.occurrence)
+
+@api_router.delete("/recurring/{template_id}", dependencies=[Depends(database_guard)])
+async def delete_recurring_template(template_id: str):
+    """Stop a recurrence; todos already materialized from it are kept"""
+    result = await db.todo_templates.delete_one({"id": template_id})
+    if result.deleted_count == 0:
+        raise HTTPException(status_code=404, detail="Recurring template not found")
+    return {"message": "Recurring template deleted successfully"}
+
+async def materialize_due_templates(limit: int = RECURRING_BATCH_SIZE) -> int:
+    """Materialize the latest occurrence of every template that has fallen due"""
+    now = utc_now()
+    due = await db.todo_templates.find({"next_due": {"$lte": now}}).sort("next_due", 1).to_list(limit)
+    materialized = 0
+    for template in due:
+        materialized += await materialize_template(template, now)
+    if materialized:
+        read_coalescer.forget("todos")
+    return materialized
+
+async def materialize_template(template: dict, now: datetime) -> bool:
+    """Insert the todo for the latest due occurrence and advance ``next_due``.
+
+    Only the most recent occurrence becomes a todo: a template that was not
+    looked at for a week yields one daily todo, not seven. Both steps are
+    idempotent (the (tp, oc) index rejects a second insert and the advance
+    is compared-and-swapped on ``next_due``), so workers and the scheduler
+    job may race on the same template.
+    """
+    rule = parse_rule(template["rule"], template["start"])
+    occurrence = latest_due(rule, now)
+    previous = template.get("last_occurrence")
+    update = {"next_due": next_due(rule, now), "last_occurrence": occurrence}
+    created = False
+    if occurrence != previous:
+        [rank], epoch = await bottom_ranks(1)
+        todo = Todo(
+            title=template["title"],
+            description=template["description"],
+            priority=template["priority"],
+            category=template["category"],
+            template_id=template["id"],
+            occurrence=occurrence,
+            rank=rank
+        )
+        try:
+            await db.todos.insert_one(todo_to_doc(todo.dict()))
+            await settle_bottom_ranks([todo.id], [rank], epoch)
+            created = True
+        except DuplicateKeyError:
+            pass  # another worker materialized it first
+        # The streak breaks when the previous occurrence stayed open or
+        # occurrences were skipped entirely
+        if previous is not None and (
+            template.get("last_completed_occurrence") != previous or rule.before(occurrence) != previous
+        ):
+            update["streak"] = 0
+    await db.todo_templates.update_one(
+        {"id": template["id"], "next_due": template["next_due"]},
+        {"$set": update, "$inc": {"version": 1}}
+    )
+    return created
+
+async def record_recurring_completion(template_id: str, occurrence: datetime):
+    """Extend the template's streak when its current occurrence is completed"""
+    streak = {"$add": ["$streak", 1]}
+    await db.todo_templates.update_one(
+        {"id": template_id, "last_occurrence": occurrence, "last_completed_occurrence": {"$ne": occurrence}},
+        [{"$set": {
+            "streak": streak,
+            "best_streak": {"$max": ["$best_streak", streak]},
+            "last_completed_occurrence": occurrence,
+            "version": {"$add": ["$version", 1]}
+        }}]
+    )
 
 # Game Endpoints
 @api_router.get("/game/stats", response_model=GameStats)
-async def get_game_stats():
+async def get_game_stats_endpoint(request: Request):
     """Get current game statistics"""
-    stats = await db.game_stats.find_one({"user_id": "default_user"})
+    return await serve_read(request, "game_stats", get_game_stats)
+
+async def get_game_stats() -> GameStats:
+    """Load the current game statistics, creating defaults on first use"""
+    stats, pending = await write_behind.read(
+        "default_user", lambda: read_coalescer.do("game_stats", _load_game_stats)
+    )
+    return with_pending_deltas(stats, pending)
+
+def with_pending_deltas(stats: GameStats, pending: dict) -> GameStats:
+    """Apply write-behind deltas not yet flushed, the same way the flush will"""
+    if not pending:
+        return stats
+    total_completed = stats.total_todos_completed + pending.get("total_todos_completed", 0)
+    current_streak = stats.current_streak + pending.get("current_streak", 0)
+    return stats.copy(update={
+        "coins": stats.coins + pending.get("coins", 0),
+        "total_todos_completed": total_completed,
+        "level": calculate_level_from_exp(total_completed * 10),
+        "current_streak": current_streak,
+        "best_streak": max(stats.best_streak, current_streak)
+    })
+
+async def _load_game_stats() -> GameStats:
+    stats = await db.game_stats.find_one({"user_id": "default_user"}, {OUTBOX: 0})
     if not stats:
         # Create default stats if they don't exist
         default_stats = GameStats()
-        await db.game_stats.insert_one(default_stats.dict())
+        try:
+            await db.game_stats.insert_one(default_stats.dict())
+        except DuplicateKeyError:
+            # A concurrent request created them first
+            return GameStats(**await db.game_stats.find_one({"user_id": "default_user"}, {OUTBOX: 0}))
+        # The ledger replays from this initial state
+        await db.game_stats_snapshots.insert_one(
+            {"user_id": "default_user", "seq": 0, "taken_at": default_stats.last_activity, "stats": default_stats.dict()}
+        )
         return default_stats
     return GameStats(**stats)
 
-@api_router.post("/game/stats", response_model=GameStats)
-async def update_game_stats(stats_update: GameStatsUpdate):
-    """Update game statistics"""
-    # Get current stats
-    current_stats = await db.game_stats.find_one({"user_id": "default_user"})
-    if not current_stats:
-        current_stats = GameStats().dict()
+@api_router.post("/game/stats", response_model=GameStats, dependencies=[Depends(database_guard)])
+async def update_game_stats(
+    stats_update: GameStatsUpdate,
+    response: Response,
+    if_match: Optional[str] = Header(None)
+):
+    """Update game statistics (optionally conditional on If-Match: "<version>")"""
+    expected_version = parse_if_match(if_match)
+    # Buffered rewards land first so the values set here are final
+    await write_behind.flush("default_user")
     
     # Update fields
     update_dict = {k: v for k, v in stats_update.dict().items() if v is not None}
-    update_dict["last_activity"] = datetime.now(timezone.utc)
+    entry = event("adjust", datetime.now(timezone.utc), assign=update_dict)
     
-    await db.game_stats.update_one(
-        {"user_id": "default_user"}, 
-        {"$set": update_dict}, 
-        upsert=True
+    query = {"user_id": "default_user"}
+    if expected_version is not None:
+        await get_game_stats()  # make sure the document exists before a conditional write
+        query.update(version_filter(expected_version))
+    
+    defaults = {k: v for k, v in GameStats().dict().items() if k not in entry["set"] and k != "version"}
+    updated_stats = await db.game_stats.find_one_and_update(
+        query,
+        {"$set": entry["set"], "$inc": entry["inc"], "$setOnInsert": defaults, "$push": {OUTBOX: entry}},
+        {OUTBOX: 0},
+        upsert=expected_version is None,
+        return_document=ReturnDocument.AFTER
     )
+    read_coalescer.forget("game_stats")
+    if not updated_stats:
+        raise HTTPException(status_code=412, detail="Game stats were modified by another request")
     
-    # Return updated stats
-    updated_stats = await db.game_stats.find_one({"user_id": "default_user"})
-    return GameStats(**updated_stats)
+    stats = GameStats(**updated_stats)
+    response.headers["ETag"] = etag(stats.version)
+    return stats
 
 @api_router.get("/game/upgrades")
-async def get_available_upgrades():
+async def get_available_upgrades(request: Request):
     """Get available upgrades with current levels"""
+    return await serve_read(request, "upgrades", list_upgrades)
+
+async def list_upgrades() -> List[Upgrade]:
     stats = await get_game_stats()
     
     upgrades = []
     for upgrade_config in AVAILABLE_UPGRADES:
-        # Calculate current level based on effect type
-        current_level = 0
-        if upgrade_config["effect"] == "mining_power":
-            current_level = max(0, stats.mining_power - 1)  # Base mining power is 1
-        elif upgrade_config["effect"] == "auto_mining":
-            current_level = stats.auto_miners
-        elif upgrade_config["effect"] == "efficiency":
-            current_level = 0  # For now, efficiency is not tracked separately
-        
-        # Calculate cost with exponential scaling
-        cost = upgrade_config["base_cost"] * (2 ** current_level)
+        current_level = upgrade_level(upgrade_config, stats)
+        cost = upgrade_cost(upgrade_config, current_level)
         
         upgrade = Upgrade(
             id=upgrade_config["id"],
@@ -257,7 +1092,7 @@ async def get_available_upgrades():
     
     return upgrades
 
-@api_router.post("/game/upgrade/{upgrade_id}")
+@api_router.post("/game/upgrade/{upgrade_id}", dependencies=[Depends(database_guard)])
 async def purchase_upgrade(upgrade_id: str):
     """Purchase an upgrade"""
     # Find upgrade config
@@ -265,130 +1100,431 @@ async def purchase_upgrade(upgrade_id: str):
     if not upgrade_config:
         raise HTTPException(status_code=404, detail="Upgrade not found")
     
-    # Get current stats
-    stats = await get_game_stats()
-    
-    # Calculate current level based on effect type
-    current_level = 0
-    if upgrade_config["effect"] == "mining_power":
-        current_level = max(0, stats.mining_power - 1)  # Base mining power is 1
-    elif upgrade_config["effect"] == "auto_mining":
-        current_level = stats.auto_miners
-    elif upgrade_config["effect"] == "efficiency":
-        current_level = 0  # For now, efficiency is not tracked separately
-    
-    # Check if already at max level
-    if current_level >= upgrade_config["max_level"]:
-        raise HTTPException(status_code=400, detail="Upgrade already at max level")
-    
-    # Calculate cost
-    cost = upgrade_config["base_cost"] * (2 ** current_level)
-    
-    # Check if user has enough coins
-    if stats.coins < cost:
-        raise HTTPException(status_code=400, detail="Not enough coins")
+    # Settle pending auto-mining so a new miner doesn't earn retroactively
+    if upgrade_config["effect"] == "auto_mining":
+        await settle_auto_mining()
+    # The conditional spend below checks the stored balance
+    await write_behind.flush("default_user")
     
-    # Prepare update dictionary
-    update_dict = {
-        "coins": stats.coins - cost,
-        "last_activity": datetime.now(timezone.utc)
-    }
-    
-    # Apply upgrade effect
-    if upgrade_config["effect"] == "mining_power":
-        update_dict["mining_power"] = stats.mining_power + 1
-    elif upgrade_config["effect"] == "auto_mining":
-        update_dict["auto_miners"] = stats.auto_miners + 1
-        update_dict["auto_mining_rate"] = (stats.auto_miners + 1) * 1.0  # 1 coin per minute per auto miner
-    elif upgrade_config["effect"] == "efficiency":
-        # For efficiency upgrade, we could increase auto_mining_rate multiplier
-        # For now, just increase auto_mining_rate by 50%
-        current_rate = stats.auto_mining_rate
-        update_dict["auto_mining_rate"] = current_rate * 1.5
-    
-    # Update the database
-    result = await db.game_stats.update_one(
-        {"user_id": "default_user"}, 
-        {"$set": update_dict},
-        upsert=True
-    )
-    
-    # Verify the update was successful
-    if result.modified_count == 0 and result.upserted_id is None:
-        raise HTTPException(status_code=500, detail="Failed to update game stats")
+    for _ in range(PURCHASE_ATTEMPTS):
+        stats = await get_game_stats()
+        current_level = upgrade_level(upgrade_config, stats)
+        
+        # Check if already at max level
+        if current_level >= upgrade_config["max_level"]:
+            raise HTTPException(status_code=400, detail="Upgrade already at max level")
+        
+        cost = upgrade_cost(upgrade_config, current_level)
+        
+        # Check if user has enough coins
+        if stats.coins < cost:
+            raise HTTPException(status_code=400, detail="Not enough coins")
+        
+        # Spend and apply the effect in one conditional update: it only
+        # matches while the balance still covers the cost and the level is
+        # still the one the cost was computed for
+        query = {"user_id": "default_user", "coins": {"$gte": cost}}
+        inc, assign = {"coins": -cost}, {}
+        if upgrade_config["effect"] == "mining_power":
+            query["mining_power"] = stats.mining_power
+            inc["mining_power"] = 1
+        elif upgrade_config["effect"] == "auto_mining":
+            query["auto_miners"] = stats.auto_miners
+            inc["auto_miners"] = 1
+            assign["auto_mining_rate"] = (stats.auto_miners + 1) * 1.0  # 1 coin per minute per auto miner
+        elif upgrade_config["effect"] == "efficiency":
+            # For now, just increase auto_mining_rate by 50%
+            query["auto_mining_rate"] = stats.auto_mining_rate
+            assign["auto_mining_rate"] = stats.auto_mining_rate * 1.5
+        
+        entry = event("purchase", datetime.now(timezone.utc), inc=inc, assign=assign, upgrade_id=upgrade_id)
+        result = await db.game_stats.update_one(
+            query, {"$inc": entry["inc"], "$set": entry["set"], "$push": {OUTBOX: entry}}
+        )
+        read_coalescer.forget("game_stats")
+        if result.modified_count:
+            return {
+                "message": f"Upgrade {upgrade_config['name']} purchased successfully",
+                "cost": cost,
+                "new_level": current_level + 1
+            }
+        # Coins or level changed underneath us; re-check against fresh stats
     
-    return {
-        "message": f"Upgrade {upgrade_config['name']} purchased successfully",
-        "cost": cost,
-        "new_level": current_level + 1
-    }
+    raise HTTPException(status_code=409, detail="Purchase conflicted with concurrent updates, please retry")
 
 # Helper function to award completion rewards
-async def award_completion_rewards(priority: Priority):
-    """Award coins and experience for completing a todo"""
-    stats = await get_game_stats()
+def stats_field(name: str, default):
+    # Stats documents created by partial upserts may lack fields
+    return {"$ifNull": [f"${name}", default]}
+
+# Completions whose daily rollup write failed in this worker
+rollup_failures = 0
+
+async def award_completion_rewards(priority: Priority, category: TodoCategory = TodoCategory.OTHER):
+    """Award coins and experience for completing a todo.
+
+    Runs as a single pipeline update so the reward uses the mining power at
+    write time and concurrent purchases or completions can't be lost. With
+    write-behind enabled the reward is buffered instead, priced at the
+    mining power this worker currently sees: an upgrade bought in the same
+    flush interval (or on another worker) is not reflected yet, so the
+    coins may be priced at the old power. The ledger and the rollup both
+    record that buffered amount, so they still agree with each other.
     
-    # Calculate rewards
-    coin_reward = calculate_coin_reward(priority) * stats.mining_power
-    exp_reward = calculate_exp_reward(priority)
+    The completion is then added to today's rollup in a separate write.
+    The reward is already committed by then, so a failed rollup write is
+    logged and counted in ``rollup_failures`` (``/api/metrics/rollups``)
+    rather than failing the completion; that day's history undercounts.
+    """
+    coin_reward = calculate_coin_reward(priority)
+    if WRITE_BEHIND_ENABLED:
+        stats = await get_game_stats()
+        coins = coin_reward * stats.mining_power
+        write_behind.add("default_user", {
+            "coins": coins,
+            "total_todos_completed": 1,
+            "current_streak": 1
+        })
+        level = calculate_level_from_exp((stats.total_todos_completed + 1) * 10)
+    else:
+        updated = await apply_stats_deltas(
+            "default_user",
+            coins={"$multiply": [coin_reward, stats_field("mining_power", 1)]},
+            total_todos_completed=1,
+            current_streak=1
+        )
+        # The update leaves mining power alone, so this is the price it used
+        coins = coin_reward * updated.get("mining_power", 1)
+        level = updated["level"]
+    try:
+        await db.stats_daily.update_one(
+            {"user_id": "default_user", "day": day_of(datetime.now(timezone.utc))},
+            completion_update(coins, level, priority.value, category.value),
+            upsert=True
+        )
+    except PyMongoError:
+        global rollup_failures
+        rollup_failures += 1
+        logger.exception("Could not add a completion worth %s coins to the daily rollup", coins)
+
+async def apply_stats_deltas(user_id: str, coins=0, total_todos_completed: int = 0, current_streak: int = 0) -> dict:
+    """Add to coins and the completion counters, keeping level and best streak derived.
+
+    Returns the updated stats document.
+    """
+    new_total_completed = {"$add": [stats_field("total_todos_completed", 0), total_todos_completed]}
+    new_streak = {"$add": [stats_field("current_streak", 0), current_streak]}
+    # The ledger entry records what these expressions evaluate to
+    entry = event(
+        "award",
+        datetime.now(timezone.utc),
+        inc={"coins": coins, "total_todos_completed": total_todos_completed, "current_streak": current_streak},
+        assign={
+            # Same as calculate_level_from_exp(total_todos_completed * 10)
+            "level": {"$max": [1, {"$toInt": {"$add": [{"$floor": {"$divide": [new_total_completed, 10]}}, 1]}}]},
+            "best_streak": {"$max": [stats_field("best_streak", 0), new_streak]}
+        }
+    )
     
-    # Calculate new totals
-    new_coins = stats.coins + coin_reward
-    new_total_completed = stats.total_todos_completed + 1
-    new_level = calculate_level_from_exp(new_total_completed * 10)  # Simple level calculation
+    pipeline = [{"$set": {
+        "coins": {"$add": [stats_field("coins", 0), coins]},
+        "total_todos_completed": new_total_completed,
+        # Update streak (simplified - just increment for now)
+        "current_streak": new_streak,
+        **entry["set"],
+        "version": {"$add": [stats_field("version", 0), 1]},
+        OUTBOX: pipeline_append(entry)
+    }}]
     
-    # Update streak (simplified - just increment for now)
-    new_streak = stats.current_streak + 1
-    new_best_streak = max(stats.best_streak, new_streak)
+    updated = await db.game_stats.find_one_and_update(
+        {"user_id": user_id}, pipeline, {OUTBOX: 0}, return_document=ReturnDocument.AFTER
+    )
+    if updated is None:
+        await _load_game_stats()  # creates the default document
+        updated = await db.game_stats.find_one_and_update(
+            {"user_id": user_id}, pipeline, {OUTBOX: 0}, return_document=ReturnDocument.AFTER
+        )
+    read_coalescer.forget("game_stats")
+    return updated
+
+# Productivity history from the daily rollups (rollups.py)
+MAX_HISTORY_DAYS = 3650
+MAX_HISTORY_POINTS = 366
+
+@api_router.get("/stats/history")
+async def get_stats_history(request: Request, days: int = 30, points: int = 90):
+    """Completions, coins earned and level over the last ``days`` (today included).
+
+    Ranges longer than ``points`` days are downsampled into buckets of
+    ``bucket_days`` whole days each.
+    """
+    days = max(1, min(days, MAX_HISTORY_DAYS))
+    points = max(1, min(points, MAX_HISTORY_POINTS))
+    return await serve_read(request, f"stats_history:{days}:{points}", lambda: load_stats_history(days, points))
+
+async def load_stats_history(days: int, points: int) -> dict:
+    end = day_of(datetime.now(timezone.utc)) + timedelta(days=1)
+    start = end - timedelta(days=days)
     
-    # Update database
-    await db.game_stats.update_one(
-        {"user_id": "default_user"},
-        {"$set": {
-            "coins": new_coins,
-            "total_todos_completed": new_total_completed,
-            "level": new_level,
-            "current_streak": new_streak,
-            "best_streak": new_best_streak,
-            "last_activity": datetime.now(timezone.utc)
-        }},
-        upsert=True
+    # Level carried in from the last active day before the range
+    before = await db.stats_daily.find_one(
+        {"user_id": "default_user", "day": {"$lt": start}}, {"level": 1}, sort=[("day", -1)]
+    )
+    rollups = await db.stats_daily.find(
+        {"user_id": "default_user", "day": {"$gte": start, "$lt": end}}, {"_id": 0}
+    ).sort("day", 1).to_list(days)
+    history = downsample(rollups, start, end, points, initial_level=before["level"] if before else 1)
+    return {"start": start.date().isoformat(), "days": days, **history}
+
+# Auto-mining settlement
+async def settle_auto_mining() -> dict:
+    """Credit auto miners for every whole minute since the last settlement.
+
+    The settlement marker (``last_auto_mined_at``) only advances by whole
+    minutes and is compared-and-swapped, so the frontend timer and the
+    background job can both call this without crediting a minute twice.
+    """
+    stats_doc = await db.game_stats.find_one({"user_id": "default_user"}, {OUTBOX: 0})
+    if not stats_doc:
+        stats = await get_game_stats()
+        return {"coins_earned": 0, "new_total": stats.coins}
+
+    now = datetime.now(timezone.utc)
+    last_mined = stats_doc.get("last_auto_mined_at")
+    if last_mined is None:
+        await db.game_stats.update_one(
+            {"user_id": "default_user", "last_auto_mined_at": None},
+            {"$set": {"last_auto_mined_at": now}}
+        )
+        read_coalescer.forget("game_stats")
+        return {"coins_earned": 0, "new_total": stats_doc.get("coins", 0)}
+    if last_mined.tzinfo is None:
+        last_mined = last_mined.replace(tzinfo=timezone.utc)
+
+    minutes = int((now - last_mined).total_seconds() // 60)
+    coins_earned = stats_doc.get("auto_miners", 0) * minutes
+    if minutes <= 0:
+        return {"coins_earned": 0, "new_total": stats_doc.get("coins", 0)}
+
+    entry = event("auto_mine", now, inc={"coins": coins_earned}, minutes=minutes)
+    result = await db.game_stats.update_one(
+        {"user_id": "default_user", "last_auto_mined_at": stats_doc["last_auto_mined_at"]},
+        {
+            "$inc": entry["inc"],
+            "$set": {**entry["set"], "last_auto_mined_at": last_mined + timedelta(minutes=minutes)},
+            "$push": {OUTBOX: entry}
+        }
     )
+    read_coalescer.forget("game_stats")
+    if result.modified_count == 0:
+        # Another worker settled concurrently
+        coins_earned = 0
+    stats = await get_game_stats()
+    return {"coins_earned": coins_earned, "new_total": stats.coins}
 
-# Auto-mining endpoint (to be called periodically from frontend)
-@api_router.post("/game/auto-mine")
+# Auto-mining endpoint (called periodically from frontend)
+@api_router.post("/game/auto-mine", dependencies=[Depends(database_guard)])
 async def process_auto_mining():
     """Process auto mining rewards"""
-    stats = await get_game_stats()
-    
-    if stats.auto_miners > 0:
-        # Calculate time since last activity (simplified to 1 minute for now)
-        coins_earned = stats.auto_miners * 1  # 1 coin per auto miner per call
-        
-        await db.game_stats.update_one(
-            {"user_id": "default_user"},
-            {"$set": {
-                "coins": stats.coins + coins_earned,
-                "last_activity": datetime.now(timezone.utc)
-            }}
+    return await settle_auto_mining()
+
+# Reward ledger (ledger.py): every game_stats write appends an event to the
+# document's outbox; these move it to reward_ledger and take snapshots
+async def flush_reward_ledger(user_id: str = "default_user") -> int:
+    """Move outbox events into the ledger; safe to run concurrently or after a crash"""
+    document = await db.game_stats.find_one({"user_id": user_id}, {OUTBOX: 1, FLUSHED: 1})
+    entries = ledger_entries(user_id, document) if document else []
+    if not entries:
+        return 0
+    try:
+        await db.reward_ledger.insert_many(entries, ordered=False)
+    except BulkWriteError as e:
+        # Entries inserted by an earlier flush that didn't get to trim the outbox
+        if any(error["code"] != 11000 for error in e.details["writeErrors"]):
+            raise
+    await db.game_stats.update_one(
+        {"user_id": user_id, FLUSHED: document.get(FLUSHED)},
+        {"$pull": {OUTBOX: {"id": {"$in": [entry["id"] for entry in entries]}}}, "$inc": {FLUSHED: len(entries)}}
+    )
+    return len(entries)
+
+async def snapshot_game_stats(user_id: str = "default_user") -> Optional[int]:
+    """Snapshot the stats with the number of ledger events they include"""
+    document = await db.game_stats.find_one({"user_id": user_id})
+    if not document:
+        return None
+    seq = events_included(document)
+    try:
+        await db.game_stats_snapshots.insert_one({
+            "user_id": user_id,
+            "seq": seq,
+            "taken_at": datetime.now(timezone.utc),
+            "stats": GameStats(**document).dict()
+        })
+    except DuplicateKeyError:
+        pass  # nothing changed since the last snapshot
+    await flush_reward_ledger(user_id)
+    return seq
+
+async def replay_game_stats(user_id: str = "default_user") -> GameStats:
+    """Rebuild the stats from the latest snapshot, the ledger tail after it and the outbox"""
+    document = await db.game_stats.find_one({"user_id": user_id}, {OUTBOX: 1, FLUSHED: 1})
+    snapshot = await db.game_stats_snapshots.find_one(
+        {"user_id": user_id, "seq": {"$lte": events_included(document or {})}}, sort=[("seq", -1)]
+    )
+    after, until = tail_range(document, snapshot)
+    tail = await db.reward_ledger.find(
+        {"user_id": user_id, "seq": {"$gt": after, "$lte": until}}, {"_id": 0}
+    ).sort("seq", 1).to_list(None)
+    return GameStats(**rebuild(user_id, document, snapshot, tail, GameStats(user_id=user_id).dict()))
+
+# Archival of old completed todos
+async def archive_completed_todos(older_than_days: int, batch_size: int = 500) -> int:
+    """Move completed todos older than the cutoff into ``todos_archive``.
+
+    Each batch is copied, then deleted; a run interrupted in between is
+    finished by the next one, which finds the copies already there.
+    """
+    cutoff = datetime.now(timezone.utc) - timedelta(days=older_than_days)
+    query = todo_query({"completed": True, "completed_at": {"$lt": cutoff}}, await legacy_todos.may_exist(db.todos))
+    archived = 0
+    while True:
+        batch = await db.todos.find(query).to_list(batch_size)
+        if not batch:
+            return archived
+        try:
+            await db.todos_archive.insert_many(batch, ordered=False)
+        except BulkWriteError as e:
+            # Copied by an earlier run that didn't get to the delete
+            if any(error["code"] != 11000 for error in e.details["writeErrors"]):
+                raise
+        await db.todos.delete_many({"_id": {"$in": [todo["_id"] for todo in batch]}})
+        read_coalescer.forget("todos")
+        archived += len(batch)
+
+def register_jobs():
+    """Register periodic jobs with the scheduler"""
+    scheduler.add_job(
+        "auto_mining_settlement",
+        settle_auto_mining,
+        interval=float(os.environ.get("AUTO_MINING_INTERVAL", "60")),
+        timeout=10
+    )
+    scheduler.add_job(
+        "rank_rebalance",
+        rebalance_ranks,
+        interval=float(os.environ.get("RANK_REBALANCE_INTERVAL", "3600")),
+        timeout=RANK_REBALANCE_TIMEOUT
+    )
+    scheduler.add_job(
+        "reward_ledger_flush",
+        flush_reward_ledger,
+        interval=float(os.environ.get("LEDGER_FLUSH_INTERVAL", "10")),
+        timeout=30
+    )
+    scheduler.add_job(
+        "game_stats_snapshot",
+        snapshot_game_stats,
+        interval=float(os.environ.get("LEDGER_SNAPSHOT_INTERVAL", "3600")),
+        timeout=60
+    )
+    scheduler.add_job(
+        "recurring_materialization",
+        materialize_due_templates,
+        interval=float(os.environ.get("RECURRING_INTERVAL", "60")),
+        timeout=30
+    )
+    archive_after_days = int(os.environ.get("TODO_ARCHIVE_AFTER_DAYS", "0"))
+    if archive_after_days > 0:
+        scheduler.add_job(
+            "todo_archival",
+            lambda: archive_completed_todos(archive_after_days),
+            interval=3600,
+            timeout=300
         )
-        
-        return {"coins_earned": coins_earned, "new_total": stats.coins + coins_earned}
-    
-    return {"coins_earned": 0, "new_total": stats.coins}
+
+# Startup: indexes and cache warming
+# (collection, keys, options)
+INDEXES = [
+    *TODO_INDEXES,
+    ("game_stats", [("user_id", 1)], {"unique": True}),
+    ("reward_ledger", [("user_id", 1), ("seq", 1)], {"unique": True}),
+    ("game_stats_snapshots", [("user_id", 1), ("seq", 1)], {"unique": True}),
+    ("stats_daily", [("user_id", 1), ("day", 1)], {"unique": True}),
+    ("todo_templates", [("id", 1)], {"unique": True}),
+    ("todo_templates", [("next_due", 1)], {}),
+]
+
+async def ensure_indexes():
+    """Create missing indexes; existing data conflicts are logged, not fatal"""
+    for collection, keys, options in INDEXES:
+        try:
+            await db[collection].create_index(keys, **options)
+        except OperationFailure as e:
+            logger.error("Could not create index %s on %s: %s", keys, collection, e)
+
+async def warm_caches():
+    """Touch the hot documents so the first user request doesn't pay for it"""
+    await get_game_stats()
+    await legacy_todos.may_exist(db.todos)
+    # Stats that predate the ledger need a snapshot to replay from
+    if not await db.game_stats_snapshots.find_one({"user_id": "default_user"}, {"_id": 1}):
+        await snapshot_game_stats()
 
 # Basic API endpoints
 @api_router.get("/")
 async def root():
     return {"message": "Todo Mining Game API", "version": "1.0.0"}
 
+@api_router.get("/ready")
+async def readiness_check():
+    """Readiness probe of the worker that answers: 503 until MongoDB is reachable and startup finished"""
+    if not readiness["ready"]:
+        return JSONResponse(status_code=503, content={"status": "starting", "error": readiness["error"], "pid": os.getpid()})
+    return {"status": "ready", "ready_after_ms": readiness["ready_after_ms"], "pid": os.getpid()}
+
+@api_router.get("/metrics/coalescing")
+async def get_coalescing_metrics():
+    """How many concurrent identical reads were collapsed in this worker"""
+    return {**read_coalescer.status(), "pid": os.getpid()}
+
+@api_router.get("/metrics/write-behind")
+async def get_write_behind_metrics():
+    """Buffered reward deltas in this worker"""
+    return {**write_behind.status(), "enabled": WRITE_BEHIND_ENABLED, "pid": os.getpid()}
+
+@api_router.get("/metrics/rollups")
+async def get_rollup_metrics():
+    """Completions this worker could not add to the daily rollups"""
+    return {"failures": rollup_failures, "pid": os.getpid()}
+
+@api_router.get("/metrics/pool")
+async def get_pool_metrics():
+    """Connection pool utilization for this worker"""
+    return {**pool_metrics.snapshot(mongo_settings.max_pool_size), "pid": os.getpid()}
+
 @api_router.get("/health")
 async def health_check():
-    return {"status": "healthy", "timestamp": datetime.now(timezone.utc)}
+    return {
+        "status": "healthy",
+        "timestamp": datetime.now(timezone.utc),
+        "worker": worker_info(),
+        "database": mongo_breaker.status()
+    }
 
 # Include the router in the main app
 app.include_router(api_router)
 
+@app.exception_handler(DatabaseUnavailable)
+@app.exception_handler(ConnectionFailure)
+@app.exception_handler(ExecutionTimeout)
+async def database_unavailable_handler(request: Request, exc: Exception):
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "Database unavailable"},
+        headers={"Retry-After": str(int(mongo_breaker.reset_timeout))}
+    )
+
 app.add_middleware(
     CORSMiddleware,
     allow_credentials=True,
@@ -397,13 +1533,27 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+if capture_writer is not None:
+    app.add_middleware(TrafficCaptureMiddleware, writer=capture_writer)
+
+app.add_middleware(
+    CompressionMiddleware,
+    minimum_size=int(os.environ.get("COMPRESSION_MIN_SIZE", "1024")),
 )
-logger = logging.getLogger(__name__)
 
-@app.on_event("shutdown")
-async def shutdown_db_client():
-    client.close()
+# Opt-in request profiling (secret X-Profile header and/or sampling)
+profile_secret = os.environ.get("PROFILE_SECRET", "")
+profile_sample_rate = float(os.environ.get("PROFILE_SAMPLE_RATE", "0"))
+if profile_secret or profile_sample_rate > 0:
+    app.add_middleware(
+        ProfilingMiddleware,
+        output_dir=os.environ.get("PROFILE_DIR", "/tmp/profiles"),
+        secret=profile_secret,
+        sample_rate=profile_sample_rate,
+    )
+
+# Per-request access logs, sampled per route
+app.add_middleware(
+    RequestLogMiddleware,
+    sample_rates=parse_sample_rates(os.environ.get("LOG_SAMPLE_RATES", "")),
+)
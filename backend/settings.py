@@ -0,0 +1,79 @@
+"""Typed settings read from the environment (backend/.env is loaded first).
+
+Only MongoDB client tuning lives here for now. Every field maps to an
+upper-case ``MONGO_*`` variable; unset variables keep the defaults below,
+which match the driver's own defaults except for the shorter server
+selection timeout (so startup retries instead of blocking for 30 s).
+"""
+import os
+from typing import List, Optional
+
+from pydantic import BaseModel, Field, field_validator
+
+READ_PREFERENCES = ("primary", "primaryPreferred", "secondary", "secondaryPreferred", "nearest")
+COMPRESSORS = ("zstd", "snappy", "zlib")
+
+
+class MongoSettings(BaseModel):
+    url: str
+    db_name: str
+    min_pool_size: int = Field(default=0, ge=0)
+    max_pool_size: int = Field(default=100, ge=1)
+    max_idle_time_ms: Optional[int] = Field(default=None, ge=0)
+    wait_queue_timeout_ms: Optional[int] = Field(default=None, ge=0)
+    # Wire compression, in order of preference; the server picks the first it supports
+    compressors: List[str] = Field(default_factory=list)
+    zlib_compression_level: int = Field(default=-1, ge=-1, le=9)
+    read_preference: str = "primary"
+    server_selection_timeout_ms: int = Field(default=5000, ge=0)
+    connect_timeout_ms: int = Field(default=20000, ge=0)
+    socket_timeout_ms: Optional[int] = Field(default=None, ge=0)
+    # Client-wide deadline for each operation, including retries (timeoutMS)
+    operation_timeout_ms: Optional[int] = Field(default=None, ge=0)
+
+    @field_validator("compressors", mode="before")
+    @classmethod
+    def split_compressors(cls, value):
+        if isinstance(value, str):
+            value = [name.strip() for name in value.split(",") if name.strip()]
+        unknown = set(value) - set(COMPRESSORS)
+        if unknown:
+            raise ValueError(f"unknown compressors: {', '.join(sorted(unknown))}")
+        return value
+
+    @field_validator("read_preference")
+    @classmethod
+    def check_read_preference(cls, value):
+        if value not in READ_PREFERENCES:
+            raise ValueError(f"read_preference must be one of {', '.join(READ_PREFERENCES)}")
+        return value
+
+    @classmethod
+    def from_env(cls) -> "MongoSettings":
+        values = {"url": os.environ["MONGO_URL"], "db_name": os.environ["DB_NAME"]}
+        for name in cls.model_fields:
+            env_value = os.environ.get(f"MONGO_{name.upper()}")
+            if env_value not in (None, "") and name not in values:
+                values[name] = env_value
+        return cls(**values)
+
+    def client_kwargs(self) -> dict:
+        """Keyword arguments for AsyncIOMotorClient"""
+        kwargs = {
+            "minPoolSize": self.min_pool_size,
+            "maxPoolSize": self.max_pool_size,
+            "readPreference": self.read_preference,
+            "serverSelectionTimeoutMS": self.server_selection_timeout_ms,
+            "connectTimeoutMS": self.connect_timeout_ms,
+        }
+        if self.compressors:
+            kwargs["compressors"] = ",".join(self.compressors)
+            kwargs["zlibCompressionLevel"] = self.zlib_compression_level
+        optional = {
+            "maxIdleTimeMS": self.max_idle_time_ms,
+            "waitQueueTimeoutMS": self.wait_queue_timeout_ms,
+            "socketTimeoutMS": self.socket_timeout_ms,
+            "timeoutMS": self.operation_timeout_ms,
+        }
+        kwargs.update({key: value for key, value in optional.items() if value is not None})
+        return kwargs
@@ -0,0 +1,52 @@
+"""Single-flight coalescing of concurrent identical reads.
+
+Concurrent callers asking for the same key share one in-flight call and its
+result instead of each doing their own database round trip and validation.
+Nothing is kept after the call finishes. Writers call ``forget`` right after
+their write so that reads arriving later never join a call that started
+before the write.
+"""
+import asyncio
+from typing import Any, Awaitable, Callable, Dict
+
+
+class SingleFlight:
+    def __init__(self):
+        self._in_flight: Dict[str, asyncio.Task] = {}
+        self.calls = 0
+        self.executions = 0
+
+    @property
+    def collapsed(self) -> int:
+        return self.calls - self.executions
+
+    async def do(self, key: str, func: Callable[[], Awaitable[Any]]) -> Any:
+        self.calls += 1
+        task = self._in_flight.get(key)
+        if task is None:
+            self.executions += 1
+            task = asyncio.ensure_future(func())
+            self._in_flight[key] = task
+            task.add_done_callback(lambda done, key=key: self._release(key, done))
+        # Shielded so one caller timing out doesn't cancel the others' call
+        return await asyncio.shield(task)
+
+    def _release(self, key: str, task: asyncio.Task):
+        if self._in_flight.get(key) is task:
+            del self._in_flight[key]
+        if not task.cancelled():
+            # Mark the exception retrieved; every waiter re-raises it anyway
+            task.exception()
+
+    def forget(self, *keys: str):
+        """Stop new callers from joining calls started before a write"""
+        for key in keys:
+            self._in_flight.pop(key, None)
+
+    def status(self) -> dict:
+        return {
+            "calls": self.calls,
+            "executions": self.executions,
+            "collapsed": self.collapsed,
+            "in_flight": len(self._in_flight),
+        }
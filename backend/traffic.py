@@ -0,0 +1,136 @@
+"""API traffic capture to NDJSON.
+
+``TrafficCaptureMiddleware`` appends one JSON line per API request to
+``TRAFFIC_CAPTURE_FILE``: the wall-clock arrival time (so captures from
+several workers can be merged), method, path, query string, the request
+headers in ``CAPTURED_HEADERS``, request body and the response status
+and body. Lines are written by a background thread so the event loop never
+waits on disk. ``scripts/replay_traffic.py`` replays a capture.
+
+Only headers that change what the API answers are kept, so a replay takes
+the same conditional-write and negotiation paths; credentials, cookies and
+the profiling secret never reach the capture file.
+"""
+import base64
+import json
+import queue
+import threading
+import time
+from pathlib import Path
+
+from starlette.datastructures import Headers
+
+# Largest response body kept for diffing on replay
+MAX_CAPTURED_RESPONSE = 64 * 1024
+# Larger request bodies (bulk imports) are not kept; the entry is marked truncated
+MAX_CAPTURED_REQUEST = 1024 * 1024
+# Request headers worth replaying: preconditions and content negotiation
+CAPTURED_HEADERS = ("accept", "accept-encoding", "content-type", "if-match", "if-none-match")
+
+
+def encode_body(body: bytes, content_type: str) -> dict:
+    """Store text bodies as-is and anything else as base64"""
+    if not body:
+        return {"body": None}
+    if "json" in content_type or content_type.startswith("text/"):
+        try:
+            return {"body": body.decode("utf-8")}
+        except UnicodeDecodeError:
+            pass
+    return {"body_b64": base64.b64encode(body).decode("ascii")}
+
+
+def decode_body(entry: dict, prefix: str = "") -> bytes:
+    if entry.get(prefix + "body_b64") is not None:
+        return base64.b64decode(entry[prefix + "body_b64"])
+    return (entry.get(prefix + "body") or "").encode("utf-8")
+
+
+class CaptureWriter(threading.Thread):
+    def __init__(self, path: str):
+        super().__init__(name="traffic-capture", daemon=True)
+        self.path = Path(path)
+        self.queue: queue.SimpleQueue = queue.SimpleQueue()
+
+    def run(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self.path.open("a", encoding="utf-8") as capture_file:
+            while True:
+                entry = self.queue.get()
+                if entry is None:
+                    return
+                capture_file.write(json.dumps(entry, separators=(",", ":")) + "\n")
+                if self.queue.empty():
+                    capture_file.flush()
+
+    def stop(self):
+        self.queue.put(None)
+        self.join()
+
+
+class TrafficCaptureMiddleware:
+    def __init__(self, app, writer: CaptureWriter, prefix: str = "/api"):
+        self.app = app
+        self.writer = writer
+        self.prefix = prefix
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not scope["path"].startswith(self.prefix):
+            await self.app(scope, receive, send)
+            return
+
+        arrived = time.time()
+        request_chunks = []
+        request_size = 0
+        response_chunks = []
+        response_size = 0
+        response_start = {}
+
+        async def capture_receive():
+            nonlocal request_size
+            message = await receive()
+            if message["type"] == "http.request":
+                body = message.get("body", b"")
+                request_size += len(body)
+                if request_size <= MAX_CAPTURED_REQUEST:
+                    request_chunks.append(body)
+                else:
+                    request_chunks.clear()
+            return message
+
+        async def capture_send(message):
+            nonlocal response_size
+            if message["type"] == "http.response.start":
+                response_start.update(message)
+            elif message["type"] == "http.response.body":
+                body = message.get("body", b"")
+                response_size += len(body)
+                if response_size <= MAX_CAPTURED_RESPONSE:
+                    response_chunks.append(body)
+            await send(message)
+
+        try:
+            await self.app(scope, capture_receive, capture_send)
+        finally:
+            request_headers = Headers(scope=scope)
+            response_headers = Headers(raw=response_start.get("headers", []))
+            entry = {
+                "t": round(arrived, 6),
+                "method": scope["method"],
+                "path": scope["path"],
+                "query": scope.get("query_string", b"").decode("latin-1"),
+                "content_type": request_headers.get("content-type", ""),
+                "headers": {
+                    name: ", ".join(request_headers.getlist(name))
+                    for name in CAPTURED_HEADERS if name in request_headers
+                },
+                **encode_body(b"".join(request_chunks), request_headers.get("content-type", "")),
+                "status": response_start.get("status"),
+            }
+            if request_size > MAX_CAPTURED_REQUEST:
+                entry["body_truncated"] = True
+            # Compressed or truncated responses can't be diffed meaningfully
+            if "content-encoding" not in response_headers and response_size <= MAX_CAPTURED_RESPONSE:
+                response = encode_body(b"".join(response_chunks), response_headers.get("content-type", ""))
+                entry.update({"response_" + key: value for key, value in response.items()})
+            self.writer.queue.put(entry)
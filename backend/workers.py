@@ -0,0 +1,32 @@
+"""Multi-worker support.
+
+The backend may run as several uvicorn worker processes (``BACKEND_WORKERS``
+in entrypoint.sh). All game state lives in MongoDB and every state
+transition is a single conditional or atomic update, so workers never need
+to talk to each other. Anything a worker keeps in memory must be declared
+here with how it stays coherent with the other workers; the declarations are
+reported by ``/api/health`` so a deployment can be audited.
+"""
+import os
+from typing import Dict
+
+
+class CacheDeclaration:
+    def __init__(self, name: str, coherence: str):
+        self.name = name
+        self.coherence = coherence
+
+
+_declared: Dict[str, CacheDeclaration] = {}
+
+
+def declare_cache(name: str, coherence: str):
+    """Record a per-process cache and how it stays coherent across workers"""
+    _declared[name] = CacheDeclaration(name, coherence)
+
+
+def worker_info() -> dict:
+    return {
+        "pid": os.getpid(),
+        "caches": {declaration.name: declaration.coherence for declaration in _declared.values()},
+    }
@@ -0,0 +1,249 @@
+"""Write-behind accumulation of high-frequency counter increments.
+
+Instead of writing ``game_stats`` on every event, callers ``add`` deltas
+(coins, completed todos, streak) per user. Deltas are merged in memory and
+flushed as one update per user every ``interval`` seconds, or as soon as a
+user has ``max_pending`` unflushed events.
+
+Reads go through ``read`` so a worker always sees its own writes: it waits
+out a flush in progress, loads, reloads if a flush started meanwhile, and
+hands back the deltas still pending to merge into what it loaded.
+
+A failed flush puts the deltas back for the next attempt. A cancelled one
+does not: the update may already have been applied, so its deltas are
+logged instead of risking a double credit. On shutdown the buffer is
+flushed with retries; whatever still can't be written is appended to a
+spill file, which ``replay_spill`` writes on the next start. Workers share
+the spill file; the one that renames it away first replays it. The claimed
+copy is rewritten after every entry and anything not written is appended
+back to the spill file, so an interrupted replay loses nothing; a copy left
+behind by a process that died mid-replay is claimed on the next start.
+"""
+import asyncio
+import json
+import logging
+import os
+import uuid
+from collections import defaultdict
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+FlushFunc = Callable[[str, Dict[str, int]], Awaitable[None]]
+
+# Seconds a cancelled replay waits for the write in flight, to know whether to keep its entry
+REPLAY_CANCEL_GRACE = 2.0
+
+# Spill copies this process is replaying right now
+_replaying: set = set()
+
+
+def _process_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _read_entries(path: Path) -> List[Dict[str, Any]]:
+    """Spill entries in a file; truncated or malformed lines are logged and skipped"""
+    entries = []
+    for line in path.read_text(encoding="utf-8").splitlines():
+        if not line.strip():
+            continue
+        try:
+            entry = json.loads(line)
+            entries.append({"user_id": entry["user_id"], "deltas": dict(entry["deltas"])})
+        except (ValueError, TypeError, KeyError):
+            logger.error("Skipping unreadable write-behind spill line", extra={"spill_file": str(path), "line": line})
+    return entries
+
+
+def _write_entries(path: Path, entries: List[Dict[str, Any]], mode: str = "w"):
+    with path.open(mode, encoding="utf-8") as spill_file:
+        spill_file.write("".join(json.dumps(entry) + "\n" for entry in entries))
+        spill_file.flush()
+        os.fsync(spill_file.fileno())
+
+
+class WriteBehindBuffer:
+    def __init__(self, flush_func: FlushFunc, spill_path: str, interval: float = 1.0, max_pending: int = 50):
+        self.flush_func = flush_func
+        self.spill_path = Path(spill_path)
+        self.interval = interval
+        self.max_pending = max_pending
+        self._deltas: Dict[str, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+        self._events: Dict[str, int] = defaultdict(int)
+        self._flushing: Dict[str, asyncio.Event] = {}
+        self._generation: Dict[str, int] = defaultdict(int)
+        self._task: Optional[asyncio.Task] = None
+        self._background: set = set()
+        self.flushed_events = 0
+        self.flush_count = 0
+
+    def add(self, user_id: str, deltas: Dict[str, int]):
+        for field, delta in deltas.items():
+            self._deltas[user_id][field] += delta
+        self._events[user_id] += 1
+        if self._events[user_id] >= self.max_pending and user_id not in self._flushing:
+            flush = asyncio.ensure_future(self._flush_quietly(user_id))
+            self._background.add(flush)
+            flush.add_done_callback(self._background.discard)
+
+    def pending(self, user_id: str) -> Dict[str, int]:
+        return dict(self._deltas.get(user_id, {}))
+
+    async def read(self, user_id: str, load: Callable[[], Awaitable[Any]]) -> Tuple[Any, Dict[str, int]]:
+        """Load a user's document and the deltas not yet contained in it"""
+        while True:
+            flushing = self._flushing.get(user_id)
+            if flushing is not None:
+                await flushing.wait()
+                continue
+            generation = self._generation[user_id]
+            value = await load()
+            # A flush that started during the load may or may not be in it
+            if self._generation[user_id] == generation:
+                return value, self.pending(user_id)
+
+    async def flush(self, user_id: Optional[str] = None):
+        """Write pending deltas (for one user or all) to the database"""
+        for user in [user_id] if user_id is not None else list(self._deltas):
+            while user in self._flushing:
+                await self._flushing[user].wait()
+            deltas = self._deltas.pop(user, None)
+            events = self._events.pop(user, 0)
+            if not deltas:
+                continue
+            done = self._flushing[user] = asyncio.Event()
+            self._generation[user] += 1
+            try:
+                await self.flush_func(user, dict(deltas))
+            except Exception:
+                # Put them back (merged with anything added meanwhile) for the next attempt
+                for field, delta in deltas.items():
+                    self._deltas[user][field] += delta
+                self._events[user] += events
+                raise
+            except BaseException:
+                # Cancelled mid-write: the update may have landed, so don't apply it twice
+                logger.error("Write-behind flush cancelled; deltas may not have been applied",
+                             extra={"user_id": user, "deltas": dict(deltas)})
+                raise
+            finally:
+                del self._flushing[user]
+                done.set()
+            self.flushed_events += events
+            self.flush_count += 1
+
+    async def _flush_quietly(self, user_id: Optional[str] = None):
+        try:
+            await self.flush(user_id)
+        except Exception:
+            logger.exception("Write-behind flush failed; deltas kept for retry")
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            await self._flush_quietly()
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name="write-behind")
+
+    async def stop(self, attempts: int = 5):
+        """Flush everything; spill to disk what the database won't take"""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await asyncio.gather(*self._background, return_exceptions=True)
+        delay = 0.2
+        for attempt in range(attempts):
+            try:
+                await self.flush()
+                return
+            except Exception:
+                logger.warning("Write-behind shutdown flush attempt %d failed", attempt + 1)
+                await asyncio.sleep(delay)
+                delay *= 2
+        self.spill()
+
+    def spill(self):
+        if not self._deltas:
+            return
+        with self.spill_path.open("a", encoding="utf-8") as spill_file:
+            for user_id, deltas in self._deltas.items():
+                spill_file.write(json.dumps({"user_id": user_id, "deltas": deltas}) + "\n")
+            spill_file.flush()
+        logger.error("Spilled unflushed deltas for %d user(s) to %s", len(self._deltas), self.spill_path)
+        self._deltas.clear()
+        self._events.clear()
+
+    def _claim_spills(self) -> List[Path]:
+        """Rename the spill file, and copies orphaned by dead processes, to names this process owns"""
+        name = self.spill_path.name
+        candidates = [self.spill_path]
+        for path in self.spill_path.parent.glob(f"{name}.*.replaying"):
+            pid = path.name[len(name) + 1:].split(".")[0].split("-")[0]
+            if path in _replaying or not pid.isdigit():
+                continue
+            # Our own pid here was left by an earlier process that had it
+            if int(pid) == os.getpid() or not _process_alive(int(pid)):
+                candidates.append(path)
+        claimed = []
+        for path in candidates:
+            target = self.spill_path.with_name(f"{name}.{os.getpid()}-{uuid.uuid4().hex[:8]}.replaying")
+            try:
+                os.rename(path, target)
+            except FileNotFoundError:
+                continue  # another worker got there first
+            _replaying.add(target)
+            claimed.append(target)
+        return claimed
+
+    async def replay_spill(self):
+        """Write deltas spilled by an earlier shutdown; whatever isn't written is spilled again"""
+        for claimed in self._claim_spills():
+            try:
+                await self._replay_file(claimed)
+            finally:
+                _replaying.discard(claimed)
+
+    async def _replay_file(self, claimed: Path):
+        entries = _read_entries(claimed)
+        written = 0
+        try:
+            for entry in entries:
+                write = asyncio.ensure_future(self.flush_func(entry["user_id"], entry["deltas"]))
+                try:
+                    await asyncio.shield(write)
+                except asyncio.CancelledError:
+                    # Keep the entry only if its write didn't land
+                    await asyncio.wait([write], timeout=REPLAY_CANCEL_GRACE)
+                    if write.done() and not write.cancelled() and write.exception() is None:
+                        written += 1
+                    elif not write.done():
+                        write.cancel()
+                        logger.error("Spilled write-behind entry interrupted; it may be applied twice", extra=entry)
+                    raise
+                written += 1
+                # A crash from here on must not replay what was just written
+                _write_entries(claimed, entries[written:])
+        finally:
+            if written < len(entries):
+                _write_entries(self.spill_path, entries[written:], mode="a")
+            claimed.unlink()
+        logger.info("Replayed %d spilled write-behind entries", len(entries))
+
+    def status(self) -> dict:
+        return {
+            "pending_users": len(self._deltas),
+            "pending_events": sum(self._events.values()),
+            "flushed_events": self.flushed_events,
+            "flushes": self.flush_count,
+        }
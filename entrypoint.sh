@@ -4,18 +4,40 @@ set -e
 # Start the FastAPI backend
 cd /backend || { echo "Backend directory not found"; exit 1; }
 
-echo "Starting FastAPI backend"
+# One worker process per CPU unless BACKEND_WORKERS says otherwise
+BACKEND_WORKERS=${BACKEND_WORKERS:-$(nproc 2>/dev/null || echo 1)}
+
+echo "Starting FastAPI backend with $BACKEND_WORKERS worker(s)"
 # Start Uvicorn with proper host binding
-uvicorn server:app --host 0.0.0.0 --port 8001 &
+uvicorn server:app --host 0.0.0.0 --port 8001 --workers "$BACKEND_WORKERS" &
 BACKEND_PID=$!
 
-echo "Waiting for backend to start..."
-sleep 30
-
-if ! kill -0 $BACKEND_PID 2>/dev/null; then
-    echo "Backend failed to start at initialization, exiting"
-    exit 1
-fi
+# Each /api/ready answer comes from whichever worker accepted the connection,
+# so keep polling until every worker's pid has answered ready
+echo "Waiting for all $BACKEND_WORKERS backend worker(s) to become ready..."
+READY_TIMEOUT=${READY_TIMEOUT:-120}
+START_TIME=$(date +%s)
+READY_PIDS=""
+until [ "$(echo $READY_PIDS | wc -w)" -ge "$BACKEND_WORKERS" ]; do
+    PID=$(wget -q -T 2 -O - http://127.0.0.1:8001/api/ready 2>/dev/null | sed -n 's/.*"pid":\([0-9]*\).*/\1/p')
+    if [ -n "$PID" ]; then
+        case " $READY_PIDS " in
+            *" $PID "*) ;;
+            *) READY_PIDS="$READY_PIDS $PID" ;;
+        esac
+    fi
+    if ! kill -0 $BACKEND_PID 2>/dev/null; then
+        echo "Backend failed to start at initialization, exiting"
+        exit 1
+    fi
+    if [ $(( $(date +%s) - START_TIME )) -ge "$READY_TIMEOUT" ]; then
+        echo "Backend not ready after ${READY_TIMEOUT}s, exiting"
+        kill $BACKEND_PID
+        exit 1
+    fi
+    sleep 0.2
+done
+echo "Backend ready after $(( $(date +%s) - START_TIME ))s"
 
 # Start Nginx
 nginx -g 'daemon off;' &
@@ -0,0 +1,95 @@
+"""Benchmark streaming bulk import and export of todos.
+
+Streams generated NDJSON (or CSV) rows into POST /api/todos/import, then
+reads everything back from GET /api/todos/export, printing rows per second
+for both. With --server-pid the backend's peak resident memory (VmHWM) is
+read from /proc before and after, to show memory stays bounded.
+
+Run against a backend using a scratch database; imported todos are kept.
+
+Usage: python scripts/bench_bulk.py [--url http://localhost:8001] [--rows 1000000] [--csv] [--server-pid PID]
+"""
+import argparse
+import asyncio
+import json
+import time
+from pathlib import Path
+from typing import Optional
+
+import httpx
+
+PRIORITIES = ["low", "medium", "high"]
+CATEGORIES = ["work", "personal", "health", "learning", "other"]
+CHUNK_ROWS = 2000
+
+
+def peak_rss_mb(pid: Optional[int]) -> Optional[float]:
+    if pid is None:
+        return None
+    for line in Path(f"/proc/{pid}/status").read_text().splitlines():
+        if line.startswith("VmHWM:"):
+            return int(line.split()[1]) / 1024
+    return None
+
+
+async def generate(rows: int, csv_format: bool):
+    if csv_format:
+        yield b"title,description,priority,category,completed\n"
+    chunk = []
+    for i in range(rows):
+        priority, category, completed = PRIORITIES[i % 3], CATEGORIES[i % 5], i % 4 == 0
+        if csv_format:
+            chunk.append(f"bench todo {i},generated,{priority},{category},{str(completed).lower()}\n")
+        else:
+            chunk.append(json.dumps({
+                "title": f"bench todo {i}", "description": "generated",
+                "priority": priority, "category": category, "completed": completed,
+            }) + "\n")
+        if len(chunk) >= CHUNK_ROWS:
+            yield "".join(chunk).encode()
+            chunk = []
+    if chunk:
+        yield "".join(chunk).encode()
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://localhost:8001")
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--csv", action="store_true", help="import CSV instead of NDJSON")
+    parser.add_argument("--server-pid", type=int, help="backend process to read peak RSS from")
+    args = parser.parse_args()
+
+    async with httpx.AsyncClient(base_url=args.url, timeout=None) as client:
+        rss_before = peak_rss_mb(args.server_pid)
+
+        started = time.perf_counter()
+        response = await client.post(
+            "/api/todos/import",
+            content=generate(args.rows, args.csv),
+            headers={"content-type": "text/csv" if args.csv else "application/x-ndjson"},
+        )
+        import_seconds = time.perf_counter() - started
+        summary = response.json()
+        print(f"import: {summary.get('imported')} rows ({summary.get('failed')} failed) in {import_seconds:.1f}s "
+              f"= {args.rows / import_seconds:,.0f} rows/s [HTTP {response.status_code}]")
+
+        started = time.perf_counter()
+        exported = 0
+        exported_bytes = 0
+        async with client.stream("GET", "/api/todos/export") as export:
+            async for line in export.aiter_lines():
+                if line:
+                    exported += 1
+                    exported_bytes += len(line) + 1
+        export_seconds = time.perf_counter() - started
+        print(f"export: {exported} rows, {exported_bytes / 1e6:.0f} MB in {export_seconds:.1f}s "
+              f"= {exported / export_seconds:,.0f} rows/s")
+
+        rss_after = peak_rss_mb(args.server_pid)
+        if rss_before is not None:
+            print(f"backend peak RSS: {rss_before:.0f} MB before, {rss_after:.0f} MB after")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,73 @@
+"""Benchmark bytes on the wire and encode CPU for large todo lists.
+
+Usage: python scripts/bench_compression.py [--todos 10000] [--repeat 5]
+"""
+import argparse
+import gzip
+import json
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+from fastapi.encoders import jsonable_encoder  # noqa: E402
+
+from compression import brotli, msgpack  # noqa: E402
+from server import Priority, Todo, TodoCategory  # noqa: E402
+
+
+def build_todos(count: int) -> list:
+    priorities = list(Priority)
+    categories = list(TodoCategory)
+    return [
+        Todo(
+            title=f"Todo number {i}",
+            description="Write the weekly report and send it to the team" if i % 3 == 0 else "",
+            priority=priorities[i % len(priorities)],
+            category=categories[i % len(categories)],
+            completed=i % 4 == 0,
+        )
+        for i in range(count)
+    ]
+
+
+def timed(fn, repeat: int):
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return result, best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--todos", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    data = jsonable_encoder(build_todos(args.todos))
+
+    encoders = {"json": lambda: json.dumps(data, separators=(",", ":")).encode()}
+    if msgpack is not None:
+        encoders["msgpack"] = lambda: msgpack.packb(data, use_bin_type=True)
+
+    print(f"{args.todos} todos, best of {args.repeat}")
+    print(f"{'format':<18}{'bytes':>12}{'encode ms':>12}")
+    for name, encode in encoders.items():
+        body, encode_time = timed(encode, args.repeat)
+        print(f"{name:<18}{len(body):>12}{encode_time * 1000:>12.2f}")
+
+        compressors = {"+gzip(6)": lambda: gzip.compress(body, compresslevel=6, mtime=0)}
+        if brotli is not None:
+            compressors["+br(4)"] = lambda: brotli.compress(body, quality=4)
+        for suffix, compress in compressors.items():
+            compressed, compress_time = timed(compress, args.repeat)
+            total = (encode_time + compress_time) * 1000
+            print(f"{name + suffix:<18}{len(compressed):>12}{total:>12.2f}")
+
+
+if __name__ == "__main__":
+    main()
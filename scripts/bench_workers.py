@@ -0,0 +1,108 @@
+"""Measure API throughput with 1 to N uvicorn workers.
+
+Starts the backend with each worker count against the MongoDB in
+backend/.env, waits until every worker reports ready, drives the existing
+endpoints with a fixed number of concurrent clients for a fixed duration
+and prints requests per second and the ratio to one worker. Whether more
+workers help depends on the CPUs available to the backend and on how much
+of each request is spent waiting for MongoDB, so run it on the target
+hardware; no reference numbers are kept in the repo.
+
+Usage: python scripts/bench_workers.py [--max-workers 4] [--duration 10] [--clients 64]
+"""
+import argparse
+import asyncio
+import os
+import random
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import httpx
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent / "backend"
+
+# (method, path, json body) mix roughly matching the frontend's traffic
+WORKLOAD = [
+    ("GET", "/api/todos", None),
+    ("GET", "/api/game/stats", None),
+    ("GET", "/api/game/upgrades", None),
+    ("POST", "/api/game/auto-mine", None),
+    ("POST", "/api/todos", {"title": "bench", "priority": "low"}),
+]
+
+
+async def wait_ready(client: httpx.AsyncClient, workers: int, timeout: float = 60.0):
+    """Poll /api/ready until ``workers`` distinct worker pids have answered ready"""
+    ready = set()
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            # A fresh connection each time, so the accepting worker varies
+            response = await client.get("/api/ready", headers={"Connection": "close"})
+            if response.status_code == 200:
+                ready.add(response.json()["pid"])
+                if len(ready) >= workers:
+                    return
+        except httpx.HTTPError:
+            pass
+        await asyncio.sleep(0.1)
+    raise RuntimeError(f"only {len(ready)} of {workers} worker(s) became ready")
+
+
+async def drive(base_url: str, workers: int, clients: int, duration: float) -> tuple:
+    limits = httpx.Limits(max_connections=clients, max_keepalive_connections=clients)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=30.0) as client:
+        await wait_ready(client, workers)
+        completed = 0
+        errors = 0
+        deadline = time.monotonic() + duration
+
+        async def worker():
+            nonlocal completed, errors
+            while time.monotonic() < deadline:
+                method, path, body = random.choice(WORKLOAD)
+                try:
+                    response = await client.request(method, path, json=body)
+                    if response.status_code >= 500:
+                        errors += 1
+                    completed += 1
+                except httpx.HTTPError:
+                    errors += 1
+
+        started = time.monotonic()
+        await asyncio.gather(*(worker() for _ in range(clients)))
+        return completed / (time.monotonic() - started), errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--max-workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--clients", type=int, default=64)
+    parser.add_argument("--port", type=int, default=8011)
+    args = parser.parse_args()
+
+    env = {**os.environ, "SCHEDULER_ENABLED": "false", "LOG_SAMPLE_RATES": "", "LOG_LEVEL": "WARNING"}
+    baseline = None
+    print(f"{'workers':>8}{'req/s':>12}{'ratio':>10}{'errors':>8}")
+    for workers in range(1, args.max_workers + 1):
+        process = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "server:app", "--port", str(args.port), "--workers", str(workers)],
+            cwd=BACKEND_DIR,
+            env=env,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        try:
+            throughput, errors = asyncio.run(drive(f"http://127.0.0.1:{args.port}", workers, args.clients, args.duration))
+        finally:
+            process.terminate()
+            process.wait()
+        baseline = baseline or throughput
+        print(f"{workers:>8}{throughput:>12.1f}{throughput / baseline:>10.2f}{errors:>8}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""Measure backend import time, time-to-live and time-to-ready.
+
+Import time is measured in a fresh interpreter. The other two start uvicorn
+and poll until /api/health (live: accepting requests) and /api/ready
+(startup finished; needs the MongoDB in backend/.env) answer 200.
+
+Usage: python scripts/measure_startup.py [--runs 5] [--skip-ready]
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import httpx
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent / "backend"
+
+IMPORT_PROBE = "import time; t = time.perf_counter(); import server; print(time.perf_counter() - t)"
+
+
+def measure_import() -> float:
+    output = subprocess.run(
+        [sys.executable, "-c", IMPORT_PROBE],
+        cwd=BACKEND_DIR,
+        env={**os.environ, "LOG_LEVEL": "WARNING"},
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return float(output.stdout.strip().splitlines()[-1])
+
+
+def measure_until_ok(port: int, path: str, timeout: float = 60.0) -> float:
+    """Seconds from starting uvicorn until ``path`` answers 200"""
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "server:app", "--port", str(port)],
+        cwd=BACKEND_DIR,
+        env={**os.environ, "LOG_LEVEL": "WARNING"},
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        while time.perf_counter() - started < timeout:
+            try:
+                if httpx.get(f"http://127.0.0.1:{port}{path}", timeout=1.0).status_code == 200:
+                    return time.perf_counter() - started
+            except httpx.HTTPError:
+                pass
+            time.sleep(0.01)
+        raise RuntimeError(f"{path} not answering after {timeout}s")
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def report(name: str, samples: list):
+    print(f"{name}: median {statistics.median(samples) * 1000:.0f} ms, max {max(samples) * 1000:.0f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--port", type=int, default=8012)
+    parser.add_argument("--skip-ready", action="store_true", help="skip time-to-ready (no MongoDB)")
+    args = parser.parse_args()
+
+    report("import server", [measure_import() for _ in range(args.runs)])
+    report("time-to-live", [measure_until_ok(args.port, "/api/health") for _ in range(args.runs)])
+    if not args.skip_ready:
+        report("time-to-ready", [measure_until_ok(args.port, "/api/ready") for _ in range(args.runs)])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+"""Migrate todos to the compact document layout (backend/schema.py) online.
+
+Rewrites legacy documents in ``todos`` and ``todos_archive`` in place, one
+batch of single-document pipeline updates at a time, while the backend
+keeps serving (it reads both layouts and upgrades a legacy todo itself
+before writing to it). Once no legacy documents remain, --drop-legacy-indexes
+drops the indexes on the old field names.
+
+Prints document, data and index sizes before and after. WiredTiger keeps
+freed space allocated to the collection, so storage size only shrinks
+after --compact (which runs MongoDB's blocking ``compact`` command; use it
+off-peak or on one replica set member at a time).
+
+Uses MONGO_URL and DB_NAME from backend/.env.
+
+Usage: python scripts/migrate_compact_schema.py [--batch-size 1000] [--pause 0.05] [--drop-legacy-indexes] [--compact]
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+from dotenv import load_dotenv
+from pymongo import MongoClient, UpdateOne
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent / "backend"
+sys.path.insert(0, str(BACKEND_DIR))
+
+from schema import LEGACY_FILTER, TODO_INDEXES, TODO_KEYS, upgrade_pipeline  # noqa: E402
+from settings import MongoSettings  # noqa: E402
+
+COLLECTIONS = ["todos", "todos_archive"]
+
+
+def collection_sizes(db, name: str) -> dict:
+    stats = db.command("collStats", name)
+    return {
+        "count": stats.get("count", 0),
+        "size": stats.get("size", 0),
+        "avg_obj_size": stats.get("avgObjSize", 0),
+        "storage_size": stats.get("storageSize", 0),
+        "index_size": stats.get("totalIndexSize", 0),
+        "indexes": stats.get("indexSizes", {}),
+    }
+
+
+def migrate(collection, batch_size: int, pause: float) -> int:
+    migrated = 0
+    while True:
+        batch = list(collection.find(LEGACY_FILTER, {"id": 1}).limit(batch_size))
+        if not batch:
+            return migrated
+        # Matching on the string id too makes a concurrent upgrade by the backend a no-op here
+        result = collection.bulk_write(
+            [UpdateOne({"_id": document["_id"], "id": document["id"]}, upgrade_pipeline(document["id"]))
+             for document in batch],
+            ordered=False,
+        )
+        migrated += result.modified_count
+        print(f"  {collection.name}: {migrated} migrated", flush=True)
+        if pause:
+            time.sleep(pause)
+
+
+def drop_legacy_indexes(collection) -> list:
+    if collection.count_documents(LEGACY_FILTER, limit=1):
+        print(f"  {collection.name}: legacy documents remain, keeping legacy indexes")
+        return []
+    dropped = []
+    for name, info in collection.index_information().items():
+        if any(field in TODO_KEYS for field, _ in info["key"]):
+            collection.drop_index(name)
+            dropped.append(name)
+    return dropped
+
+
+def mb(value: float) -> str:
+    return f"{value / 1024 / 1024:.1f} MB"
+
+
+def report(name: str, before: dict, after: dict):
+    def change(key: str) -> str:
+        if not before[key]:
+            return ""
+        return f" ({(after[key] - before[key]) / before[key] * 100:+.0f}%)"
+
+    print(f"{name}: {after['count']} documents")
+    print(f"  avg document {before['avg_obj_size']} B -> {after['avg_obj_size']} B{change('avg_obj_size')}")
+    print(f"  data size    {mb(before['size'])} -> {mb(after['size'])}{change('size')}")
+    print(f"  storage size {mb(before['storage_size'])} -> {mb(after['storage_size'])}{change('storage_size')}")
+    print(f"  index size   {mb(before['index_size'])} -> {mb(after['index_size'])}{change('index_size')}")
+    for index in sorted(set(before["indexes"]) | set(after["indexes"])):
+        old, new = before["indexes"].get(index), after["indexes"].get(index)
+        print(f"    {index:<24}{mb(old) if old is not None else '-':>12} -> {mb(new) if new is not None else '-'}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--pause", type=float, default=0.05, help="seconds to sleep between batches")
+    parser.add_argument("--drop-legacy-indexes", action="store_true")
+    parser.add_argument("--compact", action="store_true", help="run compact to release freed storage")
+    args = parser.parse_args()
+
+    load_dotenv(BACKEND_DIR / ".env")
+    settings = MongoSettings.from_env()
+    db = MongoClient(settings.url)[settings.db_name]
+
+    for collection, keys, options in TODO_INDEXES:
+        db[collection].create_index(keys, **options)
+
+    before = {name: collection_sizes(db, name) for name in COLLECTIONS}
+    for name in COLLECTIONS:
+        migrate(db[name], args.batch_size, args.pause)
+        if args.drop_legacy_indexes:
+            for index in drop_legacy_indexes(db[name]):
+                print(f"  {name}: dropped legacy index {index}")
+        if args.compact:
+            db.command("compact", name)
+    after = {name: collection_sizes(db, name) for name in COLLECTIONS}
+
+    for name in COLLECTIONS:
+        report(name, before[name], after[name])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""Rebuild game stats from the reward ledger and compare them with the live ones.
+
+Starts from the latest snapshot in ``game_stats_snapshots``, applies the
+``reward_ledger`` entries after it and the events still in the stats
+document's outbox (backend/ledger.py), then prints the rebuilt stats and
+any field that differs from ``game_stats``. Only the tail since the last
+snapshot is read, so the run time is bounded by the snapshot interval.
+
+Exits with status 1 on a mismatch or a gap in the ledger.
+
+Uses MONGO_URL and DB_NAME from backend/.env.
+
+Usage: python scripts/replay_ledger.py [--user default_user] [--json]
+"""
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+from dotenv import load_dotenv
+from pymongo import MongoClient
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent / "backend"
+sys.path.insert(0, str(BACKEND_DIR))
+
+from ledger import FLUSHED, OUTBOX, LedgerGapError, events_included, rebuild, tail_range  # noqa: E402
+from settings import MongoSettings  # noqa: E402
+
+# Fields written outside the ledger (settlement clock, ledger bookkeeping)
+UNTRACKED_FIELDS = {"_id", "last_auto_mined_at", OUTBOX, FLUSHED}
+
+
+def replay_user(db, user_id: str):
+    document = db.game_stats.find_one({"user_id": user_id})
+    snapshot = db.game_stats_snapshots.find_one(
+        {"user_id": user_id, "seq": {"$lte": events_included(document or {})}}, sort=[("seq", -1)]
+    )
+    after, until = tail_range(document, snapshot)
+    tail = list(db.reward_ledger.find({"user_id": user_id, "seq": {"$gt": after, "$lte": until}}).sort("seq", 1))
+    rebuilt = rebuild(user_id, document, snapshot, tail, {"user_id": user_id})
+    return document, snapshot, tail, rebuilt
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--user", default="default_user")
+    parser.add_argument("--json", action="store_true", help="print the rebuilt stats as JSON only")
+    args = parser.parse_args()
+
+    load_dotenv(BACKEND_DIR / ".env")
+    settings = MongoSettings.from_env()
+    db = MongoClient(settings.url)[settings.db_name]
+
+    started = time.perf_counter()
+    try:
+        document, snapshot, tail, rebuilt = replay_user(db, args.user)
+    except LedgerGapError as e:
+        print(e, file=sys.stderr)
+        sys.exit(1)
+    elapsed = time.perf_counter() - started
+
+    if args.json:
+        print(json.dumps(rebuilt, default=str, indent=2))
+    else:
+        print(f"snapshot seq {snapshot['seq'] if snapshot else '-'}"
+              f" (taken {snapshot['taken_at'] if snapshot else 'never'}),"
+              f" {len(tail)} ledger entries, {len((document or {}).get(OUTBOX, []))} unflushed,"
+              f" replayed in {elapsed * 1000:.1f} ms")
+        for field, value in sorted(rebuilt.items()):
+            print(f"  {field:<24}{value}")
+
+    live = {field: value for field, value in (document or {}).items() if field not in UNTRACKED_FIELDS}
+    # Fields missing from the live document read as their defaults
+    mismatches = {field for field in live if live[field] != rebuilt.get(field)}
+    if not snapshot:
+        # Without a snapshot only the fields events have touched can be compared
+        mismatches &= rebuilt.keys() - {"user_id"}
+    for field in sorted(mismatches):
+        print(f"MISMATCH {field}: live {live.get(field)!r}, replayed {rebuilt.get(field)!r}", file=sys.stderr)
+    sys.exit(1 if mismatches else 0)
+
+
+if __name__ == "__main__":
+    main()
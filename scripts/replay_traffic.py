@@ -0,0 +1,171 @@
+"""Replay an NDJSON traffic capture and report latency and response diffs.
+
+Captures are produced by setting TRAFFIC_CAPTURE_FILE on the backend. Pass
+every per-worker file of a multi-worker capture to merge them. Requests are
+resent with their captured headers (If-Match, Accept, Accept-Encoding, ...),
+so preconditions and content negotiation replay as they happened.
+
+Usage:
+    python scripts/replay_traffic.py capture.ndjson --speed 10
+    python scripts/replay_traffic.py capture.*.ndjson --url http://localhost:8001 --speed 1
+"""
+import argparse
+import asyncio
+import json
+import re
+import statistics
+import sys
+import time
+from collections import defaultdict
+from pathlib import Path
+
+import httpx
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+from traffic import decode_body  # noqa: E402
+
+ID_SEGMENT = re.compile(r"/[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}")
+
+# Fields whose values legitimately differ between runs
+VOLATILE_FIELDS = {"id", "created_at", "completed_at", "last_activity", "timestamp", "new_total"}
+
+
+def route_key(entry: dict) -> str:
+    return f"{entry['method']} {ID_SEGMENT.sub('/{id}', entry['path'])}"
+
+
+def strip_volatile(value):
+    if isinstance(value, dict):
+        return {k: strip_volatile(v) for k, v in value.items() if k not in VOLATILE_FIELDS}
+    if isinstance(value, list):
+        return [strip_volatile(v) for v in value]
+    return value
+
+
+def diff_response(entry: dict, response: httpx.Response):
+    """Return a short description of how the replayed response differs, or None"""
+    if entry.get("status") is not None and response.status_code != entry["status"]:
+        return f"status {entry['status']} -> {response.status_code}"
+    if entry.get("response_body") is None:
+        return None
+    try:
+        expected = strip_volatile(json.loads(entry["response_body"]))
+        actual = strip_volatile(response.json())
+    except ValueError:
+        return None
+    if expected != actual:
+        return f"body {json.dumps(expected)[:120]} -> {json.dumps(actual)[:120]}"
+    return None
+
+
+def remember_created_id(entry: dict, response: httpx.Response, id_map: dict):
+    if entry["method"] != "POST" or not entry.get("response_body"):
+        return
+    try:
+        captured, replayed = json.loads(entry["response_body"]), response.json()
+    except ValueError:
+        return
+    if isinstance(captured, dict) and isinstance(replayed, dict) and "id" in captured and "id" in replayed:
+        id_map[captured["id"]] = replayed["id"]
+
+
+def load_capture(paths: list) -> list:
+    entries = []
+    for path in paths:
+        with path.open(encoding="utf-8") as capture_file:
+            entries.extend(json.loads(line) for line in capture_file if line.strip())
+    # Requests whose body was too large to capture can't be replayed faithfully
+    entries = [entry for entry in entries if not entry.get("body_truncated")]
+    entries.sort(key=lambda entry: entry["t"])
+    return entries
+
+
+async def replay(client: httpx.AsyncClient, entries: list, speed: float) -> tuple:
+    latencies = defaultdict(list)
+    diffs = defaultdict(list)
+    errors = defaultdict(int)
+    # Captured ids -> ids created during replay, so later requests hit the new documents
+    id_map = {}
+    origin = entries[0]["t"] if entries else 0.0
+    started = time.perf_counter()
+
+    async def fire(entry):
+        delay = (entry["t"] - origin) / speed - (time.perf_counter() - started)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        key = route_key(entry)
+        headers = entry.get("headers") or {}
+        if not headers and entry.get("content_type"):
+            # Captures from before request headers were recorded
+            headers = {"content-type": entry["content_type"]}
+        path = ID_SEGMENT.sub(lambda match: "/" + id_map.get(match.group()[1:], match.group()[1:]), entry["path"])
+        request_start = time.perf_counter()
+        try:
+            response = await client.request(
+                entry["method"],
+                path + (f"?{entry['query']}" if entry.get("query") else ""),
+                content=decode_body(entry) or None,
+                headers=headers,
+            )
+        except httpx.HTTPError:
+            errors[key] += 1
+            return
+        latencies[key].append((time.perf_counter() - request_start) * 1000)
+        remember_created_id(entry, response, id_map)
+        difference = diff_response(entry, response)
+        if difference:
+            diffs[key].append(difference)
+
+    await asyncio.gather(*(fire(entry) for entry in entries))
+    return latencies, diffs, errors, time.perf_counter() - started
+
+
+def percentile(values: list, pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def report(latencies, diffs, errors, elapsed: float, total: int):
+    print(f"replayed {total} requests in {elapsed:.2f}s ({total / elapsed if elapsed else 0:.1f} req/s)")
+    print(f"{'route':<40}{'n':>6}{'p50':>9}{'p90':>9}{'p99':>9}{'max':>9}{'diffs':>7}{'errors':>8}")
+    for key in sorted(set(latencies) | set(errors)):
+        values = latencies.get(key) or [0.0]
+        print(
+            f"{key:<40}{len(latencies.get(key, [])):>6}"
+            f"{statistics.median(values):>9.2f}{percentile(values, 90):>9.2f}"
+            f"{percentile(values, 99):>9.2f}{max(values):>9.2f}"
+            f"{len(diffs.get(key, [])):>7}{errors.get(key, 0):>8}"
+        )
+    for key, differences in sorted(diffs.items()):
+        for difference in differences[:3]:
+            print(f"  diff {key}: {difference}")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("capture", type=Path, nargs="+")
+    parser.add_argument("--speed", type=float, default=1.0, help="replay speed multiplier (1-100)")
+    parser.add_argument("--url", help="replay over HTTP against this base URL instead of in-process")
+    parser.add_argument("--timeout", type=float, default=30.0)
+    args = parser.parse_args()
+
+    if not 1 <= args.speed <= 100:
+        parser.error("--speed must be between 1 and 100")
+
+    entries = load_capture(args.capture)
+    if args.url:
+        async with httpx.AsyncClient(base_url=args.url, timeout=args.timeout) as client:
+            results = await replay(client, entries, args.speed)
+    else:
+        from server import app
+
+        transport = httpx.ASGITransport(app=app)
+        async with app.router.lifespan_context(app):
+            async with httpx.AsyncClient(transport=transport, base_url="http://replay", timeout=args.timeout) as client:
+                results = await replay(client, entries, args.speed)
+    report(*results, total=len(entries))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
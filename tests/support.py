@@ -0,0 +1,158 @@
+"""Shared helpers for tests that run the app in-process against MongoDB."""
+import asyncio
+import os
+import random
+import sys
+import unittest
+from pathlib import Path
+from unittest import mock
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent / "backend"
+sys.path.insert(0, str(BACKEND_DIR))
+os.environ.setdefault("SCHEDULER_ENABLED", "false")
+
+import httpx  # noqa: E402
+from dotenv import load_dotenv  # noqa: E402
+from motor.motor_asyncio import AsyncIOMotorClient  # noqa: E402
+from pymongo import MongoClient  # noqa: E402
+
+# MONGO_URL and DB_NAME, for tests that don't import server
+load_dotenv(BACKEND_DIR / ".env")
+from pymongo.errors import AutoReconnect, PyMongoError  # noqa: E402
+
+
+def mongo_available() -> bool:
+    try:
+        MongoClient(os.environ["MONGO_URL"], serverSelectionTimeoutMS=1000).admin.command("ping")
+        return True
+    except PyMongoError:
+        return False
+
+
+class MongoTestCase(unittest.IsolatedAsyncioTestCase):
+    """A fresh database named ``DB_NAME``, dropped before and after each test.
+
+    Subclasses still guard themselves with ``skipUnless(mongo_available())``.
+    """
+
+    DB_NAME: str
+
+    async def asyncSetUp(self):
+        self.client = AsyncIOMotorClient(os.environ["MONGO_URL"])
+        self.addCleanup(self.client.close)
+        await self.client.drop_database(self.DB_NAME)
+        self.addAsyncCleanup(self.client.drop_database, self.DB_NAME)
+        self.database = self.client[self.DB_NAME]
+
+    def patch(self, target, attribute: str, value):
+        """Replace a module global for this test only"""
+        patcher = mock.patch.object(target, attribute, value)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+
+class MongoApiTestCase(MongoTestCase):
+    """The app in-process against the test database, called through ``self.api``.
+
+    ``server.client``, ``server.db`` and ``server.legacy_todos`` point at the
+    test database until the test ends; globals patched with ``self.patch``
+    are restored the same way.
+    """
+
+    ENSURE_INDEXES = False
+
+    def wrap_database(self, database):
+        """What ``server.db`` becomes; override to inject faults"""
+        return database
+
+    async def asyncSetUp(self):
+        await super().asyncSetUp()
+        import server  # not at module level: most test modules never need it
+        from schema import LegacyTodos
+
+        self.patch(server, "client", self.client)
+        self.patch(server, "db", self.wrap_database(self.database))
+        self.patch(server, "legacy_todos", LegacyTodos())
+        if self.ENSURE_INDEXES:
+            await server.ensure_indexes()
+        self.api = httpx.AsyncClient(transport=httpx.ASGITransport(app=server.app), base_url="http://test/api")
+        self.addAsyncCleanup(self.api.aclose)
+
+
+class Faults:
+    """Latency and error rate injected into every database call"""
+
+    def __init__(self, latency: float = 0.0, error_rate: float = 0.0, error: type = AutoReconnect):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.error = error
+        self.calls = 0
+
+    async def inject(self):
+        self.calls += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if self.error_rate and random.random() < self.error_rate:
+            raise self.error("injected fault")
+
+
+class FaultyCursor:
+    def __init__(self, cursor, faults: Faults):
+        self._cursor = cursor
+        self._faults = faults
+
+    def __getattr__(self, name):
+        attribute = getattr(self._cursor, name)
+        if name == "to_list":
+            async def to_list(*args, **kwargs):
+                await self._faults.inject()
+                return await attribute(*args, **kwargs)
+            return to_list
+        if callable(attribute):
+            # sort(), limit(), ... return the cursor; keep wrapping it
+            def chained(*args, **kwargs):
+                result = attribute(*args, **kwargs)
+                return self if result is self._cursor else result
+            return chained
+        return attribute
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        await self._faults.inject()
+        async for document in self._cursor:
+            yield document
+
+
+class FaultyCollection:
+    CURSOR_METHODS = {"find", "aggregate"}
+
+    def __init__(self, collection, faults: Faults):
+        self._collection = collection
+        self._faults = faults
+
+    def __getattr__(self, name):
+        attribute = getattr(self._collection, name)
+        if name in self.CURSOR_METHODS:
+            return lambda *args, **kwargs: FaultyCursor(attribute(*args, **kwargs), self._faults)
+        if callable(attribute):
+            async def call(*args, **kwargs):
+                await self._faults.inject()
+                return await attribute(*args, **kwargs)
+            return call
+        return attribute
+
+
+class FaultyDatabase:
+    """Stand-in for a Motor database that slows down or fails its calls"""
+
+    def __init__(self, database, faults: Faults):
+        self._database = database
+        self.faults = faults
+
+    def __getattr__(self, name):
+        return FaultyCollection(self._database[name], self.faults)
+
+    def __getitem__(self, name):
+        return FaultyCollection(self._database[name], self.faults)
@@ -0,0 +1,43 @@
+"""Archival of old completed todos."""
+import unittest
+from datetime import datetime, timedelta, timezone
+
+from tests.support import MongoApiTestCase, mongo_available
+
+import server  # backend/ is on sys.path via tests.support
+from schema import todo_to_doc
+
+
+@unittest.skipUnless(mongo_available(), "MongoDB is not reachable")
+class ArchivalTest(MongoApiTestCase):
+    DB_NAME = "todo_mining_archival_test"
+
+    async def asyncSetUp(self):
+        await super().asyncSetUp()
+        completed_at = datetime.now(timezone.utc) - timedelta(days=40)
+        await server.db.todos.insert_many([
+            todo_to_doc(server.Todo(title=f"old {i}", priority="low", category="work", completed=True,
+                                    completed_at=completed_at).dict())
+            for i in range(5)
+        ])
+        await server.db.todos.insert_one(todo_to_doc(server.Todo(title="open", priority="low", category="work").dict()))
+
+    async def test_moves_old_completed_todos(self):
+        self.assertEqual(await server.archive_completed_todos(30, batch_size=2), 5)
+
+        self.assertEqual(await server.db.todos.count_documents({}), 1)
+        self.assertEqual(await server.db.todos_archive.count_documents({}), 5)
+
+    async def test_rerun_after_an_interrupted_batch_finishes_it(self):
+        # A previous run copied two todos and stopped before deleting them
+        copied = await server.db.todos.find({"x": True}).to_list(2)
+        await server.db.todos_archive.insert_many(copied)
+
+        self.assertEqual(await server.archive_completed_todos(30, batch_size=3), 5)
+
+        self.assertEqual(await server.db.todos.count_documents({}), 1)
+        self.assertEqual(await server.db.todos_archive.count_documents({}), 5)
+
+
+if __name__ == "__main__":
+    unittest.main()
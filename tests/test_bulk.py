@@ -0,0 +1,108 @@
+"""Streaming bulk import and export of todos."""
+import json
+import unittest
+
+from tests.support import MongoApiTestCase, mongo_available
+
+from bulk import ImportFormatError, parse_csv, parse_ndjson  # backend/ is on sys.path via tests.support
+
+
+async def chunked(data: bytes, size: int):
+    for start in range(0, len(data), size):
+        yield data[start:start + size]
+
+
+async def collect(rows) -> list:
+    return [row async for row in rows]
+
+
+class StreamingParserTest(unittest.IsolatedAsyncioTestCase):
+    async def test_ndjson_lines_split_across_chunks(self):
+        body = "\n".join(json.dumps({"title": f"todo {i}", "note": "é"}) for i in range(50)).encode()
+
+        rows = await collect(parse_ndjson(chunked(body, 7)))
+
+        self.assertEqual([line for line, _ in rows], list(range(1, 51)))
+        self.assertEqual(rows[49][1], {"title": "todo 49", "note": "é"})
+
+    async def test_invalid_json_is_reported_per_line(self):
+        rows = await collect(parse_ndjson(chunked(b'{"title": "ok"}\n{oops\n\n{"title": "also ok"}\n', 4)))
+
+        self.assertEqual([line for line, _ in rows], [1, 2, 4])
+        self.assertIsInstance(rows[1][1], ImportFormatError)
+
+    async def test_invalid_utf8_is_reported_per_line(self):
+        rows = await collect(parse_ndjson(chunked(b'{"title":"a"}\n\xff{"title":"b"}\n{"title":"c"}', 5)))
+
+        self.assertEqual([line for line, _ in rows], [1, 2, 3])
+        self.assertIsInstance(rows[1][1], ImportFormatError)
+        self.assertEqual(rows[2][1], {"title": "c"})
+
+    async def test_invalid_utf8_in_csv_stops_the_import(self):
+        with self.assertRaisesRegex(ImportFormatError, "Line 2"):
+            await collect(parse_csv(chunked(b"title\n\xff\nok\n", 4)))
+
+    async def test_csv_with_quoted_multiline_fields(self):
+        body = b'title,description,priority\r\n"Buy milk","two\nlines, with comma",high\r\nPlain,,low\r\n'
+
+        rows = await collect(parse_csv(chunked(body, 5)))
+
+        self.assertEqual(rows, [
+            (2, {"title": "Buy milk", "description": "two\nlines, with comma", "priority": "high"}),
+            (4, {"title": "Plain", "priority": "low"}),
+        ])
+
+    async def test_overlong_line_is_rejected(self):
+        with self.assertRaises(ImportFormatError):
+            await collect(parse_ndjson(chunked(b"x" * (2 * 1024 * 1024), 64 * 1024)))
+
+
+@unittest.skipUnless(mongo_available(), "MongoDB is not reachable")
+class BulkApiTest(MongoApiTestCase):
+    DB_NAME = "todo_mining_bulk_test"
+    ENSURE_INDEXES = True
+
+    async def test_ndjson_round_trip(self):
+        body = "\n".join(json.dumps({"title": f"todo {i}", "priority": "high"}) for i in range(2500))
+
+        response = await self.api.post("/todos/import", content=body, headers={"content-type": "application/x-ndjson"})
+        self.assertEqual(response.json(), {"imported": 2500, "failed": 0, "errors": []})
+
+        exported = await self.api.get("/todos/export")
+        self.assertEqual(exported.headers["content-type"], "application/x-ndjson")
+        todos = [json.loads(line) for line in exported.text.splitlines()]
+        self.assertEqual(len(todos), 2500)
+        self.assertTrue(all(todo["priority"] == "high" and "_id" not in todo for todo in todos))
+
+        # Re-importing the export rejects every row as a duplicate
+        again = await self.api.post("/todos/import", content=exported.content, headers={"content-type": "application/x-ndjson"})
+        self.assertEqual((again.json()["imported"], again.json()["failed"]), (0, 2500))
+
+    async def test_csv_import_reports_bad_rows(self):
+        body = "title,priority,completed\nfirst,low,false\n,high,true\nthird,urgent,false\nfourth,medium,true\n"
+
+        response = await self.api.post("/todos/import", content=body, headers={"content-type": "text/csv"})
+
+        summary = response.json()
+        self.assertEqual((summary["imported"], summary["failed"]), (2, 2))
+        self.assertEqual([error["line"] for error in summary["errors"]], [3, 4])
+        stats = (await self.api.get("/game/stats")).json()
+        self.assertEqual(stats["coins"], 0)  # imported completions earn nothing
+
+    async def test_non_utf8_line_is_a_bad_row(self):
+        body = b'{"title":"a"}\n\xff{"title":"b"}\n'
+
+        response = await self.api.post("/todos/import", content=body, headers={"content-type": "application/x-ndjson"})
+
+        self.assertEqual(response.status_code, 200)
+        summary = response.json()
+        self.assertEqual((summary["imported"], summary["failed"]), (1, 1))
+        self.assertEqual(summary["errors"][0]["line"], 2)
+
+    async def test_unsupported_content_type(self):
+        response = await self.api.post("/todos/import", content=b"<todos/>", headers={"content-type": "application/xml"})
+        self.assertEqual(response.status_code, 415)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,139 @@
+"""Response compression and MessagePack negotiation, exercised through ASGI."""
+import json
+import unittest
+
+import httpx
+import msgpack
+from fastapi import FastAPI, Request
+from fastapi.responses import PlainTextResponse, Response, StreamingResponse
+
+import tests.support  # noqa: F401  (puts backend/ on sys.path)
+from compression import CompressionMiddleware, choose_encoding, negotiate
+
+MINIMUM_SIZE = 512
+LARGE = {"todos": [{"id": i, "title": f"todo {i}"} for i in range(100)]}
+SMALL = {"ok": True}
+
+
+def build_app() -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/large")
+    async def large(request: Request):
+        return negotiate(request, LARGE)
+
+    @app.get("/small")
+    async def small(request: Request):
+        return negotiate(request, SMALL)
+
+    @app.get("/stream")
+    async def stream():
+        return StreamingResponse((f"line {i}\n" * 50 for i in range(20)), media_type="text/plain")
+
+    @app.get("/image")
+    async def image():
+        return Response(b"\x89PNG" + b"\x00" * 4096, media_type="image/png")
+
+    @app.get("/encoded")
+    async def encoded():
+        return PlainTextResponse("x" * 4096, headers={"Content-Encoding": "identity"})
+
+    app.add_middleware(CompressionMiddleware, minimum_size=MINIMUM_SIZE)
+    return app
+
+
+class ChooseEncodingTest(unittest.TestCase):
+    def test_preference_and_qvalues(self):
+        for header, expected in [
+            ("gzip, br", "br"),
+            ("br;q=0.5, gzip", "gzip"),
+            ("gzip;q=0, br;q=0", None),
+            ("*", "br"),
+            ("*;q=0.1, gzip;q=0", "br"),
+            ("deflate, identity", None),
+            ("", None),
+            ("GZIP", "gzip"),
+            ("Br;Q=0, GZip;Q=0.5", "gzip"),
+        ]:
+            with self.subTest(header=header):
+                self.assertEqual(choose_encoding(header), expected)
+
+
+class CompressionAsgiTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.api = httpx.AsyncClient(transport=httpx.ASGITransport(app=build_app()), base_url="http://test")
+
+    async def asyncTearDown(self):
+        await self.api.aclose()
+
+    async def get(self, path: str, **headers) -> httpx.Response:
+        return await self.api.get(path, headers={"Accept-Encoding": "identity", **headers})
+
+    async def test_large_responses_use_the_preferred_encoding(self):
+        for accept_encoding, expected in [("gzip", "gzip"), ("gzip, br", "br"), ("br;q=0.2, gzip;q=0.8", "gzip")]:
+            with self.subTest(accept_encoding=accept_encoding):
+                response = await self.get("/large", **{"Accept-Encoding": accept_encoding})
+
+                self.assertEqual(response.headers["content-encoding"], expected)
+                self.assertIn("Accept-Encoding", response.headers["vary"])
+                self.assertLess(int(response.headers["content-length"]), len(json.dumps(LARGE)))
+                self.assertEqual(response.json(), LARGE)
+
+    async def test_uncompressed_without_an_accepted_encoding(self):
+        response = await self.get("/large")
+        self.assertNotIn("content-encoding", response.headers)
+        self.assertEqual(response.json(), LARGE)
+
+    async def test_responses_below_the_threshold_are_left_alone(self):
+        response = await self.get("/small", **{"Accept-Encoding": "gzip, br"})
+        self.assertNotIn("content-encoding", response.headers)
+        self.assertEqual(response.json(), SMALL)
+
+    async def test_streaming_responses_are_compressed_incrementally(self):
+        response = await self.get("/stream", **{"Accept-Encoding": "gzip"})
+
+        self.assertEqual(response.headers["content-encoding"], "gzip")
+        self.assertNotIn("content-length", response.headers)
+        self.assertEqual(response.text, "".join(f"line {i}\n" * 50 for i in range(20)))
+
+    async def test_incompressible_and_already_encoded_bodies_pass_through(self):
+        image = await self.get("/image", **{"Accept-Encoding": "gzip"})
+        self.assertNotIn("content-encoding", image.headers)
+        self.assertEqual(len(image.content), 4100)
+
+        encoded = await self.get("/encoded", **{"Accept-Encoding": "gzip"})
+        self.assertEqual(encoded.headers["content-encoding"], "identity")
+
+    async def test_every_response_varies_by_accept_encoding(self):
+        for path, accept_encoding in [
+            ("/large", "identity"),
+            ("/small", "gzip"),
+            ("/image", "gzip"),
+            ("/encoded", "gzip"),
+            ("/large", "GZIP"),
+        ]:
+            with self.subTest(path=path, accept_encoding=accept_encoding):
+                response = await self.get(path, **{"Accept-Encoding": accept_encoding})
+
+                vary = [value.strip().lower() for value in response.headers["vary"].split(",")]
+                self.assertEqual(vary.count("accept-encoding"), 1)
+
+    async def test_msgpack_when_the_client_prefers_it(self):
+        for accept, media_type in [
+            ("application/msgpack", "application/msgpack"),
+            ("application/json;q=0.5, application/x-msgpack", "application/msgpack"),
+            ("application/json, application/msgpack;q=0.5", "application/json"),
+            ("*/*", "application/json"),
+        ]:
+            with self.subTest(accept=accept):
+                response = await self.get("/large", Accept=accept, **{"Accept-Encoding": "br"})
+
+                self.assertEqual(response.headers["content-type"], media_type)
+                self.assertIn("Accept", response.headers["vary"])
+                self.assertEqual(response.headers["content-encoding"], "br")
+                decode = msgpack.unpackb if media_type == "application/msgpack" else json.loads
+                self.assertEqual(decode(response.content), LARGE)
+
+
+if __name__ == "__main__":
+    unittest.main()
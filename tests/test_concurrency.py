@@ -0,0 +1,86 @@
+"""Concurrency stress tests for coin accounting and optimistic versioning.
+
+These run the app in-process against a real MongoDB (MONGO_URL from
+backend/.env, database ``todo_mining_stress_test``) and are skipped when no
+server is reachable.
+"""
+import asyncio
+import unittest
+
+from tests.support import MongoApiTestCase, mongo_available
+
+CONCURRENCY = 200
+
+
+@unittest.skipUnless(mongo_available(), "MongoDB is not reachable")
+class ConcurrencyStressTest(MongoApiTestCase):
+    DB_NAME = "todo_mining_stress_test"
+
+    async def set_coins(self, coins: int):
+        response = await self.api.post("/game/stats", json={"coins": coins})
+        self.assertEqual(response.status_code, 200)
+
+    async def get_stats(self) -> dict:
+        return (await self.api.get("/game/stats")).json()
+
+    async def test_concurrent_purchases_never_overspend(self):
+        await self.set_coins(5000)
+
+        responses = await asyncio.gather(*(self.api.post("/game/upgrade/mining_power") for _ in range(CONCURRENCY)))
+
+        spent = [r.json()["cost"] for r in responses if r.status_code == 200]
+        self.assertTrue(all(r.status_code in (200, 400, 409) for r in responses))
+        stats = await self.get_stats()
+        self.assertGreaterEqual(stats["coins"], 0)
+        self.assertEqual(stats["coins"], 5000 - sum(spent))
+        self.assertEqual(stats["mining_power"], 1 + len(spent))
+        # Each level is bought at most once
+        self.assertEqual(len(spent), len(set(spent)))
+
+    async def test_concurrent_completions_award_once(self):
+        todo = (await self.api.post("/todos", json={"title": "once", "priority": "high"})).json()
+
+        responses = await asyncio.gather(
+            *(self.api.put(f"/todos/{todo['id']}", json={"completed": True}) for _ in range(CONCURRENCY))
+        )
+
+        self.assertTrue(all(r.status_code == 200 for r in responses))
+        stats = await self.get_stats()
+        self.assertEqual(stats["coins"], 50)
+        self.assertEqual(stats["total_todos_completed"], 1)
+
+    async def test_completions_racing_purchases_lose_no_coins(self):
+        await self.set_coins(10000)
+        todos = await asyncio.gather(
+            *(self.api.post("/todos", json={"title": f"todo {i}", "priority": "high"}) for i in range(100))
+        )
+
+        completions = [self.api.put(f"/todos/{t.json()['id']}", json={"completed": True}) for t in todos]
+        purchases = [self.api.post("/game/upgrade/auto_miner_1") for _ in range(100)]
+        responses = await asyncio.gather(*completions, *purchases)
+
+        spent = sum(r.json()["cost"] for r in responses[len(completions):] if r.status_code == 200)
+        stats = await self.get_stats()
+        # Auto miners don't change the completion reward: 100 high priority todos at 50 coins each
+        self.assertEqual(stats["coins"], 10000 + 100 * 50 - spent)
+        self.assertEqual(stats["total_todos_completed"], 100)
+
+    async def test_if_match_rejects_stale_writes(self):
+        created = await self.api.post("/todos", json={"title": "contended"})
+        self.assertEqual(created.headers["etag"], '"0"')
+        todo_id = created.json()["id"]
+
+        responses = await asyncio.gather(*(
+            self.api.put(f"/todos/{todo_id}", json={"title": f"writer {i}"}, headers={"If-Match": '"0"'})
+            for i in range(50)
+        ))
+
+        statuses = sorted(r.status_code for r in responses)
+        self.assertEqual(statuses.count(200), 1)
+        self.assertEqual(statuses.count(412), 49)
+        winner = next(r for r in responses if r.status_code == 200)
+        self.assertEqual(winner.headers["etag"], '"1"')
+
+
+if __name__ == "__main__":
+    unittest.main()
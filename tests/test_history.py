@@ -0,0 +1,96 @@
+"""Daily rollups and the downsampled productivity history."""
+import unittest
+from datetime import datetime, timedelta, timezone
+from unittest import mock
+
+from pymongo.errors import AutoReconnect
+
+from tests.support import MongoApiTestCase, mongo_available
+
+import server  # backend/ is on sys.path via tests.support
+from rollups import day_of, downsample
+
+
+class DownsampleTest(unittest.TestCase):
+    def test_days_are_bucketed_and_level_carries_forward(self):
+        start = datetime(2024, 1, 1)
+        rollups = [
+            {"day": datetime(2024, 1, 2), "completions": 2, "coins": 35, "level": 2, "priorities": {"low": 2}},
+            {"day": datetime(2024, 1, 3), "completions": 1, "coins": 50, "level": 3, "priorities": {"high": 1}},
+            {"day": datetime(2024, 1, 9), "completions": 4, "coins": 40, "level": 4, "priorities": {"low": 4}},
+        ]
+
+        history = downsample(rollups, start, start + timedelta(days=10), max_points=4, initial_level=2)
+
+        self.assertEqual(history["bucket_days"], 3)
+        self.assertEqual([point["date"] for point in history["points"]], ["2024-01-01", "2024-01-04", "2024-01-07", "2024-01-10"])
+        self.assertEqual([point["completions"] for point in history["points"]], [3, 0, 4, 0])
+        self.assertEqual([point["level"] for point in history["points"]], [3, 3, 4, 4])
+        self.assertEqual(history["points"][0]["priorities"], {"low": 2, "high": 1})
+
+    def test_short_ranges_are_daily(self):
+        history = downsample([], datetime(2024, 1, 1), datetime(2024, 1, 8), max_points=90)
+        self.assertEqual((history["bucket_days"], len(history["points"])), (1, 7))
+
+    def test_day_of_uses_utc(self):
+        moment = datetime(2024, 1, 1, 23, 30, tzinfo=timezone(timedelta(hours=-2)))
+        self.assertEqual(day_of(moment), datetime(2024, 1, 2))
+
+
+@unittest.skipUnless(mongo_available(), "MongoDB is not reachable")
+class HistoryApiTest(MongoApiTestCase):
+    DB_NAME = "todo_mining_history_test"
+    ENSURE_INDEXES = True
+
+    async def complete(self, **fields):
+        todo = (await self.api.post("/todos", json={"title": "t", **fields})).json()
+        return await self.api.put(f"/todos/{todo['id']}", json={"completed": True})
+
+    async def test_completions_update_todays_rollup(self):
+        await self.api.post("/game/stats", json={"mining_power": 2})
+        await self.complete(priority="high", category="work")
+        await self.complete(priority="low", category="work")
+
+        rollup = await server.db.stats_daily.find_one({"user_id": "default_user"})
+        self.assertEqual(rollup["day"], day_of(datetime.now(timezone.utc)))
+        self.assertEqual((rollup["completions"], rollup["coins"]), (2, 120))
+        self.assertEqual(rollup["priorities"], {"high": 1, "low": 1})
+        self.assertEqual(rollup["categories"], {"work": 2})
+        stats = (await self.api.get("/game/stats")).json()
+        self.assertEqual(stats["coins"], 120)
+
+    async def test_failed_rollup_write_keeps_the_reward_and_is_counted(self):
+        failures = (await self.api.get("/metrics/rollups")).json()["failures"]
+        stats_daily = mock.Mock(update_one=mock.AsyncMock(side_effect=AutoReconnect("injected fault")))
+
+        with mock.patch.object(server, "db", mock.Mock(wraps=server.db, stats_daily=stats_daily)):
+            with self.assertLogs("server", "ERROR"):
+                response = await self.complete(priority="high")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((await self.api.get("/game/stats")).json()["coins"], 50)
+        self.assertEqual((await self.api.get("/metrics/rollups")).json()["failures"], failures + 1)
+
+    async def test_history_downsamples_long_ranges(self):
+        today = day_of(datetime.now(timezone.utc))
+        await server.db.stats_daily.insert_many([
+            {"user_id": "default_user", "day": today - timedelta(days=400), "completions": 9, "coins": 90, "level": 5},
+            {"user_id": "default_user", "day": today - timedelta(days=20), "completions": 1, "coins": 10, "level": 6},
+        ])
+        await self.complete()
+
+        history = (await self.api.get("/stats/history", params={"days": 365, "points": 52})).json()
+
+        self.assertEqual((history["days"], history["bucket_days"]), (365, 8))
+        self.assertLessEqual(len(history["points"]), 52)
+        self.assertEqual(history["points"][0]["level"], 5)  # carried in from before the range
+        self.assertEqual(sum(point["completions"] for point in history["points"]), 2)
+        self.assertEqual(history["points"][-1]["completions"], 1)
+
+        daily = (await self.api.get("/stats/history", params={"days": 7})).json()
+        self.assertEqual(len(daily["points"]), 7)
+        self.assertEqual(daily["points"][-1]["date"], today.date().isoformat())
+
+
+if __name__ == "__main__":
+    unittest.main()
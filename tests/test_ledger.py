@@ -0,0 +1,148 @@
+"""Reward ledger, snapshots and replay.
+
+The fuzz test drives random sequences of completions, purchases, auto-mining
+and manual adjustments, interleaved with ledger flushes and snapshots, and
+checks after every step that replaying the ledger reproduces the live stats.
+"""
+import asyncio
+import random
+import unittest
+from datetime import datetime, timedelta, timezone
+
+from tests.support import MongoApiTestCase, mongo_available
+
+import server  # backend/ is on sys.path via tests.support
+from ledger import LedgerGapError, event, ledger_entries, rebuild, replay
+
+FUZZ_SEEDS = [1, 2, 3]
+FUZZ_STEPS = 60
+
+
+class ReplayTest(unittest.TestCase):
+    def test_events_apply_increments_then_assignments(self):
+        at = datetime(2024, 1, 1)
+        entries = [
+            event("award", at, inc={"coins": 50, "total_todos_completed": 1}, assign={"level": 1}),
+            event("purchase", at, inc={"coins": -40, "mining_power": 1}, upgrade_id="mining_power"),
+            event("adjust", at, assign={"coins": 7}),
+        ]
+
+        stats = replay({"coins": 0, "mining_power": 1, "total_todos_completed": 0, "version": 4}, entries)
+
+        self.assertEqual(
+            stats,
+            {"coins": 7, "mining_power": 2, "total_todos_completed": 1, "level": 1, "version": 7, "last_activity": at}
+        )
+
+    def test_missing_ledger_entries_are_detected(self):
+        document = {"ledger_flushed": 3, "ledger_outbox": [event("adjust", datetime(2024, 1, 1), assign={"coins": 1})]}
+        tail = [{"seq": 1, "inc": {}, "set": {}}, {"seq": 3, "inc": {}, "set": {}}]
+
+        with self.assertRaises(LedgerGapError):
+            rebuild("u", document, None, tail, {})
+        self.assertEqual([entry["seq"] for entry in ledger_entries("u", document)], [4])
+
+
+@unittest.skipUnless(mongo_available(), "MongoDB is not reachable")
+class LedgerApiTest(MongoApiTestCase):
+    DB_NAME = "todo_mining_ledger_test"
+    ENSURE_INDEXES = True
+
+    async def live_stats(self) -> dict:
+        await server._load_game_stats()  # creates the stats on first use
+        return server.GameStats(**await server.db.game_stats.find_one({"user_id": "default_user"})).dict()
+
+    async def assert_replay_matches(self):
+        live = await self.live_stats()
+        self.assertEqual((await server.replay_game_stats()).dict(), live)
+
+    async def complete(self, priority: str):
+        todo = (await self.api.post("/todos", json={"title": "t", "priority": priority})).json()
+        await self.api.put(f"/todos/{todo['id']}", json={"completed": True})
+
+    async def auto_mine(self, minutes: int):
+        await self.api.post("/game/auto-mine")  # starts the settlement clock on first use
+        await server.db.game_stats.update_one(
+            {"user_id": "default_user"},
+            {"$set": {"last_auto_mined_at": datetime.now(timezone.utc) - timedelta(minutes=minutes, seconds=1)}}
+        )
+        await self.api.post("/game/auto-mine")
+
+    async def test_every_coin_change_is_ledgered(self):
+        await self.api.post("/game/stats", json={"coins": 1000})
+        await self.complete("high")
+        await self.api.post("/game/upgrade/auto_miner_1")
+        await self.auto_mine(3)
+
+        self.assertEqual(await server.flush_reward_ledger(), 4)
+
+        entries = await server.db.reward_ledger.find().sort("seq", 1).to_list(None)
+        self.assertEqual([entry["type"] for entry in entries], ["adjust", "award", "purchase", "auto_mine"])
+        self.assertEqual([entry["seq"] for entry in entries], [1, 2, 3, 4])
+        self.assertEqual([entry["inc"].get("coins") for entry in entries], [None, 50, -500, 3])
+        self.assertEqual(await server.flush_reward_ledger(), 0)
+        await self.assert_replay_matches()
+
+    async def test_flush_interrupted_after_the_insert_is_repeated_safely(self):
+        await self.complete("low")
+        await self.complete("medium")
+        document = await server.db.game_stats.find_one({"user_id": "default_user"})
+        await server.db.reward_ledger.insert_many(ledger_entries("default_user", document)[:1])
+
+        self.assertEqual(await server.flush_reward_ledger(), 2)
+
+        self.assertEqual(await server.db.reward_ledger.count_documents({}), 2)
+        await self.assert_replay_matches()
+
+    async def test_replay_starts_from_the_latest_snapshot(self):
+        for _ in range(5):
+            await self.complete("high")
+        self.assertEqual(await server.snapshot_game_stats(), 5)
+        await self.complete("low")
+        # The ledger before the snapshot is never read again
+        await server.db.reward_ledger.delete_many({"seq": {"$lte": 5}})
+
+        await self.assert_replay_matches()
+
+    async def test_concurrent_writes_and_flushes(self):
+        await self.api.post("/game/stats", json={"coins": 5000})
+        await asyncio.gather(
+            *(self.complete(random.choice(["low", "medium", "high"])) for _ in range(20)),
+            *(self.api.post("/game/upgrade/mining_power") for _ in range(10)),
+            *(server.flush_reward_ledger() for _ in range(10)),
+        )
+        await self.assert_replay_matches()
+        await server.flush_reward_ledger()
+        self.assertEqual(
+            await server.db.reward_ledger.count_documents({}),
+            (await self.live_stats())["version"]
+        )
+
+    async def test_fuzzed_operations_replay_to_live_state(self):
+        for seed in FUZZ_SEEDS:
+            with self.subTest(seed=seed):
+                await server.db.game_stats.delete_many({})
+                await server.db.game_stats_snapshots.delete_many({})
+                await server.db.reward_ledger.delete_many({})
+                server.read_coalescer.forget("game_stats")
+                rng = random.Random(seed)
+                for _ in range(FUZZ_STEPS):
+                    operation = rng.choice(["complete", "complete", "purchase", "auto_mine", "adjust", "flush", "snapshot"])
+                    if operation == "complete":
+                        await self.complete(rng.choice(["low", "medium", "high"]))
+                    elif operation == "purchase":
+                        upgrade = rng.choice([upgrade["id"] for upgrade in server.AVAILABLE_UPGRADES])
+                        await self.api.post(f"/game/upgrade/{upgrade}")
+                    elif operation == "auto_mine":
+                        await self.auto_mine(rng.randint(1, 120))
+                    elif operation == "adjust":
+                        await self.api.post("/game/stats", json={"coins": rng.randint(0, 20000)})
+                    elif operation == "flush":
+                        await server.flush_reward_ledger()
+                    else:
+                        await server.snapshot_game_stats()
+                    await self.assert_replay_matches()
+
+
+if __name__ == "__main__":
+    unittest.main()
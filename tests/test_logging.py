@@ -0,0 +1,38 @@
+"""Queued JSON logging across shutdown and restart."""
+import io
+import json
+import logging
+import unittest
+from logging.handlers import QueueHandler
+from unittest import mock
+
+import tests.support  # noqa: F401  (puts backend/ on sys.path)
+from logging_config import configure_logging, shutdown_logging
+
+logger = logging.getLogger("tests.logging")
+
+
+class LoggingLifecycleTest(unittest.TestCase):
+    def setUp(self):
+        shutdown_logging()
+        self.addCleanup(configure_logging)
+        self.addCleanup(shutdown_logging)
+        self.output = io.StringIO()
+
+    def messages(self) -> list:
+        return [json.loads(line)["message"] for line in self.output.getvalue().splitlines()]
+
+    def test_records_are_written_across_restarts(self):
+        for cycle in range(2):
+            with mock.patch("sys.stdout", self.output):
+                configure_logging()
+            logger.info("queued %d", cycle)
+            shutdown_logging()
+            logger.info("after shutdown %d", cycle)
+
+        self.assertEqual(self.messages(), ["queued 0", "after shutdown 0", "queued 1", "after shutdown 1"])
+        self.assertFalse(any(isinstance(handler, QueueHandler) for handler in logging.getLogger().handlers))
+
+
+if __name__ == "__main__":
+    unittest.main()
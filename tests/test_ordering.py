@@ -0,0 +1,201 @@
+"""Manual todo ordering with fractional ranks."""
+import random
+import unittest
+from unittest import mock
+
+from tests.support import MongoApiTestCase, mongo_available
+
+import server  # backend/ is on sys.path via tests.support
+from ranking import rank_between
+
+
+class RankTest(unittest.TestCase):
+    def test_random_inserts_stay_ordered_and_unique(self):
+        random.seed(7)
+        ranks = [rank_between(None, None)]
+        for _ in range(5000):
+            i = random.randint(0, len(ranks))
+            ranks.insert(i, rank_between(ranks[i - 1] if i else None, ranks[i] if i < len(ranks) else None))
+
+        self.assertEqual(ranks, sorted(ranks))
+        self.assertEqual(len(set(ranks)), len(ranks))
+
+    def test_appends_and_prepends_stay_short(self):
+        last = first = rank_between(None, None)
+        for _ in range(100000):
+            last = rank_between(last, None)
+        for _ in range(10000):
+            first = rank_between(None, first)
+        self.assertLessEqual(len(last), 4)
+        self.assertLessEqual(len(first), 4)
+
+    def test_out_of_order_neighbours_are_rejected(self):
+        with self.assertRaises(ValueError):
+            rank_between("a5", "a5")
+        with self.assertRaises(ValueError):
+            rank_between("a6", "a5")
+
+
+class OverlappingRebalance:
+    """Todos collection that runs a full rebalance just before its first update"""
+
+    def __init__(self, todos):
+        self._todos = todos
+        self.ran = False
+
+    def __getattr__(self, name):
+        return getattr(self._todos, name)
+
+    async def find_one_and_update(self, *args, **kwargs):
+        if not self.ran:
+            self.ran = True
+            await server.rebalance_ranks(force=True)
+        return await self._todos.find_one_and_update(*args, **kwargs)
+
+
+class RebalanceBeforeInsert:
+    """Todos collection that runs a full rebalance just before its first insert"""
+
+    def __init__(self, todos):
+        self._todos = todos
+        self.ran = False
+
+    def __getattr__(self, name):
+        return getattr(self._todos, name)
+
+    async def rebalance_once(self):
+        if not self.ran:
+            self.ran = True
+            await server.rebalance_ranks(force=True)
+
+    async def insert_one(self, *args, **kwargs):
+        await self.rebalance_once()
+        return await self._todos.insert_one(*args, **kwargs)
+
+    async def insert_many(self, *args, **kwargs):
+        await self.rebalance_once()
+        return await self._todos.insert_many(*args, **kwargs)
+
+
+@unittest.skipUnless(mongo_available(), "MongoDB is not reachable")
+class MoveApiTest(MongoApiTestCase):
+    DB_NAME = "todo_mining_ordering_test"
+
+    async def asyncSetUp(self):
+        await super().asyncSetUp()
+        self.ids = [(await self.api.post("/todos", json={"title": f"todo {i}"})).json()["id"] for i in range(5)]
+
+    async def order(self) -> list:
+        return [todo["id"] for todo in (await self.api.get("/todos")).json()]
+
+    async def move(self, todo_id, previous_id=None, next_id=None):
+        return await self.api.post(f"/todos/{todo_id}/move", json={"previous_id": previous_id, "next_id": next_id})
+
+    async def test_move_writes_only_the_moved_todo(self):
+        a, b, c, d, e = self.ids
+        self.assertEqual(await self.order(), self.ids)
+        before = {doc["_id"]: doc["v"] async for doc in server.db.todos.find()}
+
+        self.assertEqual((await self.move(e, next_id=a)).status_code, 200)
+        self.assertEqual((await self.move(a, previous_id=c, next_id=d)).status_code, 200)
+
+        self.assertEqual(await self.order(), [e, b, c, a, d])
+        after = {doc["_id"]: doc["v"] async for doc in server.db.todos.find()}
+        self.assertEqual(sum(after[key] != before[key] for key in before), 2)
+
+    async def test_completed_todos_sort_after_open_ones(self):
+        await self.api.put(f"/todos/{self.ids[0]}", json={"completed": True})
+        self.assertEqual(await self.order(), [*self.ids[1:], self.ids[0]])
+
+    async def test_rebalance_compacts_ranks_and_keeps_order(self):
+        a, b = self.ids[0], self.ids[1]
+        # Keep inserting right after `a` so the gap before `b` shrinks
+        for todo_id in self.ids[2:]:
+            response = await self.move(todo_id, previous_id=a, next_id=b)
+            self.assertEqual(response.status_code, 200)
+            b = todo_id
+        order = await self.order()
+
+        self.assertGreater(await server.rebalance_ranks(force=True), 0)
+
+        self.assertEqual(await self.order(), order)
+        ranks = [todo["rank"] for todo in (await self.api.get("/todos")).json()]
+        self.assertTrue(all(len(rank) == 2 for rank in ranks))
+        self.assertEqual(await server.rebalance_ranks(), 0)
+
+    async def test_unranked_neighbour_triggers_a_rebalance(self):
+        a, b, c = self.ids[:3]
+        # Todos created before ranks existed have none; they sort first
+        await server.db.todos.update_one(server.todo_query({"id": a}, False), {"$unset": {"r": ""}})
+
+        response = await self.move(c, previous_id=a, next_id=b)
+
+        self.assertEqual(response.status_code, 200)
+        order = await self.order()
+        self.assertLess(order.index(a), order.index(c))
+        self.assertLess(order.index(c), order.index(b))
+
+    async def set_ranks(self, ranks: dict):
+        for todo_id, rank in ranks.items():
+            await server.db.todos.update_one(server.todo_query({"id": todo_id}, False), {"$set": {"r": rank}})
+
+    async def test_move_overlapping_a_rebalance_is_redone(self):
+        a, b, c, d, e = self.ids
+        await self.set_ranks({a: "Zy", b: "Zz", c: "a0", d: "a1", e: "a2"})
+
+        # The rebalance renumbers everything after the move read its neighbours
+        with mock.patch.object(server, "db", mock.Mock(wraps=server.db, todos=OverlappingRebalance(server.db.todos))):
+            response = await self.move(e, previous_id=a, next_id=b)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(await self.order(), [a, e, b, c, d])
+
+    async def test_create_overlapping_a_rebalance_lands_at_the_bottom(self):
+        # Ranks the rebalance will renumber upwards, past the new todo's
+        await self.set_ranks(dict(zip(self.ids, ["Zv", "Zw", "Zx", "Zy", "Zz"])))
+
+        todos = RebalanceBeforeInsert(server.db.todos)
+        with mock.patch.object(server, "db", mock.Mock(wraps=server.db, todos=todos)):
+            response = await self.api.post("/todos", json={"title": "new"})
+
+        self.assertTrue(todos.ran)
+        self.assertEqual(await self.order(), [*self.ids, response.json()["id"]])
+        self.assertEqual(response.json()["rank"], (await self.api.get("/todos")).json()[-1]["rank"])
+
+    async def test_import_overlapping_a_rebalance_lands_at_the_bottom(self):
+        await self.set_ranks(dict(zip(self.ids, ["Zv", "Zw", "Zx", "Zy", "Zz"])))
+        body = "".join(f'{{"id": "imported-{i}", "title": "imported {i}"}}\n' for i in range(3))
+
+        with mock.patch.object(server, "db", mock.Mock(wraps=server.db, todos=RebalanceBeforeInsert(server.db.todos))):
+            response = await self.api.post("/todos/import", content=body, headers={"Content-Type": "application/x-ndjson"})
+
+        self.assertEqual(response.json()["imported"], 3)
+        self.assertEqual(await self.order(), [*self.ids, "imported-0", "imported-1", "imported-2"])
+
+    async def test_reversed_neighbours_are_rejected_without_a_rebalance(self):
+        a, b, c = self.ids[:3]
+
+        response = await self.move(c, previous_id=b, next_id=a)
+
+        self.assertEqual(response.status_code, 409)
+        self.assertIsNone(await server.db.rank_state.find_one({}))
+        self.assertEqual(await self.order(), self.ids)
+
+    async def test_forced_rebalances_are_rate_limited(self):
+        a, b, c = self.ids[:3]
+        await server.rebalance_ranks(force=True)
+        await self.set_ranks({b: (await server.db.todos.find_one(server.todo_query({"id": a}, False)))["r"]})
+        epoch = (await server.db.rank_state.find_one({}))["epoch"]
+
+        response = await self.move(c, previous_id=a, next_id=b)
+
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual((await server.db.rank_state.find_one({}))["epoch"], epoch)
+
+    async def test_unknown_neighbour(self):
+        response = await self.move(self.ids[0], previous_id="00000000-0000-0000-0000-000000000000")
+        self.assertEqual(response.status_code, 404)
+
+
+if __name__ == "__main__":
+    unittest.main()
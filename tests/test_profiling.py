@@ -0,0 +1,90 @@
+"""Request profiling triggered by the secret header."""
+import asyncio
+import json
+import tempfile
+import unittest
+from pathlib import Path
+
+import httpx
+from fastapi import FastAPI
+
+import tests.support  # noqa: F401  (puts backend/ on sys.path)
+from profiling import PROFILE_HEADER, ProfilingMiddleware
+
+
+def scope_with(*headers) -> dict:
+    return {"type": "http", "headers": [(name.encode("latin-1"), value.encode("latin-1")) for name, value in headers]}
+
+
+class ShouldProfileTest(unittest.TestCase):
+    def setUp(self):
+        self.middleware = ProfilingMiddleware(app=None, output_dir="/tmp", secret="s3cret")
+
+    def test_only_the_exact_secret_profiles(self):
+        self.assertTrue(self.middleware.should_profile(scope_with((PROFILE_HEADER, "s3cret"))))
+        for value in ["", "s3cre", "s3cret ", "s3crét"]:
+            with self.subTest(value=value):
+                self.assertFalse(self.middleware.should_profile(scope_with((PROFILE_HEADER, value))))
+        self.assertFalse(self.middleware.should_profile(scope_with()))
+
+    def test_no_secret_disables_the_header(self):
+        middleware = ProfilingMiddleware(app=None, output_dir="/tmp")
+        self.assertFalse(middleware.should_profile(scope_with((PROFILE_HEADER, ""))))
+
+
+class ProfiledRequestTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.output_dir = Path(directory.name)
+        self.release = asyncio.Event()
+
+        app = FastAPI()
+
+        @app.get("/work")
+        async def work():
+            await asyncio.sleep(0.05)
+            return {"ok": True}
+
+        @app.get("/wait")
+        async def wait():
+            await self.release.wait()
+            return {"ok": True}
+
+        middleware = ProfilingMiddleware(app, output_dir=str(self.output_dir), secret="s3cret")
+        self.api = httpx.AsyncClient(transport=httpx.ASGITransport(app=middleware), base_url="http://test")
+        self.addAsyncCleanup(self.api.aclose)
+
+    def summary(self, response: httpx.Response) -> dict:
+        profile_id = response.headers["x-profile-id"]
+        self.assertTrue((self.output_dir / f"{profile_id}.folded").read_text().strip())
+        return json.loads((self.output_dir / f"{profile_id}.json").read_text())
+
+    async def test_profiled_request_writes_stacks_and_summary(self):
+        response = await self.api.get("/work", headers={PROFILE_HEADER: "s3cret"})
+
+        summary = self.summary(response)
+        self.assertEqual((summary["method"], summary["path"]), ("GET", "/work"))
+        self.assertGreater(summary["samples"], 0)
+        self.assertGreaterEqual(summary["wall_seconds"], 0.05)
+        self.assertEqual(summary["concurrent_requests"], 0)
+
+    async def test_unprofiled_request_writes_nothing(self):
+        response = await self.api.get("/work")
+
+        self.assertNotIn("x-profile-id", response.headers)
+        self.assertEqual(list(self.output_dir.iterdir()), [])
+
+    async def test_requests_sharing_the_loop_are_counted(self):
+        waiting = asyncio.create_task(self.api.get("/wait"))
+        await asyncio.sleep(0.01)
+        profiled = asyncio.create_task(self.api.get("/work", headers={PROFILE_HEADER: "s3cret"}))
+        await asyncio.sleep(0.01)
+        self.release.set()
+
+        await waiting
+        self.assertEqual(self.summary(await profiled)["concurrent_requests"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,131 @@
+"""Recurring todo templates materialized lazily from RRULE schedules."""
+import unittest
+from datetime import datetime, timedelta
+
+from tests.support import MongoApiTestCase, mongo_available
+
+import server  # backend/ is on sys.path via tests.support
+from recurrence import latest_due, next_due, occurrences_between, parse_rule, utc_now
+from schema import todo_to_doc
+
+
+class RuleTest(unittest.TestCase):
+    def test_weekly_rule_occurrences(self):
+        # 2024-01-01 was a Monday
+        rule = parse_rule("FREQ=WEEKLY;BYDAY=MO,TH;BYHOUR=9", datetime(2024, 1, 1, 9))
+
+        self.assertEqual(
+            occurrences_between(rule, datetime(2024, 1, 1), datetime(2024, 1, 12), limit=10),
+            [datetime(2024, 1, 1, 9), datetime(2024, 1, 4, 9), datetime(2024, 1, 8, 9), datetime(2024, 1, 11, 9)]
+        )
+        self.assertEqual(latest_due(rule, datetime(2024, 1, 7)), datetime(2024, 1, 4, 9))
+        self.assertEqual(next_due(rule, datetime(2024, 1, 4, 9)), datetime(2024, 1, 8, 9))
+
+    def test_rules_that_end(self):
+        rule = parse_rule("FREQ=DAILY;COUNT=2", datetime(2024, 1, 1))
+        self.assertIsNone(next_due(rule, datetime(2024, 1, 2)))
+
+    def test_utc_until(self):
+        rule = parse_rule("FREQ=DAILY;UNTIL=20240103T000000Z", datetime(2024, 1, 1))
+        self.assertEqual(occurrences_between(rule, datetime(2024, 1, 1), datetime(2024, 2, 1), limit=10),
+                         [datetime(2024, 1, 1), datetime(2024, 1, 2), datetime(2024, 1, 3)])
+
+    def test_invalid_rules(self):
+        for rule in ("FREQ=MINUTELY", "BYDAY=MO", "FREQ=DAILY;BYDAY=XX", "DTSTART:20240101T000000\nRRULE:FREQ=DAILY"):
+            with self.subTest(rule=rule), self.assertRaises(ValueError):
+                parse_rule(rule, datetime(2024, 1, 1))
+
+
+@unittest.skipUnless(mongo_available(), "MongoDB is not reachable")
+class RecurringApiTest(MongoApiTestCase):
+    DB_NAME = "todo_mining_recurring_test"
+    ENSURE_INDEXES = True
+
+    async def create(self, rule="FREQ=DAILY", days_ago=0, **fields):
+        start = utc_now() - timedelta(days=days_ago)
+        body = {"title": "Water plants", "priority": "high", "rule": rule, "start": start.isoformat(), **fields}
+        return await self.api.post("/recurring", json=body)
+
+    async def instances(self) -> list:
+        return [todo for todo in (await self.api.get("/todos")).json() if todo["template_id"]]
+
+    async def test_due_template_materializes_one_todo(self):
+        template = (await self.create(days_ago=10)).json()
+
+        todos = await self.instances()
+        self.assertEqual(len(todos), 1)  # only the latest missed occurrence
+        self.assertEqual(todos[0]["template_id"], template["id"])
+        self.assertEqual(await server.materialize_due_templates(), 0)
+        self.assertEqual(await server.db.todo_templates.count_documents({}), 1)
+        self.assertGreater(datetime.fromisoformat(template["next_due"]), utc_now())
+
+    async def test_templates_falling_due_wait_for_the_job_not_for_reads(self):
+        start = utc_now() - timedelta(days=3)
+        template = server.RecurringTemplate(
+            title="Stretch", priority="low", category="health", rule="FREQ=DAILY", start=start, next_due=start
+        )
+        await server.db.todo_templates.insert_one(template.dict())
+
+        self.assertEqual(await self.instances(), [])
+        self.assertEqual(await server.materialize_due_templates(), 1)
+        self.assertEqual(len(await self.instances()), 1)
+
+    async def test_future_template_stores_nothing_until_due(self):
+        start = utc_now() + timedelta(days=1, hours=1)
+        await self.api.post("/recurring", json={"title": "Later", "rule": "FREQ=DAILY", "start": start.isoformat()})
+
+        self.assertEqual(await self.instances(), [])
+        upcoming = (await self.api.get("/recurring/upcoming", params={"days": 4})).json()
+        self.assertEqual(len(upcoming), 3)
+        self.assertEqual(await server.db.todos.count_documents({}), 0)
+
+    async def test_completing_occurrences_rewards_and_extends_the_streak(self):
+        template = (await self.create(days_ago=1)).json()
+        todo = (await self.instances())[0]
+
+        await self.api.put(f"/todos/{todo['id']}", json={"completed": True})
+
+        self.assertEqual((await self.api.get("/game/stats")).json()["coins"], 50)
+        stored = await server.db.todo_templates.find_one({"id": template["id"]})
+        self.assertEqual((stored["streak"], stored["best_streak"]), (1, 1))
+
+        # The next occurrence comes due while the last one was completed
+        await server.db.todo_templates.update_one({"id": template["id"]}, {"$set": {"next_due": utc_now()}})
+        await server.materialize_template(
+            await server.db.todo_templates.find_one({"id": template["id"]}), utc_now() + timedelta(days=1)
+        )
+        stored = await server.db.todo_templates.find_one({"id": template["id"]})
+        self.assertEqual(stored["streak"], 1)
+
+        # ... and the one after that is missed: the streak breaks
+        await server.db.todo_templates.update_one({"id": template["id"]}, {"$set": {"next_due": utc_now()}})
+        await server.materialize_template(
+            await server.db.todo_templates.find_one({"id": template["id"]}), utc_now() + timedelta(days=2)
+        )
+        stored = await server.db.todo_templates.find_one({"id": template["id"]})
+        self.assertEqual((stored["streak"], stored["best_streak"]), (0, 1))
+        self.assertEqual(await server.db.todos.count_documents({}), 3)
+
+    async def test_concurrent_materialization_inserts_once(self):
+        template = (await self.create()).json()
+        stored = await server.db.todo_templates.find_one({"id": template["id"]})
+        occurrence = stored["last_occurrence"]
+        duplicate = server.Todo(
+            title="dup", priority="low", category="other", template_id=template["id"], occurrence=occurrence
+        )
+
+        with self.assertRaises(server.DuplicateKeyError):
+            await server.db.todos.insert_one(todo_to_doc(duplicate.dict()))
+
+    async def test_invalid_rule_and_delete(self):
+        self.assertEqual((await self.create(rule="FREQ=SECONDLY")).status_code, 400)
+
+        template = (await self.create()).json()
+        self.assertEqual((await self.api.delete(f"/recurring/{template['id']}")).status_code, 200)
+        self.assertEqual((await self.api.get("/recurring")).json(), [])
+        self.assertEqual(len(await self.instances()), 1)  # materialized todos are kept
+        self.assertEqual((await self.api.delete(f"/recurring/{template['id']}")).status_code, 404)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,187 @@
+"""Deadlines, circuit breaking and stale fallbacks under injected Mongo faults."""
+import asyncio
+import time
+import unittest
+
+from pymongo.errors import ExecutionTimeout
+
+from tests.support import Faults, FaultyDatabase, MongoApiTestCase, mongo_available
+
+import server  # backend/ is on sys.path via tests.support
+from resilience import CircuitBreaker, DatabaseUnavailable
+
+
+class CircuitBreakerTest(unittest.IsolatedAsyncioTestCase):
+    async def fail(self):
+        raise asyncio.TimeoutError()
+
+    async def succeed(self):
+        return "ok"
+
+    async def test_opens_after_threshold_and_fails_fast(self):
+        breaker = CircuitBreaker(failure_threshold=3, reset_timeout=60)
+        for _ in range(3):
+            with self.assertRaises(DatabaseUnavailable):
+                await breaker.call(self.fail, timeout=1)
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+
+        calls = []
+
+        async def tracked():
+            calls.append(1)
+            return "ok"
+
+        with self.assertRaises(DatabaseUnavailable):
+            await breaker.call(tracked, timeout=1)
+        self.assertEqual(calls, [])
+
+    async def test_half_open_probe_closes_or_reopens(self):
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.05)
+        with self.assertRaises(DatabaseUnavailable):
+            await breaker.call(self.fail, timeout=1)
+        await asyncio.sleep(0.06)
+        self.assertEqual(breaker.state, CircuitBreaker.HALF_OPEN)
+
+        with self.assertRaises(DatabaseUnavailable):
+            await breaker.call(self.fail, timeout=1)
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+
+        await asyncio.sleep(0.06)
+        self.assertEqual(await breaker.call(self.succeed, timeout=1), "ok")
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+
+    async def test_deadline_counts_as_failure(self):
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=60)
+
+        async def slow():
+            await asyncio.sleep(1)
+
+        started = time.monotonic()
+        with self.assertRaises(DatabaseUnavailable):
+            await breaker.call(slow, timeout=0.05)
+        self.assertLess(time.monotonic() - started, 0.5)
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+
+
+@unittest.skipUnless(mongo_available(), "MongoDB is not reachable")
+class DegradedModeTest(MongoApiTestCase):
+    DB_NAME = "todo_mining_resilience_test"
+
+    def wrap_database(self, database):
+        self.faults = Faults()
+        return FaultyDatabase(database, self.faults)
+
+    async def asyncSetUp(self):
+        await super().asyncSetUp()
+        # A twitchy breaker and a short deadline for this test only
+        self.patch(server, "mongo_breaker", CircuitBreaker(failure_threshold=2, reset_timeout=0.5))
+        self.patch(server, "last_known_good", server.LastKnownGood())
+        self.patch(server, "READ_DEADLINE_SECONDS", 0.2)
+
+    async def test_slow_database_serves_stale_stats_within_deadline(self):
+        fresh = await self.api.get("/game/stats")
+        self.assertEqual(fresh.status_code, 200)
+        self.assertNotIn("x-stale", fresh.headers)
+
+        self.faults.latency = 2.0
+        started = time.monotonic()
+        stale = await self.api.get("/game/stats")
+        self.assertLess(time.monotonic() - started, 1.0)
+        self.assertEqual(stale.status_code, 200)
+        self.assertEqual(stale.headers["x-stale"], "true")
+        self.assertEqual(stale.json()["coins"], fresh.json()["coins"])
+
+    async def test_outage_opens_breaker_and_writes_fail_fast(self):
+        self.assertEqual((await self.api.get("/game/upgrades")).status_code, 200)
+
+        self.faults.error_rate = 1.0
+        for _ in range(2):
+            response = await self.api.get("/game/upgrades")
+            self.assertEqual(response.headers["x-stale"], "true")
+        self.assertEqual(server.mongo_breaker.state, CircuitBreaker.OPEN)
+
+        calls_before = self.faults.calls
+        response = await self.api.post("/todos", json={"title": "during outage"})
+        self.assertEqual(response.status_code, 503)
+        self.assertIn("retry-after", response.headers)
+        self.assertEqual(self.faults.calls, calls_before)
+
+    async def test_server_side_timeout_on_a_write_is_503(self):
+        self.faults.error, self.faults.error_rate = ExecutionTimeout, 1.0
+
+        response = await self.api.post("/todos", json={"title": "slow"})
+
+        self.assertEqual(response.status_code, 503)
+        self.assertIn("retry-after", response.headers)
+        self.assertEqual(server.mongo_breaker.consecutive_failures, 1)
+
+    async def test_outage_without_snapshot_is_503(self):
+        self.faults.error_rate = 1.0
+        response = await self.api.get("/todos")
+        self.assertEqual(response.status_code, 503)
+
+    async def test_subtask_reads_serve_stale_during_an_outage(self):
+        parent = (await self.api.post("/todos", json={"title": "parent"})).json()
+        await self.api.post("/todos", json={"title": "child", "parent_id": parent["id"]})
+        subtree = (await self.api.get(f"/todos/{parent['id']}/subtree")).json()
+        progress = (await self.api.get("/todos/progress")).json()
+
+        self.faults.error_rate = 1.0
+        stale_subtree = await self.api.get(f"/todos/{parent['id']}/subtree")
+        stale_progress = await self.api.get("/todos/progress")
+
+        self.assertEqual(stale_subtree.headers["x-stale"], "true")
+        self.assertEqual(stale_subtree.json(), subtree)
+        self.assertEqual(stale_progress.headers["x-stale"], "true")
+        self.assertEqual(stale_progress.json(), progress)
+        self.assertEqual(server.mongo_breaker.state, CircuitBreaker.OPEN)
+
+    async def test_slow_history_serves_stale_within_deadline(self):
+        fresh = await self.api.get("/stats/history", params={"days": 7})
+
+        self.faults.latency = 2.0
+        started = time.monotonic()
+        stale = await self.api.get("/stats/history", params={"days": 7})
+
+        self.assertLess(time.monotonic() - started, 1.0)
+        self.assertEqual(stale.headers["x-stale"], "true")
+        self.assertEqual(stale.json(), fresh.json())
+        # Each range is its own snapshot
+        self.assertEqual((await self.api.get("/stats/history", params={"days": 30})).status_code, 503)
+
+    async def test_missing_subtree_is_404_without_tripping_the_breaker(self):
+        for _ in range(3):
+            response = await self.api.get("/todos/00000000-0000-0000-0000-000000000000/subtree")
+            self.assertEqual(response.status_code, 404)
+        self.assertEqual(server.mongo_breaker.state, CircuitBreaker.CLOSED)
+
+    async def test_recovers_after_reset_timeout(self):
+        await self.api.get("/game/stats")
+        self.faults.error_rate = 1.0
+        for _ in range(2):
+            await self.api.get("/game/stats")
+        self.assertEqual(server.mongo_breaker.state, CircuitBreaker.OPEN)
+
+        self.faults.error_rate = 0.0
+        await asyncio.sleep(0.6)
+        response = await self.api.get("/game/stats")
+        self.assertNotIn("x-stale", response.headers)
+        self.assertEqual(server.mongo_breaker.state, CircuitBreaker.CLOSED)
+
+    async def test_probe_ending_in_an_http_error_releases_the_slot(self):
+        self.faults.error_rate = 1.0
+        for _ in range(2):
+            await self.api.get("/game/stats")
+        self.faults.error_rate = 0.0
+        await asyncio.sleep(0.6)
+
+        # The half-open probe is a write that fails with 404
+        response = await self.api.delete("/todos/00000000-0000-0000-0000-000000000000")
+        self.assertEqual(response.status_code, 404)
+
+        self.assertEqual((await self.api.post("/game/auto-mine")).status_code, 200)
+        self.assertEqual(server.mongo_breaker.state, CircuitBreaker.CLOSED)
+
+
+if __name__ == "__main__":
+    unittest.main()
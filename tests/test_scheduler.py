@@ -0,0 +1,103 @@
+"""Background jobs and the Mongo lease that elects one worker to run each."""
+import asyncio
+import random
+import unittest
+from unittest import mock
+
+from tests.support import MongoTestCase, mongo_available
+
+from scheduler import Job, JobScheduler, LeaseLock  # backend/ is on sys.path via tests.support
+
+
+class JobTest(unittest.IsolatedAsyncioTestCase):
+    def scheduler(self) -> JobScheduler:
+        scheduler = JobScheduler(lease_collection=None, worker_id="w1")
+        scheduler.lock = mock.Mock(acquire=mock.AsyncMock(return_value=True))
+        return scheduler
+
+    def test_jitter_stays_within_bounds(self):
+        job = Job("j", func=None, interval=10, jitter=0.2, timeout=5)
+        random.seed(3)
+        delays = [job.next_delay() for _ in range(10000)]
+        self.assertGreaterEqual(min(delays), 8)
+        self.assertLessEqual(max(delays), 12)
+        self.assertLess(min(delays), 8.1)
+        self.assertGreater(max(delays), 11.9)
+
+    async def test_job_exceeding_its_timeout_is_cancelled_and_counted(self):
+        cancelled = asyncio.Event()
+
+        async def slow():
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        scheduler = self.scheduler()
+        scheduler.add_job("slow", slow, interval=60, timeout=0.05)
+
+        self.assertTrue(await scheduler.run_once(scheduler.jobs["slow"]))
+
+        self.assertTrue(cancelled.is_set())
+        self.assertEqual((scheduler.jobs["slow"].runs, scheduler.jobs["slow"].failures), (1, 1))
+
+    async def test_job_is_skipped_without_the_lease(self):
+        calls = []
+
+        async def job():
+            calls.append(1)
+
+        scheduler = self.scheduler()
+        scheduler.lock.acquire.return_value = False
+        scheduler.add_job("job", job, interval=60)
+
+        self.assertFalse(await scheduler.run_once(scheduler.jobs["job"]))
+        self.assertEqual((calls, scheduler.jobs["job"].runs), ([], 0))
+
+
+@unittest.skipUnless(mongo_available(), "MongoDB is not reachable")
+class LeaseLockTest(MongoTestCase):
+    DB_NAME = "todo_mining_scheduler_test"
+
+    async def asyncSetUp(self):
+        await super().asyncSetUp()
+        leases = self.database.job_leases
+        self.first, self.second = LeaseLock(leases, "first"), LeaseLock(leases, "second")
+
+    async def test_only_one_owner_holds_the_lease(self):
+        results = await asyncio.gather(*(lock.acquire("job", ttl=60) for lock in [self.first, self.second] * 5))
+
+        self.assertEqual(len({lock.owner for lock, held in zip([self.first, self.second] * 5, results) if held}), 1)
+
+    async def test_expired_lease_is_taken_over(self):
+        self.assertTrue(await self.first.acquire("job", ttl=0.05))
+        self.assertFalse(await self.second.acquire("job", ttl=0.05))
+
+        await asyncio.sleep(0.1)
+
+        self.assertTrue(await self.second.acquire("job", ttl=60))
+        self.assertFalse(await self.first.acquire("job", ttl=60))
+
+    async def test_renewed_lease_is_not_stolen(self):
+        self.assertTrue(await self.first.acquire("job", ttl=0.3))
+        await asyncio.sleep(0.2)
+        self.assertTrue(await self.first.acquire("job", ttl=0.3))
+
+        # Past the first expiry, within the renewed one
+        await asyncio.sleep(0.2)
+
+        self.assertFalse(await self.second.acquire("job", ttl=60))
+
+    async def test_released_lease_is_free(self):
+        await self.first.acquire("job", ttl=60)
+        await self.second.release("job")  # not the holder: no effect
+        self.assertFalse(await self.second.acquire("job", ttl=60))
+
+        await self.first.release("job")
+
+        self.assertTrue(await self.second.acquire("job", ttl=60))
+
+
+if __name__ == "__main__":
+    unittest.main()
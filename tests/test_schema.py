@@ -0,0 +1,100 @@
+"""Compact todo document layout and the online migration from the legacy one."""
+import unittest
+import uuid
+from datetime import datetime
+
+from bson.binary import Binary
+
+from tests.support import MongoApiTestCase, mongo_available
+
+import server  # backend/ is on sys.path via tests.support
+from schema import todo_from_doc, todo_query, todo_to_doc, upgrade_pipeline
+
+
+def legacy_todo(**fields) -> dict:
+    todo = {
+        "id": str(uuid.uuid4()),
+        "title": "legacy",
+        "description": "",
+        "priority": "high",
+        "category": "learning",
+        "completed": False,
+        "created_at": datetime(2024, 1, 1),
+        "completed_at": None,
+    }
+    todo.update(fields)
+    return todo
+
+
+class TodoCodecTest(unittest.TestCase):
+    def test_round_trip_through_compact_document(self):
+        todo = server.Todo(title="Ship it", priority="low", category="work")
+
+        document = todo_to_doc(todo.dict())
+
+        self.assertEqual(document["p"], 0)
+        self.assertEqual(document["c"], 0)
+        self.assertIsInstance(document["i"], Binary)
+        self.assertNotIn("title", document)
+        self.assertEqual(server.Todo(**todo_from_doc(document)), todo)
+
+    def test_subtasks_store_ancestors_and_derive_parent(self):
+        root, parent = str(uuid.uuid4()), str(uuid.uuid4())
+        todo = server.Todo(title="child", priority="low", category="work", parent_id=parent, ancestors=[root, parent])
+
+        document = todo_to_doc(todo.dict())
+
+        self.assertEqual(document["a"], [Binary.from_uuid(uuid.UUID(root)), Binary.from_uuid(uuid.UUID(parent))])
+        self.assertEqual(server.Todo(**todo_from_doc(document)), todo)
+        self.assertNotIn("a", todo_to_doc(server.Todo(title="top", priority="low", category="work").dict()))
+
+    def test_non_uuid_ids_are_kept_as_strings(self):
+        todo = server.Todo(id="imported-42", title="x", priority="medium", category="other")
+        self.assertEqual(todo_to_doc(todo.dict())["i"], "imported-42")
+        self.assertEqual(todo_from_doc(todo_to_doc(todo.dict()))["id"], "imported-42")
+
+    def test_legacy_documents_read_unchanged(self):
+        document = legacy_todo()
+        self.assertEqual(todo_from_doc({"_id": "oid", **document}), document)
+
+    def test_query_matches_legacy_layout_only_while_needed(self):
+        self.assertEqual(todo_query({"completed": True}, include_legacy=False), {"x": True})
+        self.assertEqual(
+            todo_query({"completed": True}, include_legacy=True),
+            {"$or": [{"x": True}, {"completed": True}]}
+        )
+
+
+@unittest.skipUnless(mongo_available(), "MongoDB is not reachable")
+class LegacyMigrationTest(MongoApiTestCase):
+    DB_NAME = "todo_mining_schema_test"
+
+    async def test_upgrade_pipeline_rewrites_in_place(self):
+        document = legacy_todo(version=3)
+        await server.db.todos.insert_one(document)
+
+        await server.db.todos.update_one({"id": document["id"]}, upgrade_pipeline(document["id"]))
+
+        stored = await server.db.todos.find_one({"_id": document["_id"]})
+        self.assertEqual(set(stored) - {"_id"}, {"s", "i", "t", "d", "p", "c", "x", "ca", "cc", "v"})
+        self.assertEqual((stored["p"], stored["c"], stored["v"]), (2, 3, 3))
+        self.assertEqual(todo_from_doc(stored)["id"], document["id"])
+
+    async def test_mixed_collection_is_served_and_legacy_todos_upgrade_on_write(self):
+        legacy = legacy_todo()
+        await server.db.todos.insert_one(dict(legacy))
+        created = (await self.api.post("/todos", json={"title": "compact"})).json()
+
+        listed = {todo["id"]: todo for todo in (await self.api.get("/todos")).json()}
+        self.assertEqual(set(listed), {legacy["id"], created["id"]})
+        self.assertEqual(listed[legacy["id"]]["priority"], "high")
+
+        response = await self.api.put(f"/todos/{legacy['id']}", json={"completed": True}, headers={"If-Match": '"0"'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers["etag"], '"1"')
+        self.assertEqual((await self.api.get("/game/stats")).json()["coins"], 50)
+        self.assertEqual(await server.db.todos.count_documents({"id": {"$exists": True}}), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
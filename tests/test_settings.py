@@ -0,0 +1,67 @@
+"""MongoDB client settings read from MONGO_* variables."""
+import os
+import unittest
+from unittest import mock
+
+from pydantic import ValidationError
+
+import tests.support  # noqa: F401  (puts backend/ on sys.path)
+from settings import MongoSettings
+
+REQUIRED = {"MONGO_URL": "mongodb://db:27017", "DB_NAME": "todos"}
+
+
+def settings_from(**variables) -> MongoSettings:
+    with mock.patch.dict(os.environ, {**REQUIRED, **variables}, clear=True):
+        return MongoSettings.from_env()
+
+
+class MongoSettingsTest(unittest.TestCase):
+    def test_defaults(self):
+        settings = settings_from()
+
+        self.assertEqual((settings.url, settings.db_name), ("mongodb://db:27017", "todos"))
+        self.assertEqual(settings.client_kwargs(), {
+            "minPoolSize": 0,
+            "maxPoolSize": 100,
+            "readPreference": "primary",
+            "serverSelectionTimeoutMS": 5000,
+            "connectTimeoutMS": 20000,
+        })
+
+    def test_variables_are_parsed(self):
+        settings = settings_from(
+            MONGO_MAX_POOL_SIZE="20",
+            MONGO_COMPRESSORS=" zstd, snappy ,zlib",
+            MONGO_ZLIB_COMPRESSION_LEVEL="6",
+            MONGO_READ_PREFERENCE="secondaryPreferred",
+            MONGO_OPERATION_TIMEOUT_MS="1500",
+            MONGO_SOCKET_TIMEOUT_MS="",
+        )
+
+        kwargs = settings.client_kwargs()
+        self.assertEqual(kwargs["maxPoolSize"], 20)
+        self.assertEqual(kwargs["compressors"], "zstd,snappy,zlib")
+        self.assertEqual(kwargs["zlibCompressionLevel"], 6)
+        self.assertEqual(kwargs["readPreference"], "secondaryPreferred")
+        self.assertEqual(kwargs["timeoutMS"], 1500)
+        self.assertNotIn("socketTimeoutMS", kwargs)
+
+    def test_url_and_database_come_from_their_own_variables(self):
+        settings = settings_from(MONGO_DB_NAME="other")
+        self.assertEqual(settings.db_name, "todos")
+
+    def test_invalid_values_are_rejected(self):
+        for name, value in [
+            ("MONGO_COMPRESSORS", "zstd,lz4"),
+            ("MONGO_READ_PREFERENCE", "fastest"),
+            ("MONGO_MAX_POOL_SIZE", "0"),
+            ("MONGO_ZLIB_COMPRESSION_LEVEL", "10"),
+            ("MONGO_CONNECT_TIMEOUT_MS", "soon"),
+        ]:
+            with self.subTest(name=name), self.assertRaises(ValidationError):
+                settings_from(**{name: value})
+
+
+if __name__ == "__main__":
+    unittest.main()
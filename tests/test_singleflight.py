@@ -0,0 +1,68 @@
+"""Single-flight coalescing of concurrent reads."""
+import asyncio
+import unittest
+
+import tests.support  # noqa: F401  (puts backend/ on sys.path)
+from singleflight import SingleFlight
+
+
+class SingleFlightTest(unittest.IsolatedAsyncioTestCase):
+    async def test_concurrent_calls_share_one_execution(self):
+        flight = SingleFlight()
+        executions = []
+
+        async def load():
+            executions.append(1)
+            await asyncio.sleep(0.01)
+            return {"coins": 10}
+
+        results = await asyncio.gather(*(flight.do("stats", load) for _ in range(50)))
+
+        self.assertEqual(len(executions), 1)
+        self.assertTrue(all(result is results[0] for result in results))
+        self.assertEqual(flight.status(), {"calls": 50, "executions": 1, "collapsed": 49, "in_flight": 0})
+
+    async def test_errors_reach_every_waiter(self):
+        flight = SingleFlight()
+
+        async def fail():
+            await asyncio.sleep(0.01)
+            raise RuntimeError("boom")
+
+        results = await asyncio.gather(*(flight.do("stats", fail) for _ in range(5)), return_exceptions=True)
+        self.assertTrue(all(isinstance(result, RuntimeError) for result in results))
+
+    async def test_forget_starts_a_fresh_call_after_a_write(self):
+        flight = SingleFlight()
+        value = {"coins": 0}
+
+        async def load():
+            snapshot = dict(value)
+            await asyncio.sleep(0.02)
+            return snapshot
+
+        before_write = asyncio.ensure_future(flight.do("stats", load))
+        await asyncio.sleep(0.005)  # let the first load read the old value
+        value["coins"] = 25
+        flight.forget("stats")
+        after_write = await flight.do("stats", load)
+
+        self.assertEqual((await before_write)["coins"], 0)
+        self.assertEqual(after_write["coins"], 25)
+
+    async def test_cancelled_caller_does_not_cancel_others(self):
+        flight = SingleFlight()
+
+        async def load():
+            await asyncio.sleep(0.05)
+            return "done"
+
+        impatient = asyncio.ensure_future(asyncio.wait_for(flight.do("todos", load), timeout=0.01))
+        patient = asyncio.ensure_future(flight.do("todos", load))
+        with self.assertRaises(asyncio.TimeoutError):
+            await impatient
+        self.assertEqual(await patient, "done")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,67 @@
+"""Background startup and the readiness it reports."""
+import asyncio
+import os
+import unittest
+from unittest import mock
+
+import httpx
+
+import tests.support  # noqa: F401  (puts backend/ on sys.path)
+import server
+
+
+class StartupTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.addCleanup(server.readiness.update, dict(server.readiness))
+        server.readiness.update(ready=False, ready_after_ms=None, error=None)
+        self.client = mock.Mock()
+        self.client.admin.command = mock.AsyncMock(return_value={"ok": 1})
+
+    async def test_unexpected_errors_are_reported_and_retried(self):
+        errors = []
+
+        async def ensure_indexes():
+            if not errors:
+                errors.append(server.readiness["error"])
+                raise RuntimeError("bad index spec")
+            # Reported while startup retries
+            errors.append(server.readiness["error"])
+
+        with mock.patch.object(server, "client", self.client), \
+                mock.patch.object(server, "ensure_indexes", ensure_indexes), \
+                mock.patch.object(server, "warm_caches", mock.AsyncMock()), \
+                mock.patch.object(server.asyncio, "sleep", mock.AsyncMock()):
+            await server.startup()
+
+        self.assertEqual(errors, [None, "RuntimeError: bad index spec"])
+        self.assertTrue(server.readiness["ready"])
+        self.assertIsNone(server.readiness["error"])
+
+    async def test_ready_names_the_answering_worker(self):
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=server.app), base_url="http://test/api") as api:
+            starting = await api.get("/ready")
+            server.readiness.update(ready=True, ready_after_ms=12.5)
+            ready = await api.get("/ready")
+
+        self.assertEqual((starting.status_code, starting.json()["pid"]), (503, os.getpid()))
+        self.assertEqual(ready.json(), {"status": "ready", "ready_after_ms": 12.5, "pid": os.getpid()})
+
+    async def test_shutdown_resets_readiness(self):
+        async def startup():
+            server.readiness.update(ready=True, ready_after_ms=1.0)
+
+        # The lifespan rebinds these module globals; patching restores them afterwards
+        with mock.patch.object(server, "client"), mock.patch.object(server, "db"), \
+                mock.patch.object(server, "scheduler"), \
+                mock.patch.object(server, "create_mongo_client", mock.MagicMock()), \
+                mock.patch.object(server, "startup", startup), \
+                mock.patch.object(server, "shutdown_logging"):
+            async with server.lifespan(server.app):
+                await asyncio.sleep(0)
+                self.assertTrue(server.readiness["ready"])
+
+        self.assertFalse(server.readiness["ready"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,79 @@
+"""Subtasks stored with an ancestor array."""
+import unittest
+
+from tests.support import MongoApiTestCase, mongo_available
+
+import server  # backend/ is on sys.path via tests.support
+
+
+@unittest.skipUnless(mongo_available(), "MongoDB is not reachable")
+class SubtaskApiTest(MongoApiTestCase):
+    DB_NAME = "todo_mining_subtasks_test"
+
+    async def asyncSetUp(self):
+        await super().asyncSetUp()
+
+        # project -> (design -> (mockups), build); unrelated stays outside
+        self.project = await self.create("project", priority="high")
+        self.design = await self.create("design", parent_id=self.project)
+        self.mockups = await self.create("mockups", parent_id=self.design)
+        self.build = await self.create("build", parent_id=self.project)
+        self.unrelated = await self.create("unrelated")
+
+    async def create(self, title: str, **fields) -> str:
+        response = await self.api.post("/todos", json={"title": title, **fields})
+        self.assertEqual(response.status_code, 200)
+        return response.json()["id"]
+
+    async def test_subtree_and_ancestors(self):
+        subtree = (await self.api.get(f"/todos/{self.project}/subtree")).json()
+
+        self.assertEqual(subtree[0]["id"], self.project)
+        self.assertEqual({todo["id"] for todo in subtree}, {self.project, self.design, self.mockups, self.build})
+        mockups = next(todo for todo in subtree if todo["id"] == self.mockups)
+        self.assertEqual(mockups["ancestors"], [self.project, self.design])
+        self.assertEqual(mockups["parent_id"], self.design)
+
+    async def test_progress_rolls_up_every_level(self):
+        await self.api.put(f"/todos/{self.mockups}", json={"completed": True})
+
+        progress = (await self.api.get("/todos/progress")).json()
+
+        self.assertEqual(progress, {
+            self.project: {"total": 3, "completed": 1},
+            self.design: {"total": 1, "completed": 1},
+        })
+
+    async def test_completing_a_parent_completes_the_subtree_and_awards_once(self):
+        response = await self.api.put(f"/todos/{self.project}", json={"completed": True})
+        self.assertEqual(response.status_code, 200)
+
+        subtree = (await self.api.get(f"/todos/{self.project}/subtree")).json()
+        self.assertTrue(all(todo["completed"] for todo in subtree))
+        stats = (await self.api.get("/game/stats")).json()
+        self.assertEqual((stats["coins"], stats["total_todos_completed"]), (50, 1))
+
+        # Completing an already completed subtask earns nothing more
+        await self.api.put(f"/todos/{self.build}", json={"completed": True})
+        self.assertEqual((await self.api.get("/game/stats")).json()["coins"], 50)
+
+    async def test_delete_cascades_to_subtasks(self):
+        response = await self.api.delete(f"/todos/{self.design}")
+
+        self.assertEqual(response.json()["deleted"], 2)
+        remaining = {todo["id"] for todo in (await self.api.get("/todos")).json()}
+        self.assertEqual(remaining, {self.project, self.build, self.unrelated})
+
+    async def test_parent_must_exist_and_depth_is_bounded(self):
+        missing = await self.api.post("/todos", json={"title": "orphan", "parent_id": "00000000-0000-0000-0000-000000000000"})
+        self.assertEqual(missing.status_code, 404)
+
+        parent = self.mockups
+        for depth in range(3, server.MAX_TODO_DEPTH + 1):
+            parent = await self.create(f"level {depth}", parent_id=parent)
+        too_deep = await self.api.post("/todos", json={"title": "too deep", "parent_id": parent})
+        self.assertEqual(too_deep.status_code, 400)
+
+
+if __name__ == "__main__":
+    unittest.main()
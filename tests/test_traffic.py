@@ -0,0 +1,96 @@
+"""NDJSON traffic capture."""
+import json
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+import httpx
+from fastapi import FastAPI, Request
+
+import tests.support  # noqa: F401  (puts backend/ on sys.path)
+import traffic
+from compression import CompressionMiddleware
+from traffic import CaptureWriter, TrafficCaptureMiddleware, decode_body
+
+
+def build_app(writer: CaptureWriter) -> FastAPI:
+    app = FastAPI()
+
+    @app.post("/api/echo")
+    async def echo(request: Request):
+        return {"received": len(await request.body())}
+
+    @app.get("/api/large")
+    async def large():
+        return {"data": "x" * 4096}
+
+    @app.get("/health")
+    async def health():
+        return {"status": "ok"}
+
+    app.add_middleware(CompressionMiddleware, minimum_size=1024)
+    app.add_middleware(TrafficCaptureMiddleware, writer=writer)
+    return app
+
+
+class TrafficCaptureTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = Path(directory.name) / "capture.ndjson"
+        self.writer = CaptureWriter(str(self.path))
+        self.writer.start()
+        self.api = httpx.AsyncClient(transport=httpx.ASGITransport(app=build_app(self.writer)), base_url="http://test")
+
+    async def captured(self) -> list:
+        await self.api.aclose()
+        self.writer.stop()
+        return [json.loads(line) for line in self.path.read_text().splitlines()]
+
+    async def test_api_requests_are_captured_with_bodies(self):
+        await self.api.post("/api/echo?dry=1", json={"title": "t"})
+        await self.api.get("/health")
+
+        [entry] = await self.captured()
+
+        self.assertEqual((entry["method"], entry["path"], entry["query"], entry["status"]), ("POST", "/api/echo", "dry=1", 200))
+        self.assertEqual(json.loads(decode_body(entry)), {"title": "t"})
+        self.assertEqual(json.loads(decode_body(entry, "response_")), {"received": len(decode_body(entry))})
+
+    async def test_only_allow_listed_request_headers_are_captured(self):
+        await self.api.post("/api/echo", json={"title": "t"}, headers={
+            "If-Match": '"3"',
+            "Accept": "application/msgpack",
+            "Accept-Encoding": "br",
+            "Authorization": "Bearer secret",
+            "Cookie": "session=secret",
+            "X-Profile": "secret",
+        })
+
+        [entry] = await self.captured()
+
+        self.assertEqual(entry["headers"], {
+            "accept": "application/msgpack",
+            "accept-encoding": "br",
+            "content-type": "application/json",
+            "if-match": '"3"',
+        })
+        self.assertNotIn("secret", json.dumps(entry))
+
+    async def test_compressed_responses_and_large_requests_are_not_kept(self):
+        await self.api.get("/api/large", headers={"Accept-Encoding": "gzip"})
+        with mock.patch.object(traffic, "MAX_CAPTURED_REQUEST", 8):
+            await self.api.post("/api/echo", content=b"0123456789", headers={"Content-Type": "application/octet-stream"})
+
+        compressed, truncated = await self.captured()
+
+        self.assertNotIn("response_body", compressed)
+        self.assertEqual(compressed["status"], 200)
+        self.assertTrue(truncated["body_truncated"])
+        self.assertIsNone(truncated["body"])
+        self.assertEqual(json.loads(decode_body(truncated, "response_")), {"received": 10})
+
+
+if __name__ == "__main__":
+    unittest.main()
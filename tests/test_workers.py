@@ -0,0 +1,26 @@
+"""Per-process state declared for multi-worker deployments."""
+import os
+import unittest
+
+import httpx
+
+import tests.support  # noqa: F401  (puts backend/ on sys.path)
+import server
+from workers import worker_info
+
+
+class WorkerInfoTest(unittest.IsolatedAsyncioTestCase):
+    async def test_health_reports_this_worker_and_its_caches(self):
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=server.app), base_url="http://test/api") as api:
+            worker = (await api.get("/health")).json()["worker"]
+
+        self.assertEqual(worker["pid"], os.getpid())
+        self.assertEqual(worker, worker_info())
+        self.assertLessEqual(
+            {"last_known_good", "read_coalescer", "legacy_todos", "write_behind"}, worker["caches"].keys()
+        )
+        self.assertTrue(all(worker["caches"].values()))
+
+
+if __name__ == "__main__":
+    unittest.main()
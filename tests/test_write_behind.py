@@ -0,0 +1,227 @@
+"""Write-behind buffering of reward deltas."""
+import asyncio
+import json
+import subprocess
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+from tests.support import MongoApiTestCase, mongo_available
+
+import server  # backend/ is on sys.path via tests.support
+from write_behind import WriteBehindBuffer
+
+
+class FakeStore:
+    """Counters per user, with an optional number of failing flushes"""
+
+    def __init__(self, failures: int = 0):
+        self.counters = {}
+        self.writes = 0
+        self.failures = failures
+
+    async def apply(self, user_id, deltas):
+        await asyncio.sleep(0.001)
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError("database down")
+        self.writes += 1
+        user = self.counters.setdefault(user_id, {})
+        for field, delta in deltas.items():
+            user[field] = user.get(field, 0) + delta
+
+
+class WriteBehindBufferTest(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.spill_path = Path(directory.name) / "spill.ndjson"
+
+    def buffer(self, store: FakeStore, **kwargs) -> WriteBehindBuffer:
+        return WriteBehindBuffer(store.apply, spill_path=str(self.spill_path), **kwargs)
+
+    async def test_many_events_become_one_write(self):
+        store = FakeStore()
+        buffer = self.buffer(store)
+        for _ in range(30):
+            buffer.add("default_user", {"coins": 25, "total_todos_completed": 1})
+
+        self.assertEqual(buffer.pending("default_user"), {"coins": 750, "total_todos_completed": 30})
+        await buffer.flush()
+
+        self.assertEqual(store.writes, 1)
+        self.assertEqual(store.counters["default_user"], {"coins": 750, "total_todos_completed": 30})
+        self.assertEqual(buffer.pending("default_user"), {})
+
+    async def test_size_threshold_flushes_without_waiting_for_the_interval(self):
+        store = FakeStore()
+        buffer = self.buffer(store, interval=60, max_pending=10)
+        for _ in range(10):
+            buffer.add("default_user", {"coins": 1})
+        await asyncio.sleep(0.01)
+
+        self.assertEqual(store.counters["default_user"], {"coins": 10})
+
+    async def test_failed_flush_keeps_deltas(self):
+        store = FakeStore(failures=1)
+        buffer = self.buffer(store)
+        buffer.add("default_user", {"coins": 5})
+
+        with self.assertRaises(ConnectionError):
+            await buffer.flush()
+        buffer.add("default_user", {"coins": 7})
+        await buffer.flush()
+
+        self.assertEqual(store.counters["default_user"], {"coins": 12})
+
+    async def test_reads_see_deltas_exactly_once_around_a_flush(self):
+        store = FakeStore()
+        buffer = self.buffer(store)
+        buffer.add("default_user", {"coins": 40})
+
+        async def load():
+            stored = dict(store.counters.get("default_user", {}))
+            await asyncio.sleep(0.002)
+            return stored
+
+        def merged(result):
+            stored, pending = result
+            return stored.get("coins", 0) + pending.get("coins", 0)
+
+        flush = asyncio.ensure_future(buffer.flush())
+        reads = await asyncio.gather(*(buffer.read("default_user", load) for _ in range(20)))
+        await flush
+
+        self.assertEqual([merged(result) for result in reads], [40] * 20)
+
+    async def test_shutdown_spills_and_replays_what_the_database_refused(self):
+        store = FakeStore(failures=100)
+        buffer = self.buffer(store)
+        buffer.add("default_user", {"coins": 30, "current_streak": 1})
+        await buffer.stop(attempts=2)
+        self.assertTrue(self.spill_path.exists())
+
+        store.failures = 0
+        await self.buffer(store).replay_spill()
+
+        self.assertEqual(store.counters["default_user"], {"coins": 30, "current_streak": 1})
+        self.assertFalse(self.spill_path.exists())
+
+    async def test_spill_is_replayed_by_one_worker_only(self):
+        store = FakeStore(failures=100)
+        buffer = self.buffer(store)
+        buffer.add("default_user", {"coins": 30})
+        await buffer.stop(attempts=1)
+
+        store.failures = 0
+        await asyncio.gather(*(self.buffer(store).replay_spill() for _ in range(4)))
+
+        self.assertEqual(store.counters["default_user"], {"coins": 30})
+        self.assertEqual(list(self.spill_path.parent.iterdir()), [])
+        await self.buffer(store).replay_spill()  # nothing left to replay
+
+    def write_spill(self, path: Path, *lines: str):
+        path.write_text("".join(line + "\n" for line in lines), encoding="utf-8")
+
+    async def test_cancelled_replay_spills_the_rest_again(self):
+        store = FakeStore()
+        started = asyncio.Event()
+
+        async def apply_slowly(user_id, deltas):
+            if user_id == "b":
+                started.set()
+                await asyncio.sleep(0.05)
+            await store.apply(user_id, deltas)
+
+        self.write_spill(self.spill_path, *(json.dumps({"user_id": user, "deltas": {"coins": 1}}) for user in "abc"))
+        replay = asyncio.ensure_future(WriteBehindBuffer(apply_slowly, spill_path=str(self.spill_path)).replay_spill())
+        await started.wait()
+        replay.cancel()
+        await asyncio.gather(replay, return_exceptions=True)
+
+        # The write in flight finished, so only "c" is left
+        self.assertEqual([json.loads(line)["user_id"] for line in self.spill_path.read_text().splitlines()], ["c"])
+        await self.buffer(store).replay_spill()
+        self.assertEqual(store.counters, {user: {"coins": 1} for user in "abc"})
+        self.assertEqual(list(self.spill_path.parent.iterdir()), [])
+
+    async def test_unreadable_spill_lines_are_skipped(self):
+        store = FakeStore()
+        self.write_spill(self.spill_path, '{"user_id": "a", "deltas": {"coins": 2}}', '{"user_id": "b", "del', '[]')
+
+        await self.buffer(store).replay_spill()
+
+        self.assertEqual(store.counters, {"a": {"coins": 2}})
+        self.assertFalse(self.spill_path.exists())
+
+    async def test_copies_left_by_dead_processes_are_replayed(self):
+        dead = subprocess.run([sys.executable, "-c", "import os; print(os.getpid())"], capture_output=True, text=True)
+        orphan = self.spill_path.with_name(f"{self.spill_path.name}.{dead.stdout.strip()}.replaying")
+        self.write_spill(orphan, '{"user_id": "a", "deltas": {"coins": 3}}')
+        self.write_spill(self.spill_path, '{"user_id": "a", "deltas": {"coins": 4}}')
+        store = FakeStore()
+
+        await self.buffer(store).replay_spill()
+
+        self.assertEqual(store.counters, {"a": {"coins": 7}})
+        self.assertEqual(list(self.spill_path.parent.iterdir()), [])
+
+    async def test_cancelled_flush_is_not_applied_twice(self):
+        store = FakeStore()
+        landed = asyncio.Event()
+
+        async def apply_then_hang(user_id, deltas):
+            await store.apply(user_id, deltas)
+            landed.set()
+            await asyncio.sleep(60)  # the reply never arrives
+
+        buffer = WriteBehindBuffer(apply_then_hang, spill_path=str(self.spill_path))
+        buffer.add("default_user", {"coins": 5})
+        flush = asyncio.ensure_future(buffer.flush())
+        await landed.wait()
+        flush.cancel()
+        await asyncio.gather(flush, return_exceptions=True)
+
+        self.assertEqual(buffer.pending("default_user"), {})
+        self.assertEqual(store.counters["default_user"], {"coins": 5})
+
+
+@unittest.skipUnless(mongo_available(), "MongoDB is not reachable")
+class WriteBehindApiTest(MongoApiTestCase):
+    DB_NAME = "todo_mining_write_behind_test"
+
+    async def asyncSetUp(self):
+        await super().asyncSetUp()
+        self.patch(server, "WRITE_BEHIND_ENABLED", True)
+        # Nothing buffered may outlive the test database
+        self.addAsyncCleanup(server.write_behind.flush)
+
+    async def test_completions_are_buffered_but_read_back(self):
+        todos = [(await self.api.post("/todos", json={"title": f"todo {i}", "priority": "medium"})).json() for i in range(12)]
+        for todo in todos:
+            await self.api.put(f"/todos/{todo['id']}", json={"completed": True})
+
+        stored = await server.db.game_stats.find_one({"user_id": "default_user"})
+        self.assertEqual(stored.get("coins", 0), 0)
+        stats = (await self.api.get("/game/stats")).json()
+        self.assertEqual((stats["coins"], stats["total_todos_completed"], stats["level"]), (300, 12, 2))
+
+        await server.write_behind.flush()
+        stored = await server.db.game_stats.find_one({"user_id": "default_user"})
+        self.assertEqual((stored["coins"], stored["total_todos_completed"], stored["level"]), (300, 12, 2))
+        self.assertEqual((await self.api.get("/game/stats")).json()["coins"], 300)
+
+    async def test_purchases_spend_buffered_coins(self):
+        for i in range(4):
+            todo = (await self.api.post("/todos", json={"title": f"todo {i}", "priority": "high"})).json()
+            await self.api.put(f"/todos/{todo['id']}", json={"completed": True})
+
+        response = await self.api.post("/game/upgrade/mining_power")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((await self.api.get("/game/stats")).json()["coins"], 100)
+
+
+if __name__ == "__main__":
+    unittest.main()